@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+# Benchmark of integer arrays against lists.
+# Computes the dot product of [0, 1, ..., n-1] with itself,
+# once with a while loop over lists and once with array functions.
+# Usage: python benchmarks/arrays.py [n]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+
+
+LIST_PROGRAM = """
+ls = [%s];
+i = 0;
+x = 0;
+while (i < %d) {
+  x = x + elem(ls, i) * elem(ls, i);
+  i = i + 1;
+}
+"""
+
+ARRAY_PROGRAM = """
+a = arange(0, %d);
+x = dot(a, a);
+"""
+
+def run(program):
+    """Return seconds taken to run the program, and the value of x."""
+    with open(os.devnull, "w") as out:
+        io = progio.ProgramIO(out=out)
+        start = time.time()
+        env = evaluator.Environment(io=io)
+        evaluator.Machine(parser.Parser(lexer.Lexer(program).lex()).run(), env).run()
+        io.flush()
+        return time.time() - start, env.get("x").to_str()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    list_time, list_x = run(LIST_PROGRAM % (",".join([str(i) for i in range(n)]), n))
+    array_time, array_x = run(ARRAY_PROGRAM % n)
+    assert list_x == array_x
+    print "list:  %.3fs" % list_time
+    print "array: %.3fs (%.1fx faster)" % (array_time, list_time / array_time)
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+
+# Benchmark of blocks against nested sequences of statements.
+# Runs a long straight-line program once as parsed, ie. one Block,
+# and once rebuilt as the right-nested Sequence chain the parser used to make.
+# (The parser itself recursed once per statement, so could not parse programs this long.)
+# Usage: python benchmarks/blocks.py [statements]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+
+
+def program(n):
+    return "x = 0;\n" + "x = x + 1;\n" * n
+
+def as_sequence(block):
+    """Return statements of block as nested sequences, built from the last one back."""
+    stmts = block.stmts
+    result = stmts[-1]
+    for stmt in reversed(stmts[:-1]):
+        result = evaluator.Sequence(stmt, result)
+    return result
+
+def run(ast):
+    """Return seconds and steps taken to run the program, and the final value of x."""
+    with open(os.devnull, "w") as out:
+        env = evaluator.Environment(io=progio.ProgramIO(out=out))
+        mach = evaluator.Machine(ast, env)
+        start = time.time()
+        mach.run()
+        return time.time() - start, mach.i, env.get("x").to_str()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    block = parser.Parser(lexer.Lexer(program(n)).lex()).run()
+    sequence_time, sequence_steps, sequence_x = run(as_sequence(block))
+    block_time, block_steps, block_x = run(block)
+    assert sequence_x == block_x
+    print "sequence: %.3fs, %d steps" % (sequence_time, sequence_steps)
+    print "block:    %.3fs, %d steps (%.1fx faster)" % (block_time, block_steps, sequence_time / block_time)
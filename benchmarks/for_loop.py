@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+# Benchmark of for loops against the equivalent while loops.
+# Sums a list once with an index, elem() and while, and once with for.
+# Usage: python benchmarks/for_loop.py [length]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+
+
+WHILE_PROGRAM = """
+l = %s;
+s = 0;
+i = 0;
+n = %d;
+while (i < n) {
+  s = s + elem(l, i);
+  i = i + 1;
+}
+"""
+
+FOR_PROGRAM = """
+l = %s;
+s = 0;
+for x in l {
+  s = s + x;
+}
+"""
+
+def run(program):
+    """Return seconds and steps taken to run the program, and the sum it found."""
+    with open(os.devnull, "w") as out:
+        env = evaluator.Environment(io=progio.ProgramIO(out=out))
+        mach = evaluator.Machine(parser.Parser(lexer.Lexer(program).lex()).run(), env)
+        start = time.time()
+        mach.run()
+        return time.time() - start, mach.i, env.get("s").to_str()
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    ls = "[" + ",".join([str(x) for x in range(length)]) + "]"
+    while_time, while_steps, while_sum = run(WHILE_PROGRAM % (ls, length))
+    for_time, for_steps, for_sum = run(FOR_PROGRAM % ls)
+    assert while_sum == for_sum
+    print "while: %.3fs, %d steps" % (while_time, while_steps)
+    print "for:   %.3fs, %d steps (%.1fx faster)" % (for_time, for_steps, while_time / for_time)
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+# Benchmark of hash-consing.
+# Builds two equal chains of pairs, compares them with == many times, and uses one as a map key,
+# once as normal and once with hash-consing on, and compares the time taken and the size of both chains.
+# Usage: python benchmarks/hashcons.py [length] [comparisons]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import memstats
+
+
+PROGRAM = """
+a = false;
+b = false;
+for i in range(0, %d) {
+  a = pair[i * 1000, a];
+  b = pair[i * 1000, b];
+}
+same = 0;
+d = {};
+for j in range(0, %d) {
+  if a == b then { same = same + 1; } else { same = same; }
+  d = put(d, a, j);
+}
+"""
+
+def run(program):
+    """Return seconds taken to run the program, the comparisons found equal, and bytes of a and b."""
+    with open(os.devnull, "w") as out:
+        env = evaluator.Environment(io=progio.ProgramIO(out=out))
+        mach = evaluator.Machine(parser.Parser(lexer.Lexer(program).lex()).run(), env)
+        start = time.time()
+        mach.run()
+        elapsed = time.time() - start
+        seen = set()
+        size = memstats.deep_size(env.get("a"), seen) + memstats.deep_size(env.get("b"), seen)
+        return elapsed, env.get("same").to_str(), size
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    comparisons = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    program = PROGRAM % (length, comparisons)
+    plain_time, plain_same, plain_size = run(program)
+    evaluator.hash_consing() #Cannot be stopped, so run second
+    consed_time, consed_same, consed_size = run(program)
+    assert plain_same == consed_same == str(comparisons)
+    print "plain:     %.3fs, chains %d bytes" % (plain_time, plain_size)
+    print "hashcons:  %.3fs, chains %d bytes (%.1fx faster, %.1fx smaller)" % (
+        consed_time, consed_size, plain_time / consed_time, float(plain_size) / consed_size)
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+
+# Benchmark of the cost of hooks.
+# Runs a loop with function calls and assignments:
+#   -on a machine with the hook tests removed from step(), as a reference
+#   -with no hooks, as programs are normally run
+#   -with hooks given but none subscribed
+#   -with an on_step hook counting steps
+# Each is run several times, and the fastest time is shown.
+# Usage: python benchmarks/hooks.py [iterations] [repeats]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import hooks
+
+
+PROGRAM = """
+inc = function(x){ return x + 1; };
+i = 0;
+while (i < %d) {
+  i = inc(i);
+}
+"""
+
+class PlainMachine(evaluator.Machine):
+    """Machine.step() without the on_step test."""
+    def step(self):
+        frame = self.frames[-1]
+        self.i += 1
+        if self.frame_done(frame):
+            self.return_from(frame)
+            return
+        if frame.pending is not None:
+            self.environment.pending = frame.pending
+            frame.pending = None
+        try:
+            if frame.is_statement:
+                frame.expression, self.environment = frame.expression.reduce(self.environment)
+            else:
+                frame.expression = frame.expression.reduce(self.environment)
+        except evaluator.CallRequest as call:
+            self.push_call(call)
+        except evaluator.ForceRequest as force:
+            self.push_force(force)
+
+def run(ast, hks, machine_class, repeats):
+    """Return fastest of 'repeats' times taken to run the program, and steps taken."""
+    best = None
+    with open(os.devnull, "w") as out:
+        for i in range(repeats):
+            env = evaluator.Environment(io=progio.ProgramIO(out=out), hooks=hks)
+            mach = machine_class(ast, env)
+            start = time.time()
+            mach.run()
+            taken = time.time() - start
+            if best is None or taken < best: best = taken
+    return best, mach.i
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    ast = parser.Parser(lexer.Lexer(PROGRAM % iterations).lex()).run()
+    counted = [0]
+    def count(machine, frame): counted[0] += 1
+    counting = hooks.Hooks()
+    counting.subscribe("on_step", count)
+    run(ast, None, evaluator.Machine, 1) #Warm up
+    plain_time, steps = run(ast, None, PlainMachine, repeats)
+    none_time, steps = run(ast, None, evaluator.Machine, repeats)
+    empty_time, steps = run(ast, hooks.Hooks(), evaluator.Machine, repeats)
+    count_time, steps = run(ast, counting, evaluator.Machine, repeats)
+    assert counted[0] == steps * repeats
+    print "%d steps" % steps
+    print "no hook tests: %.3fs" % plain_time
+    print "no hooks:      %.3fs (%+.1f%%)" % (none_time, 100 * (none_time / plain_time - 1))
+    print "empty hooks:   %.3fs (%+.1f%%)" % (empty_time, 100 * (empty_time / plain_time - 1))
+    print "on_step hook:  %.3fs (%+.1f%%)" % (count_time, 100 * (count_time / plain_time - 1))
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import tempfile
+
+# Benchmark of incremental runs.
+# Runs a program with an expensive first statement, then edits its last statement and runs it again,
+# once in full and once incrementally, skipping the statements whose result is cached.
+# Usage: python benchmarks/incremental.py [setup loop length]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import tasks
+import incremental
+
+
+PROGRAM = """
+s = 0;
+for i in range(0, %d) { s = s + i %% 7; }
+f = function(x) { return x + s; };
+print(f(%d));
+"""
+
+def run(program, cache=None):
+    """Return seconds taken to run the program, and its output."""
+    out = tempfile.TemporaryFile()
+    env = evaluator.Environment(io=progio.ProgramIO(out=out))
+    ast = parser.Parser(lexer.Lexer(program).lex()).run()
+    start = time.time()
+    if cache is None: tasks.run(evaluator.Machine(ast, env))
+    else: cache.run(ast, env)
+    seconds = time.time() - start
+    env.io.flush()
+    out.seek(0)
+    return seconds, out.read()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    path = tempfile.mktemp(".cache")
+    cache = incremental.Cache(path)
+    try:
+        run(PROGRAM % (n, 1), cache)
+        full_time, full_output = run(PROGRAM % (n, 2))
+        incremental_time, incremental_output = run(PROGRAM % (n, 2), cache)
+    finally:
+        if os.path.exists(path): os.remove(path)
+    assert full_output == incremental_output
+    print "full run:        %.3fs" % full_time
+    print "incremental run: %.3fs, %d statements skipped (%.0fx faster)" % (
+        incremental_time, cache.skipped, full_time / incremental_time)
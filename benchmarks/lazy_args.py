@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+# Benchmark of call-by-need argument evaluation.
+# Runs a program which passes an expensive argument that is never used,
+# once with strict evaluation and once with every function called by need.
+# Usage: python benchmarks/lazy_args.py [calls]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+
+
+PROGRAM = """
+slow = function(n){ i = 0; while (i < n) { i = i + 1; } return i; };
+pick = function(c, a, b){ if c then { return a; } else { return b; } };
+k = 0;
+while (k < %d) {
+  x = pick(true, k, slow(50));
+  k = k + 1;
+}
+print(x);
+"""
+
+def run(calls, lazy):
+    """Return seconds taken to run the program, and what it printed last."""
+    with open(os.devnull, "w") as out:
+        io = progio.ProgramIO(out=out)
+        start = time.time()
+        env = evaluator.Environment(io=io, lazy=lazy)
+        evaluator.Machine(parser.Parser(lexer.Lexer(PROGRAM % calls).lex()).run(), env).run()
+        io.flush()
+        return time.time() - start, env.get("x").to_str()
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    strict_time, strict_x = run(calls, False)
+    lazy_time, lazy_x = run(calls, True)
+    assert strict_x == lazy_x
+    print "strict:       %.3fs" % strict_time
+    print "call-by-need: %.3fs (%.1fx faster)" % (lazy_time, strict_time / lazy_time)
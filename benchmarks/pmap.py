@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+
+# Benchmark of pmap() against mapping in one process.
+# Maps a slow recursive function over a list, once with every element mapped in this process
+# and once with pmap() on a pool of worker processes.
+# Usage: python benchmarks/pmap.py [workers]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import parallel
+
+
+PROGRAM = """
+fib = function(n){ if n < 2 then { return n; } else { return fib(n-1) + fib(n-2); } };
+x = pmap(fib, [12,12,12,12,12,12,12,12,12,12,12,12,12,12,12,12]);
+"""
+
+def run():
+    """Return seconds taken to run the program, and the value of x."""
+    with open(os.devnull, "w") as out:
+        io = progio.ProgramIO(out=out)
+        start = time.time()
+        env = evaluator.Environment(io=io)
+        evaluator.Machine(parser.Parser(lexer.Lexer(PROGRAM).lex()).run(), env).run()
+        io.flush()
+        return time.time() - start, env.get("x").to_str()
+
+if __name__ == "__main__":
+    parallel.configure(int(sys.argv[1]) if len(sys.argv) > 1 else None)
+    parallel.in_worker = True #Map everything in this process
+    serial_time, serial_x = run()
+    parallel.in_worker = False
+    run() #Start the pool, so its start up is not timed
+    parallel_time, parallel_x = run()
+    assert serial_x == parallel_x
+    print "serial:   %.3fs" % serial_time
+    print "parallel: %.3fs (%.1fx faster, %d workers)" % (parallel_time, serial_time / parallel_time,
+                                                          parallel.WORKERS or parallel.multiprocessing.cpu_count())
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import __builtin__
+
+# Benchmark of prefetching imported files.
+# Writes a program importing many library files, each running a short loop,
+# then runs it with and without prefetching. Storage is made slow by waiting
+# LATENCY seconds in each open() of a library file, as reading over a network would.
+# Usage: python benchmarks/prefetch.py [files]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import prefetch
+import progio
+
+
+LATENCY = 0.02
+
+LIBRARY = """
+%s = 0;
+for i in range(0, 50) { %s = %s + i; }
+"""
+
+def name(i):
+    """Return name of variable of library i. Names cannot hold digits."""
+    return "s" + chr(ord("a") + i // 26) + chr(ord("a") + i % 26)
+
+def slow_open(directory):
+    """Return open(), waiting LATENCY seconds for files in directory."""
+    real_open = __builtin__.open
+    def open(name, *args):
+        if os.path.abspath(name).startswith(directory): time.sleep(LATENCY)
+        return real_open(name, *args)
+    return open
+
+def run(directory):
+    """Return seconds taken to run main program, with prefetches forgotten."""
+    prefetch.files.clear()
+    with open(os.devnull, "w") as out:
+        start = time.time()
+        interpreter.file_interp(os.path.join(directory, "main"), io=progio.ProgramIO(out=out))
+        return time.time() - start
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(n):
+            with open(os.path.join(directory, "lib%d" % i), "w") as f:
+                f.write(LIBRARY % (name(i), name(i), name(i)))
+        with open(os.path.join(directory, "main"), "w") as f:
+            f.write("".join(['import "lib%d";\n' % i for i in range(n)]) + "print(%s);\n" % name(n - 1))
+        os.chdir(directory) #Imports are found in the working directory
+        __builtin__.open = slow_open(directory)
+        prefetched_time = run(directory)
+        start = prefetch.start
+        prefetch.start = lambda ast: None
+        sequential_time = run(directory)
+        prefetch.start = start
+    finally:
+        shutil.rmtree(directory)
+    print "without prefetch: %.3fs" % sequential_time
+    print "with prefetch:    %.3fs (%.1fx faster)" % (prefetched_time, sequential_time / prefetched_time)
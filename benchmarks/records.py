@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+# Benchmark of records against nested pairs.
+# Reads the last of three fields many times, once from pairs with car(cdr(cdr(p))),
+# and once from a record with p.z, and compares the size of both values, not counting the record type.
+# Usage: python benchmarks/records.py [reads]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import memstats
+
+
+PAIR_PROGRAM = """
+p = pair[1, pair[2, pair[3, false]]];
+s = 0;
+for i in range(0, %d) {
+  s = s + car(cdr(cdr(p)));
+}
+"""
+
+RECORD_PROGRAM = """
+record Triple(x, y, z);
+p = Triple(1, 2, 3);
+s = 0;
+for i in range(0, %d) {
+  s = s + p.z;
+}
+"""
+
+def run(program):
+    """Return seconds and steps taken to run the program, the sum it found, and bytes of p."""
+    with open(os.devnull, "w") as out:
+        env = evaluator.Environment(io=progio.ProgramIO(out=out))
+        mach = evaluator.Machine(parser.Parser(lexer.Lexer(program).lex()).run(), env)
+        start = time.time()
+        mach.run()
+        elapsed = time.time() - start
+        p = env.get("p")
+        seen = set()
+        #Record type is shared by all records of it, so is not counted
+        if isinstance(p, evaluator.Record): memstats.deep_size(p.type, seen)
+        return elapsed, mach.i, env.get("s").to_str(), memstats.deep_size(p, seen)
+
+if __name__ == "__main__":
+    reads = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    pair_time, pair_steps, pair_sum, pair_size = run(PAIR_PROGRAM % reads)
+    record_time, record_steps, record_sum, record_size = run(RECORD_PROGRAM % reads)
+    assert pair_sum == record_sum
+    print "pairs:  %.3fs, %d steps, value %d bytes" % (pair_time, pair_steps, pair_size)
+    print "record: %.3fs, %d steps, value %d bytes (%.1fx faster)" % (
+        record_time, record_steps, record_size, pair_time / record_time)
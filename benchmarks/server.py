@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import time
+import socket
+import threading
+
+# Benchmark of the evaluation server.
+# Sends a long run, then short runs while it goes on, and times how long each short run
+# takes to finish, against how long the long run takes alone, ie. how long a short run
+# would have waited behind it if runs were taken one at a time.
+# Usage: python benchmarks/server.py [short runs]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import server
+
+
+LONG_PROGRAM = "s = 0; for i in range(0, 30000) { s = s + i; } print(s);"
+SHORT_PROGRAM = "print(6 * 7);"
+
+class Client(object):
+    def __init__(self, port):
+        self.socket = socket.create_connection(("localhost", port))
+        self.lines = self.socket.makefile("r")
+    def run(self, run_id, program):
+        self.socket.sendall(json.dumps({"id": run_id, "op": "run", "program": program}) + "\n")
+    def finished(self):
+        """Return id of next run to finish, with its last event."""
+        while True:
+            event = json.loads(self.lines.readline())
+            if event["event"] in ("done", "error"): return event["id"], event
+
+def timed(client, programs):
+    """Start runs of programs, return seconds each took to finish, by id."""
+    start = time.time()
+    for run_id, program in programs:
+        client.run(run_id, program)
+    times = {}
+    while len(times) < len(programs):
+        run_id, event = client.finished()
+        assert event["event"] == "done", event
+        times[run_id] = time.time() - start
+    return times
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    srv = server.Server(port=0)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.daemon = True
+    thread.start()
+    client = Client(srv.socket.getsockname()[1])
+    alone = timed(client, [("long", LONG_PROGRAM)])["long"]
+    times = timed(client, [("long", LONG_PROGRAM)] + [(i, SHORT_PROGRAM) for i in range(count)])
+    short = sorted(times[i] for i in range(count))
+    #Stop the server before exiting, so it is not still running while python shuts down
+    srv.stop()
+    thread.join()
+    client.socket.close()
+    print "long run alone:      %.3fs" % alone
+    print "long run, shared:    %.3fs" % times["long"]
+    print "short runs, median:  %.3fs, slowest: %.3fs (%.0fx sooner than waiting)" % (
+        short[count // 2], short[-1], alone / short[-1])
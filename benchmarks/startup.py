@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+# Benchmark of cold start.
+# Runs a one-line program in a new interpreter process many times, and compares the time taken
+# with starting python alone, then prints the --startup-report of one run.
+# Run it twice, so python's compiled .pyc files exist for the second.
+# Usage: python benchmarks/startup.py [runs]
+
+INTERPRETER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "interpreter.py")
+
+
+def per_run(command, runs):
+    """Return average seconds taken to run command."""
+    with open(os.devnull, "w") as out:
+        start = time.time()
+        for i in range(runs):
+            subprocess.call(command, stdout=out)
+        return (time.time() - start) / runs
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with tempfile.NamedTemporaryFile(suffix=".txt") as program:
+        program.write('print("hello");\n')
+        program.flush()
+        python_time = per_run([sys.executable, "-c", "pass"], runs)
+        interpreter_time = per_run([sys.executable, INTERPRETER, program.name], runs)
+        print "python alone:      %.1fms" % (python_time * 1000)
+        print "interpreter:       %.1fms (%.1fms more)" % (interpreter_time * 1000, (interpreter_time - python_time) * 1000)
+        sys.stdout.flush()
+        with open(os.devnull, "w") as out:
+            subprocess.call([sys.executable, INTERPRETER, program.name, "--startup-report"], stdout=out)
@@ -0,0 +1,51 @@
+import os
+import sys
+import time
+
+# Benchmark of tasks and channels.
+# Doubles and sums numbers once in a single loop, and once in a pipeline of three tasks
+# joined by channels holding 16 values, so at most 32 values are in flight however many are sent.
+# Usage: python benchmarks/tasks.py [count]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import lexer
+import parser
+import evaluator
+import progio
+import tasks
+
+
+LOOP_PROGRAM = """
+s = 0;
+for i in range(0, %d) {
+  s = s + i * 2;
+}
+"""
+
+PIPELINE_PROGRAM = """
+n = %d;
+numbers = chan(16);
+doubled = chan(16);
+done = chan(1);
+spawn(function() { for i in range(0, n) { send(numbers, i); } });
+spawn(function() { while true { send(doubled, recv(numbers) * 2); } });
+spawn(function() { t = 0; for j in range(0, n) { t = t + recv(doubled); } send(done, t); });
+s = recv(done);
+"""
+
+def run(program):
+    """Return seconds taken to run the program, and the sum it found."""
+    with open(os.devnull, "w") as out:
+        env = evaluator.Environment(io=progio.ProgramIO(out=out))
+        mach = evaluator.Machine(parser.Parser(lexer.Lexer(program).lex()).run(), env)
+        start = time.time()
+        tasks.run(mach)
+        return time.time() - start, env.get("s").to_str()
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    loop_time, loop_sum = run(LOOP_PROGRAM % count)
+    pipeline_time, pipeline_sum = run(PIPELINE_PROGRAM % count)
+    assert loop_sum == pipeline_sum
+    print "loop:     %.3fs" % loop_time
+    print "pipeline: %.3fs (%.1fx as long)" % (pipeline_time, pipeline_time / loop_time)
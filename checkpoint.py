@@ -0,0 +1,80 @@
+import os
+import sys
+import signal
+import hashlib
+import cPickle
+
+# Checkpoints of running programs, so a long program can be stopped and resumed where it was.
+# A checkpoint holds the program's tasks.Scheduler, and through it every machine:
+# their frames, ie. the rest of each expression being run, the scopes of the environment,
+# closures, values, channels and step counts. Machines are only saved between turns of the scheduler,
+# when none is part way through a step, so a resumed program runs exactly as it would have.
+#
+# Checkpoints are saved every 'interval' steps, and soon after SIGNAL is received.
+# The file is written beside the old one and renamed over it, so a checkpoint is never half written.
+# It is removed when the program finishes.
+#
+# The program's input and output, and its hooks, are not saved. The resumed program uses those
+# given to it instead. Output printed after the checkpoint was saved is printed again when resumed.
+# Open files are reopened where they were, see fileio.File. Values which cannot be saved,
+# or are nested too deeply, leave the program to run on without that checkpoint.
+
+
+SIGNAL = getattr(signal, "SIGUSR1", None) #Signal asking for a checkpoint to be saved
+PROTOCOL = 2 #Pickle protocol, the first to handle classes with __slots__
+
+
+def digest(program):
+    """Return digest of program's text, saved in checkpoints so they are only resumed by the same program."""
+    return hashlib.sha1(program).hexdigest()
+
+class Checkpoints(object):
+    """Saves checkpoints of a program to file 'path', every 'interval' steps if given, and when sent SIGNAL."""
+    def __init__(self, path, interval=None):
+        self.path = path
+        self.digest = None #Digest of program's text, set by interpret(), see digest()
+        self.interval = interval
+        self.next_step = interval #Steps taken when next checkpoint is due
+        self.requested = False
+        if SIGNAL is not None: signal.signal(SIGNAL, self.request)
+    def request(self, signum, frame):
+        """Save a checkpoint at the next turn of the scheduler."""
+        self.requested = True
+    def due(self, steps):
+        return self.requested or (self.next_step is not None and steps >= self.next_step)
+    def save(self, scheduler):
+        """Save checkpoint of scheduler, and everything it runs."""
+        self.requested = False
+        if self.interval is not None: self.next_step = scheduler.steps + self.interval
+        environment = scheduler.main.environment
+        environment.io.flush() #So output before the checkpoint is never lost
+        persistent = {id(environment.io): "io", id(self): "checkpoints"}
+        if environment.hooks is not None: persistent[id(environment.hooks)] = "hooks"
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                pickler = cPickle.Pickler(f, PROTOCOL)
+                pickler.persistent_id = lambda obj: persistent.get(id(obj))
+                pickler.dump((self.digest, scheduler))
+        except (cPickle.PicklingError, TypeError, RuntimeError) as e:
+            #Eg. an open file, or values nested too deeply
+            sys.stderr.write("checkpoint not saved: " + str(e) + "\n")
+            os.remove(temp_path)
+            return
+        os.rename(temp_path, self.path)
+    def exists(self):
+        return os.path.exists(self.path)
+    def load(self, io, hooks=None):
+        """Return scheduler saved in checkpoint, using io and hooks for the program's input, output and hooks.
+        Raise ValueError if it was saved from a different program."""
+        with open(self.path, "rb") as f:
+            unpickler = cPickle.Unpickler(f)
+            unpickler.persistent_load = {"io": io, "hooks": hooks, "checkpoints": self}.get
+            saved_digest, scheduler = unpickler.load()
+        if saved_digest != self.digest:
+            raise ValueError(self.path + " is a checkpoint of a different program")
+        if self.interval is not None: self.next_step = scheduler.steps + self.interval
+        return scheduler
+    def finish(self):
+        """Remove checkpoint of finished program."""
+        if self.exists(): os.remove(self.path)
@@ -1,5 +1,7 @@
 import operator
 import copy
+import collections
+import progio
 
 # Small step semantics interpreter.
 # Every possible term or combination of terms has a reduce() method.
@@ -9,12 +11,35 @@ import copy
 
 
 # Data types #####################################
+# Every value and node class declares __slots__, so no per-object __dict__ is allocated.
+# Values that can never change once created share one object between copies,
+# and the most common ones (small ints, booleans, null) are interned singletons.
 
 
-class Null(object):
-    """Null data type, ie. None in python. Non reducible."""
-    def __init__(self):
-        pass
+SMALL_INT_MIN = -5 #Range of interned integers, as in CPython
+SMALL_INT_MAX = 256
+
+
+class Immutable(object):
+    """Base class of values which never change once created.
+    Copying returns the same object, so deep copies of closures and loop bodies share them."""
+    __slots__ = ()
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+
+class Null(Immutable):
+    """Null data type, ie. None in python. Non reducible.
+    Only one Null object exists."""
+    __slots__ = ()
+    _instance = None
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+    def __reduce__(self):
+        return (Null, ())
     def to_str(self):
         return "Null"
     def reducible(self):
@@ -22,10 +47,27 @@ class Null(object):
     def reduce(self):
         return self
 
-class Number(object):
-    """Number class. Non reducible."""
-    def __init__(self, val=0):
-        self.val = int(val)
+class Number(Immutable):
+    """Number class. Non reducible.
+    Integers between SMALL_INT_MIN and SMALL_INT_MAX are interned, and others too while hash-consing."""
+    __slots__ = ('val', '__weakref__')
+    _small_ints = {}
+    def __new__(cls, val=0):
+        val = int(val)
+        num = cls._small_ints.get(val)
+        if num is None:
+            if consed is not None:
+                num = consed.get((Number, val))
+                if num is not None: return num
+            num = object.__new__(cls)
+            num.val = val
+            if SMALL_INT_MIN <= val <= SMALL_INT_MAX:
+                cls._small_ints[val] = num
+            elif consed is not None:
+                consed[(Number, val)] = num
+        return num
+    def __reduce__(self):
+        return (Number, (self.val,))
     def to_str(self):
         return str(self.val)
     def reducible(self):
@@ -33,10 +75,21 @@ class Number(object):
     def reduce(self, environment):
         return self
 
-class Boolean(object):
-    """Boolean class. Non reducible."""
-    def __init__(self, val=False):
-        self.val = val
+class Boolean(Immutable):
+    """Boolean class. Non reducible.
+    Only two Boolean objects exist, one for True and one for False."""
+    __slots__ = ('val',)
+    _instances = {}
+    def __new__(cls, val=False):
+        val = bool(val)
+        boolean = cls._instances.get(val)
+        if boolean is None:
+            boolean = object.__new__(cls)
+            boolean.val = val
+            cls._instances[val] = boolean
+        return boolean
+    def __reduce__(self):
+        return (Boolean, (self.val,))
     def to_str(self):
         return str(self.val)
     def reducible(self):
@@ -45,17 +98,31 @@ class Boolean(object):
         return self
 
 class Pair(object):
-    """Pair class of two values."""
-    def __init__(self, car, cdr):
-        self.car = car
-        self.cdr = cdr
+    """Pair class of two values.
+    'hash' is its structural hash if it is hash-consed, else None."""
+    __slots__ = ('car', 'cdr', 'hash', '__weakref__')
+    def __new__(cls, car=None, cdr=None):
+        if consed is not None and car is not None:
+            pair = cons(Pair, (car, cdr))
+            if pair is not None: return pair
+        pair = object.__new__(cls)
+        pair.car = car
+        pair.cdr = cdr
+        pair.hash = None
+        return pair
+    def __reduce__(self):
+        return (Pair, (self.car, self.cdr))
+    def __deepcopy__(self, memo):
+        if self.hash is not None: return self #Consed, so never changes
+        return Pair(copy.deepcopy(self.car, memo), copy.deepcopy(self.cdr, memo))
     def to_str(self):
         return "(" + self.car.to_str() + ", " + self.cdr.to_str() + ")"
     def reducible(self):
-        """Reducible if car or cdr are reducible."""
+        """Reducible if car or cdr are reducible. Consed pairs only hold values, so never are."""
+        if self.hash is not None: return False
         if self.car.reducible() or self.cdr.reducible(): return True
         else: return False
-    def reduce(self, envionment):
+    def reduce(self, environment):
         """Reduce car and cdr."""
         if self.car.reducible():
             return Pair(self.car.reduce(environment), self.cdr)
@@ -65,24 +132,49 @@ class Pair(object):
             return self
 
 class List(object):
-    """List of values. Non reducible if all elements are non reducible."""
-    def __init__(self, ls):
-        self.ls = ls
+    """List of values. Non reducible if all elements are non reducible.
+    'hash' is its structural hash if it is hash-consed, else None."""
+    __slots__ = ('ls', 'hash', '__weakref__')
+    def __new__(cls, ls=None):
+        if consed is not None and ls is not None:
+            lst = cons(List, tuple(ls))
+            if lst is not None: return lst
+        lst = object.__new__(cls)
+        lst.ls = ls
+        lst.hash = None
+        return lst
+    def __reduce__(self):
+        return (List, (self.ls,))
+    def __deepcopy__(self, memo):
+        if self.hash is not None: return self
+        return List([copy.deepcopy(x, memo) for x in self.ls])
     def to_str(self):
         return "[" + ",".join([x.to_str() for x in self.ls]) + "]"
     def reducible(self):
+        if self.hash is not None: return False
         return any([x.reducible() for x in self.ls])
     def reduce(self, environment):
-        """Reduce all elements if any are reducible. Else, return self."""
-        if any([x.reducible() for x in self.ls]):
-            return List([x.reduce(environment) for x in self.ls])
-        else:
-            return self
+        """Reduce first reducible element, if any. Else, return self."""
+        for i in range(len(self.ls)):
+            if self.ls[i].reducible():
+                ls = list(self.ls)
+                ls[i] = ls[i].reduce(environment)
+                return List(ls)
+        return self
 
-class String(object):
+class String(Immutable):
     """String data type, non-reducible."""
-    def __init__(self, val):
-        self.val = val #String value
+    __slots__ = ('val', '__weakref__')
+    def __new__(cls, val=""):
+        if consed is not None:
+            string = consed.get((String, val))
+            if string is not None: return string
+        string = object.__new__(cls)
+        string.val = val #String value
+        if consed is not None: consed[(String, val)] = string
+        return string
+    def __reduce__(self):
+        return (String, (self.val,))
     def to_str(self):
         return "\"" + self.val + "\""
     def reducible(self):
@@ -90,56 +182,131 @@ class String(object):
     def reduce(self, environment):
         return self
 
+# Hash-consing ###################################
+# While hash-consing is on (see hash_consing()), a number, string, pair or list is only made once:
+# making one equal to a value still alive gives that value, found in the table 'consed'.
+# So equal values are the same object, and == of two large equal structures is a pointer check.
+# Repeated parts of structures share memory, and each consed pair and list keeps its structural hash,
+# so it is a cheap map key. A pair or list holding anything else, eg. a function or an expression
+# not yet reduced, is not consed, and is compared part by part, as all are while hash-consing is off.
+# The table holds values weakly, so it never keeps alive a value the program no longer uses.
+
+
+consed = None #weakref.WeakValueDictionary of key of each value consed to the value, while hash-consing is on
+
+def hash_consing():
+    """Start hash-consing values made from now on. It cannot be stopped, as consed values are compared
+    by identity, so must stay the only ones of their value."""
+    global consed
+    if consed is None:
+        import weakref
+        consed = weakref.WeakValueDictionary()
+
+def canonical(val):
+    """Return True if val is the only value equal to it, so can be compared by identity."""
+    if isinstance(val, (Pair, List)): return val.hash is not None
+    if isinstance(val, (Boolean, Null)): return True
+    if isinstance(val, (Number, String)):
+        return (type(val) is Number and SMALL_INT_MIN <= val.val <= SMALL_INT_MAX
+                or consed is not None and consed.get((type(val), val.val)) is val)
+    return False
+
+def cons(cls, parts):
+    """Return pair or list of class cls of values 'parts' (car and cdr of a pair), the one in the table if made before.
+    Return None if not every part is canonical, so it cannot be consed."""
+    for part in parts:
+        if not canonical(part): return None
+    #Parts are compared by identity, so the key is cheap to hash and compare however large the value
+    key = (cls,) + parts
+    value = consed.get(key)
+    if value is None:
+        value = object.__new__(cls)
+        if cls is Pair: value.car, value.cdr = parts
+        else: value.ls = list(parts)
+        value.hash = hash((cls.__name__,) + tuple([structure_hash(x) for x in parts]))
+        consed[key] = value
+    return value
+
+def structure_hash(val):
+    """Return hash of value depending only on what it holds, so equal values have equal hashes,
+    in every run. Raise TypeError if it holds a value which cannot be a map key, eg. a function."""
+    if isinstance(val, Pair):
+        if val.hash is not None: return val.hash
+        return hash(("Pair", structure_hash(val.car), structure_hash(val.cdr)))
+    if isinstance(val, List):
+        if val.hash is not None: return val.hash
+        return hash(("List",) + tuple([structure_hash(x) for x in val.ls]))
+    return hash(map_key(val))
+
+def equal(first, second):
+    """Return True if values are equal: the same kind of value, holding equal parts.
+    Parts are compared by identity, unless they are numbers, strings, booleans, pairs, lists or records.
+    Records are equal if their types have the same name and fields, and their fields are equal.
+    Two consed values are only equal if they are the same object."""
+    todo = [(first, second)] #Parts still to compare, rather than recursing, as pairs can be nested deeply
+    while todo:
+        a, b = todo.pop()
+        if a is b: continue
+        kind = type(a)
+        if kind is not type(b): return False
+        if kind is Pair:
+            if a.hash is not None and b.hash is not None: return False
+            todo.append((a.cdr, b.cdr))
+            todo.append((a.car, b.car))
+        elif kind is List:
+            if a.hash is not None and b.hash is not None or len(a.ls) != len(b.ls): return False
+            todo.extend(reversed(zip(a.ls, b.ls)))
+        elif kind is Record:
+            if a.type.name != b.type.name or a.type.fields != b.type.fields: return False
+            todo.extend(reversed(zip(a.vals, b.vals)))
+        elif kind not in (Number, String, Boolean) or a.val != b.val:
+            return False
+    return True
+
 class Function(object):
     """Function data type.
     Must get closure during reduce(), non-reducible after completed.
-    Contains parameters and body."""
-    def __init__(self, params, body):
+    Contains parameters and body.
+    Calls with all arguments run the body directly, calls with fewer give a Partial.
+    If lazy, arguments are passed unevaluated, and evaluated when first used (call-by-need)."""
+    __slots__ = ('params', 'body', 'closure', 'closure_defined', 'lazy')
+    def __init__(self, params, body, lazy=False):
         self.params = params #Names of all params, as strings
         self.body = body
         self.closure = {} #Current environment, remembered for closure
         self.closure_defined = False #If closure is defined or not
-
-        # Automatically curry the function.
-        # eg. f = function(x,y){return x+y;};
-        # This becomes f = function(x){ return function(y){return x+y;}; };
-        # Rule: func(p1, p2, ..., pn){body}
-        # -> func(p1){ return func(p2) { ... { return func(pn){ body } } ... } }
-        # Notice that if only one parameter exists, currying is pointless.
-
-        # Reduces as follows:
-        # 1. Gather all params.
-        # 2. Create a function for each param, taking param as only parameter.
-        # 3. Put body into last param's function.
-        # 4. Starting at last param's function, put each func into prev param's func body.
-        # 5. Reduce to function remaining.
-        if len(self.params)>1: #Pointless if only one param
-            temp_funcs = []
-            for p in self.params:
-                temp_funcs.append(Function(p, DoNothing()))
-            #Reverse list, since last param's func contains body
-            temp_funcs.reverse()
-            temp_funcs[0].body = self.body
-            #Put functions as return value of each other.
-            for i in range(1, len(temp_funcs)): #Don't access first function, since already set
-                temp_funcs[i].body = Return(temp_funcs[i-1])
-            #Change params and body to outermost function
-            self.params = temp_funcs[len(temp_funcs)-1].params
-            self.body = temp_funcs[len(temp_funcs)-1].body
-            #Currying finished
-    def to_str(self):
-        return "function(" + ",".join(self.params) + ") {" + self.body.to_str() + "}"
+        self.lazy = lazy
+    def to_str(self):
+        prefix = "lazy " if self.lazy else ""
+        return prefix + "function(" + ",".join(self.params) + ") {" + self.body.to_str() + "}"
     def reducible(self):
         """If closure not set, must define closure during reduce(), so reducible.
         Else, is considered as a data type, so not reducible."""
         return not self.closure_defined
     def reduce(self, environment):
-        self.closure = copy.deepcopy(environment.get_top_scope())
-        self.closure_defined = True
+        """Reduce to a copy holding the closure, leaving this definition unchanged for reuse."""
+        func = copy.copy(self)
+        func.closure = copy.deepcopy(environment.get_top_scope())
+        func.closure_defined = True
+        return func
+
+class Partial(Immutable):
+    """Function applied to fewer arguments than it has parameters. Non reducible.
+    Calling it with the rest of the arguments calls the function with all of them."""
+    __slots__ = ('func', 'args')
+    def __init__(self, func, args):
+        self.func = func #Function value, with closure
+        self.args = args #Arguments given so far, for the first parameters
+    def to_str(self):
+        return self.func.to_str() + "(" + ",".join([x.to_str() for x in self.args]) + ")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
         return self
 
 class Variable(object):
     """Variable. Reduces to variable's value."""
+    __slots__ = ('name',)
     def __init__(self, name):
         self.name = name
     def to_str(self):
@@ -147,13 +314,395 @@ class Variable(object):
     def reducible(self):
         return True
     def reduce(self, environment):
-        """Look up value, reduce to that."""
+        """Look up value, reduce to that.
+        If value is an unevaluated argument of a call-by-need function, evaluate it first.
+        The machine evaluates it (see ForceRequest), then steps this variable again."""
         if environment.contains(self.name):
-            return environment.get(self.name)
+            val = environment.get(self.name)
+            if isinstance(val, Thunk):
+                if isinstance(val, ExprThunk) and not val.forced: raise ForceRequest(val, self)
+                return val.force(environment)
+            return val
         else:
             return None
 
 
+# Streams ########################################
+# A stream is a head value and a suspended tail, computed the first time it is needed.
+# The tail is a Thunk, which remembers its value once forced, so it is only computed once.
+# A stream ends when its tail gives something other than a stream, eg. false.
+
+
+class Thunk(Immutable):
+    """Suspended computation of a value.
+    compute() is run on the first force(), later calls return the same value.
+    Subclasses give compute() and release(), which drops anything only needed to compute."""
+    __slots__ = ('value', 'forced')
+    def __init__(self):
+        self.value = None
+        self.forced = False
+    def force(self, environment):
+        """Return value of computation, computing it if not done yet.
+        'environment' gives input and output used while computing."""
+        if not self.forced: self.give(self.compute(environment))
+        return self.value
+    def give(self, value):
+        """Remember value computed, so it is never computed again."""
+        self.value = value
+        self.forced = True
+        self.release()
+    def to_str(self):
+        """Show value if computed, without computing it."""
+        return self.value.to_str() if self.forced else "..."
+    def reducible(self):
+        return False
+
+class ExprThunk(Thunk):
+    """Suspended expression, evaluated in the scope it was created in.
+    Variables holding one are forced by the machine reading them, on its own stack,
+    so chains of thunks, eg. accumulators of call-by-need functions, can be any length.
+    compute() is only used by streams."""
+    __slots__ = ('expr', 'scope')
+    def __init__(self, expr, scope):
+        Thunk.__init__(self)
+        self.expr = expr
+        self.scope = scope #Flat dict of names visible where expression was written
+    def compute(self, environment):
+        return evaluate(self.expr, Environment(dict(self.scope), environment.io, environment.lazy, environment.hooks))
+    def release(self):
+        self.expr = None
+        self.scope = None
+
+class MapThunk(Thunk):
+    """Tail of stream_map(f, s): the rest of s, with f applied to each element."""
+    __slots__ = ('func', 'stream')
+    def __init__(self, func, stream):
+        Thunk.__init__(self)
+        self.func = func
+        self.stream = stream #Stream whose tail is mapped
+    def compute(self, environment):
+        rest = self.stream.rest(environment)
+        if not isinstance(rest, Stream): return rest
+        return Stream(call_function(self.func, [rest.head], environment), MapThunk(self.func, rest))
+    def release(self):
+        self.func = None
+        self.stream = None
+
+class FilterThunk(Thunk):
+    """Tail of stream_filter(f, s): the rest of s, keeping only elements where f gives true."""
+    __slots__ = ('func', 'stream')
+    def __init__(self, func, stream):
+        Thunk.__init__(self)
+        self.func = func
+        self.stream = stream #Stream whose tail is filtered
+    def compute(self, environment):
+        return filter_stream(self.func, self.stream.rest(environment), environment)
+    def release(self):
+        self.func = None
+        self.stream = None
+
+def filter_stream(func, stream, environment):
+    """Return stream of elements of 'stream' for which func gives true, starting at its head.
+    Skips elements in a loop rather than by recursion, so long gaps use no stack."""
+    while isinstance(stream, Stream):
+        if call_function(func, [stream.head], environment).val:
+            return Stream(stream.head, FilterThunk(func, stream))
+        stream = stream.rest(environment)
+    return stream
+
+class Stream(Immutable):
+    """Stream value, ie. a head value and a Thunk giving the rest of the stream.
+    Non reducible. Printing does not force the tail."""
+    __slots__ = ('head', 'tail')
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+    def to_str(self):
+        return "stream[" + self.head.to_str() + ", ...]"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def rest(self, environment):
+        """Force and return the tail."""
+        return self.tail.force(environment)
+
+class StreamExpr(object):
+    """Stream definition, eg. stream[1, f(2)].
+    Head is reduced as normal, tail is suspended along with the current scope."""
+    __slots__ = ('head', 'tail')
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+    def to_str(self):
+        return "stream[" + self.head.to_str() + ", " + self.tail.to_str() + "]"
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        if self.head.reducible():
+            return StreamExpr(self.head.reduce(environment), self.tail)
+        else:
+            return Stream(self.head, ExprThunk(self.tail, environment.get_dict()))
+
+
+# Maps ###########################################
+# A map is a persistent hash array mapped trie (see hamt.py) of keys to values.
+# put() and remove() give a new map sharing most of its trie with the old one,
+# so maps are never changed, like lists with setelem(), but updates take O(log n).
+# Keys can be numbers, strings, booleans or null, or pairs and lists of them.
+
+
+def map_key(val):
+    """Return python key of value used as a map key, so equal values give equal keys.
+    Key hashes only depend on the value, so maps keep their order between runs and when pickled."""
+    if isinstance(val, (Pair, List)): return StructureKey(val)
+    if not isinstance(val, (Number, String, Boolean, Null)):
+        raise TypeError(val.to_str() + " cannot be a map key")
+    return (type(val).__name__, getattr(val, "val", None))
+
+class StructureKey(object):
+    """Python key of pair or list used as a map key, equal to keys of equal values (see equal()).
+    Its hash is worked out once, and is the one cached in the value if it is consed."""
+    __slots__ = ('val', 'hash')
+    def __init__(self, val):
+        try:
+            self.hash = structure_hash(val)
+        except TypeError:
+            raise TypeError(val.to_str() + " cannot be a map key")
+        self.val = val
+    def __hash__(self):
+        return self.hash
+    def __eq__(self, other):
+        return type(other) is StructureKey and self.hash == other.hash and equal(self.val, other.val)
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+class Map(Immutable):
+    """Map value. Non reducible.
+    Trie maps python key of each key (see map_key()) to pair (key, value)."""
+    __slots__ = ('trie',)
+    def __init__(self, trie=None):
+        if trie is None:
+            import hamt
+            trie = hamt.Hamt()
+        self.trie = trie
+    def to_str(self):
+        return "{" + ", ".join([k.to_str() + ": " + v.to_str() for k, v in self.trie.values()]) + "}"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def get(self, key):
+        """Return value of key, or null if key is not in map."""
+        entry = self.trie.get(map_key(key))
+        return entry[1] if entry is not None else Null()
+    def put(self, key, value):
+        return Map(self.trie.assoc(map_key(key), (key, value)))
+    def remove(self, key):
+        return Map(self.trie.dissoc(map_key(key)))
+    def contains(self, key):
+        return map_key(key) in self.trie
+    def keys(self):
+        return [k for k, v in self.trie.values()]
+
+class MapExpr(object):
+    """Map definition, eg. {"a": 1, "b": f(2)}.
+    Holds list of (key, value) pairs, reduced in order, then reduces to a Map."""
+    __slots__ = ('items',)
+    def __init__(self, items):
+        self.items = items
+    def to_str(self):
+        return "{" + ", ".join([k.to_str() + ": " + v.to_str() for k, v in self.items]) + "}"
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        #Reduce first reducible key or value
+        for i in range(len(self.items)):
+            key, value = self.items[i]
+            if key.reducible() or value.reducible():
+                items = list(self.items)
+                if key.reducible(): items[i] = (key.reduce(environment), value)
+                else: items[i] = (key, value.reduce(environment))
+                return MapExpr(items)
+        import hamt
+        trie = hamt.Hamt()
+        for key, value in self.items:
+            trie = trie.assoc(map_key(key), (key, value))
+        return Map(trie)
+
+
+# Ranges #########################################
+# A range is the numbers start, start+1, ... up to end, not including end, given by range(start, end).
+# Its numbers are only made as they are used, eg. by a for loop or elem().
+
+
+class Range(Immutable):
+    """Range value. Non reducible."""
+    __slots__ = ('start', 'end')
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+    def to_str(self):
+        return "range(" + str(self.start) + ", " + str(self.end) + ")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def elem(self, index):
+        if not 0 <= index < self.length(): raise IndexError("range index out of range")
+        return Number(self.start + index)
+    def length(self):
+        return max(0, self.end - self.start)
+
+
+# Records ########################################
+# A record type is declared with its field names, eg. 'record Point(x, y);',
+# and called like a function to make a record, eg. 'Point(1, 2)'.
+# A record holds its values in a tuple, one slot per field, in the order declared.
+# Fields are read with 'p.x', and 'p with {x: 5}' gives a copy with fields changed.
+# The parser resolves each field name to its slot when it sees the declaration,
+# so reading a field is one step, indexing the tuple. Records declared elsewhere, eg. in an imported file,
+# or whose field is in a different slot, find the slot by name when run instead.
+
+
+class RecordType(Immutable):
+    """Record type value, made by a record declaration. Non reducible.
+    'slots' maps each field name to its index in the values of a record."""
+    __slots__ = ('name', 'fields', 'slots')
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = tuple(fields)
+        self.slots = dict([(field, i) for i, field in enumerate(fields)])
+    def to_str(self):
+        return "record " + self.name + "(" + ", ".join(self.fields) + ")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def make(self, arg_ls):
+        """Return record of this type with values given, one for each field."""
+        if len(arg_ls) != len(self.fields):
+            raise TypeError(self.name + " takes " + str(len(self.fields)) + " values, " + str(len(arg_ls)) + " given")
+        return Record(self, tuple(arg_ls))
+    def slot(self, field, index):
+        """Return index of field, given index resolved by the parser, or None if not known."""
+        if index is not None and index < len(self.fields) and self.fields[index] == field: return index
+        index = self.slots.get(field)
+        if index is None: raise TypeError(self.name + " has no field " + field)
+        return index
+
+class Record(Immutable):
+    """Record value. Non reducible.
+    Holds its type and a tuple of the values of its fields."""
+    __slots__ = ('type', 'vals')
+    def __init__(self, type, vals):
+        self.type = type
+        self.vals = vals
+    def to_str(self):
+        return self.type.name + "(" + ", ".join([x.to_str() for x in self.vals]) + ")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+
+def record_of(val, field):
+    """Return val if it is a record, else raise TypeError."""
+    if not isinstance(val, Record): raise TypeError(val.to_str() + " has no field " + field)
+    return val
+
+class Field(object):
+    """Field of a record, eg. p.x.
+    'index' is the slot of the field resolved by the parser, or None if not known."""
+    __slots__ = ('expr', 'field', 'index')
+    def __init__(self, expr, field, index=None):
+        self.expr = expr
+        self.field = field
+        self.index = index
+    def to_str(self):
+        return self.expr.to_str() + "." + self.field
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        if self.expr.reducible(): return Field(self.expr.reduce(environment), self.field, self.index)
+        record = record_of(self.expr, self.field)
+        return record.vals[record.type.slot(self.field, self.index)]
+
+class Update(object):
+    """Copy of a record with some fields changed, eg. p with {x: 5}.
+    Holds names, slots resolved by the parser (or None), and new values of the fields changed.
+    Values are reduced in order, then it reduces to a new record."""
+    __slots__ = ('expr', 'fields', 'indexes', 'values')
+    def __init__(self, expr, fields, indexes, values):
+        self.expr = expr
+        self.fields = fields
+        self.indexes = indexes
+        self.values = values
+    def to_str(self):
+        return (self.expr.to_str() + " with {" +
+                ", ".join([field + ": " + x.to_str() for field, x in zip(self.fields, self.values)]) + "}")
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        if self.expr.reducible():
+            return Update(self.expr.reduce(environment), self.fields, self.indexes, self.values)
+        for i in range(len(self.values)):
+            if self.values[i].reducible():
+                values = list(self.values)
+                values[i] = values[i].reduce(environment)
+                return Update(self.expr, self.fields, self.indexes, values)
+        record = record_of(self.expr, self.fields[0])
+        vals = list(record.vals)
+        for field, index, value in zip(self.fields, self.indexes, self.values):
+            vals[record.type.slot(field, index)] = value
+        return Record(record.type, tuple(vals))
+
+
+# Tasks and channels #############################
+# spawn(f) starts a task calling function f with no arguments, run by a machine of its own
+# and interleaved with the program and other tasks by a tasks.Scheduler.
+# Tasks share the program's top level variables, and pass values through channels made by chan(n),
+# which hold up to n values. send(c, x) waits while c is full, recv(c) waits while c is empty.
+# A task which must wait raises Blocked, so is parked on the channel, not run, until another task
+# uses the channel and wakes it. It then steps the same call again.
+
+
+class Blocked(Exception):
+    """Task must wait for another task to use a channel.
+    'waiting' is the queue of the channel to park the task in."""
+    def __init__(self, waiting):
+        Exception.__init__(self, "task must wait on a channel")
+        self.waiting = waiting
+
+class Channel(object):
+    """Channel value. Non reducible.
+    Copies are the same channel, so tasks given copies, eg. in closures, still talk through it."""
+    __slots__ = ('capacity', 'buf', 'senders', 'receivers')
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = collections.deque() #Values sent but not yet received
+        self.senders = collections.deque() #Machines of tasks waiting for room to send
+        self.receivers = collections.deque() #Machines of tasks waiting for a value
+    def __copy__(self):
+        return self
+    def __deepcopy__(self, memo):
+        return self
+    def to_str(self):
+        return "chan(" + str(self.capacity) + ")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def send(self, val, scheduler):
+        if len(self.buf) >= self.capacity: raise Blocked(self.senders)
+        self.buf.append(val)
+        if self.receivers: scheduler.wake(self.receivers.popleft())
+    def recv(self, scheduler):
+        if not self.buf: raise Blocked(self.receivers)
+        val = self.buf.popleft()
+        if self.senders: scheduler.wake(self.senders.popleft())
+        return val
+
+
 # Compound terms #################################
 # Include add, multiply, less than, greater than, equal to.
 # Each is a collection of multiple terms.
@@ -172,8 +721,11 @@ def get_op(op):
             "!=": operator.ne
             }[op]
 
+SCALARS = (Number, String, Boolean) #Values which can be added, compared with <, and tested by if
+
 class Op(object):
     """Operation (+-*/%), returns number."""
+    __slots__ = ('first', 'op', 'second')
     def __init__(self, first, op, second):
         self.first = first
         self.op = op
@@ -192,20 +744,29 @@ class Op(object):
         elif(self.second.reducible()):
             return Op(self.first, self.op, self.second.reduce(environment))
         else:
+            first, second = self.first, self.second
+            #Arrays do operation on every element, see numarray.py
+            if hasattr(first, "elementwise"): return first.elementwise(self.op, second)
+            elif hasattr(second, "elementwise"): return second.elementwise(self.op, first, True)
+            if not isinstance(first, SCALARS) or not isinstance(second, SCALARS):
+                raise TypeError("cannot calculate " + first.to_str() + self.op + second.to_str())
             #Make operand types same so op works.
-            if type(self.first) != type(self.second):
-                if isinstance(self.first, String):
-                    self.second = String(str(self.second.val))
-                elif isinstance(self.second, String):
-                    self.first = String(str(self.first.val))
-            result = get_op(self.op)(self.first.val, self.second.val)
-            if(isinstance(self.first, String)):
+            if type(first) != type(second):
+                if isinstance(first, String):
+                    second = String(str(second.val))
+                elif isinstance(second, String):
+                    first = String(str(first.val))
+            result = get_op(self.op)(first.val, second.val)
+            if(isinstance(first, String)):
                 return String(result)
             else: #Must be number, not boolean because not comparison
                 return Number(result)
 
+COMPARED = (Number, String, Boolean, Null, Pair, List, Record) #Values which can be compared with ==
+
 class Comp(object):
     """Comparison (><==), returns boolean."""
+    __slots__ = ('first', 'op', 'second')
     def __init__(self, first, op, second):
         self.first = first
         self.op = op
@@ -219,17 +780,28 @@ class Comp(object):
         Else, if term 2 reduces, reduce it.
         Else, reduce comparison of terms."""
         if(self.first.reducible()):
-            return Op(self.first.reduce(environment), self.op, self.second)
+            return Comp(self.first.reduce(environment), self.op, self.second)
         elif(self.second.reducible()):
-            return Op(self.first, self.op, self.second.reduce(environment))
+            return Comp(self.first, self.op, self.second.reduce(environment))
         else:
-            return Boolean(get_op(self.op)(self.first.val, self.second.val))
+            #Arrays compare every element, giving an array of 1 and 0, see numarray.py
+            if hasattr(self.first, "elementwise"): return self.first.elementwise(self.op, self.second)
+            elif hasattr(self.second, "elementwise"): return self.second.elementwise(self.op, self.first, True)
+            if isinstance(self.first, SCALARS) and isinstance(self.second, SCALARS):
+                return Boolean(get_op(self.op)(self.first.val, self.second.val))
+            #Pairs, lists and records are compared part by part, or by identity if both are consed
+            if self.op != "==" or not isinstance(self.first, COMPARED) or not isinstance(self.second, COMPARED):
+                raise TypeError("cannot compare " + self.first.to_str() + self.op + self.second.to_str())
+            return Boolean(equal(self.first, self.second))
 
 class Execute(object):
-    """Function call. Contains arguments supplied and name of called function."""
-    def __init__(self, name, arg_ls):
+    """Function call. Contains arguments supplied and name of called function.
+    'site' is the call as parsed, if some of its arguments have been reduced, else None (see profiler.py)."""
+    __slots__ = ('name', 'arg_ls', 'site')
+    def __init__(self, name, arg_ls, site=None):
         self.name = name
         self.arg_ls = arg_ls
+        self.site = site
     def to_str(self):
         return self.name + "(" + ",".join([x.to_str() for x in self.arg_ls]) + ")"
     def reducible(self):
@@ -237,51 +809,125 @@ class Execute(object):
     def reduce(self, environment):
         """Reduce all arguments.
         After, create new machine and run.
-        Reduce to '_return_' variable in environment."""
-        if any([x.reducible() for x in self.arg_ls]):
-            return Execute(self.name, [x.reduce(environment) for x in self.arg_ls])
+        Reduce to '_return_' variable in environment.
+        Arguments of call-by-need functions are not reduced, but passed as thunks.
+        Calls of functions are run by the machine, see CallRequest."""
+        #Function called has returned, so reduce to its result
+        if environment.pending is not None and environment.pending[0] is self:
+            result = environment.pending[1]
+            environment.pending = None
+            return result
+        if self.is_lazy(environment):
+            raise CallRequest(environment.get(self.name), self.suspend_args(environment), self)
+        #Reduce first reducible argument
+        for i in range(len(self.arg_ls)):
+            if self.arg_ls[i].reducible():
+                arg_ls = list(self.arg_ls)
+                arg_ls[i] = arg_ls[i].reduce(environment)
+                return Execute(self.name, arg_ls, self if self.site is None else self.site)
         else:
+            if environment.hooks is not None and environment.hooks.on_builtin is not None and self.name in PredefFuncs.names:
+                environment.hooks.fire("on_builtin", self.name, self.arg_ls, environment)
             #Check if predefined function
             if self.name == "car": return PredefFuncs.carReduce(self.arg_ls[0])
             elif self.name == "cdr": return PredefFuncs.cdrReduce(self.arg_ls[0])
             elif self.name == "setcar": return PredefFuncs.setCarReduce(self.arg_ls[0], self.arg_ls[1])
             elif self.name == "setcdr": return PredefFuncs.setCdrReduce(self.arg_ls[0], self.arg_ls[1])
-            elif self.name == "print": return PredefFuncs.printReduce(self.arg_ls[0])
-            elif self.name == "input": return PredefFuncs.inputReduce(self.arg_ls[0])
+            elif self.name == "print": return PredefFuncs.printReduce(self.arg_ls[0], environment.io)
+            elif self.name == "input": return PredefFuncs.inputReduce(self.arg_ls[0], environment.io)
+            elif self.name == "flush": return PredefFuncs.flushReduce(environment.io)
             elif self.name == "elem": return PredefFuncs.elemReduce(self.arg_ls[0], self.arg_ls[1])
             elif self.name == "setelem": return PredefFuncs.setElemReduce(self.arg_ls[0], self.arg_ls[1], self.arg_ls[2])
+            elif self.name == "stream_head": return PredefFuncs.streamHeadReduce(self.arg_ls[0])
+            elif self.name == "stream_tail": return PredefFuncs.streamTailReduce(self.arg_ls[0], environment)
+            elif self.name == "take": return PredefFuncs.takeReduce(self.arg_ls[0], self.arg_ls[1], environment)
+            elif self.name == "stream_map": return PredefFuncs.streamMapReduce(self.arg_ls[0], self.arg_ls[1], environment)
+            elif self.name == "stream_filter": return PredefFuncs.streamFilterReduce(self.arg_ls[0], self.arg_ls[1], environment)
+            elif self.name == "fopen": return PredefFuncs.fopenReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "fread": return PredefFuncs.freadReduce(self.arg_ls[0])
+            elif self.name == "flines": return PredefFuncs.flinesReduce(self.arg_ls[0])
+            elif self.name == "fwrite": return PredefFuncs.fwriteReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "fclose": return PredefFuncs.fcloseReduce(self.arg_ls[0])
+            elif self.name == "get": return PredefFuncs.getReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "put": return PredefFuncs.putReduce(self.arg_ls[0], self.arg_ls[1], self.arg_ls[2])
+            elif self.name == "remove": return PredefFuncs.removeReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "contains": return PredefFuncs.containsReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "keys": return PredefFuncs.keysReduce(self.arg_ls[0])
+            elif self.name == "array": return PredefFuncs.arrayReduce(self.arg_ls[0])
+            elif self.name == "arange": return PredefFuncs.arangeReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "sum": return PredefFuncs.sumReduce(self.arg_ls[0])
+            elif self.name == "min": return PredefFuncs.minReduce(self.arg_ls[0])
+            elif self.name == "max": return PredefFuncs.maxReduce(self.arg_ls[0])
+            elif self.name == "dot": return PredefFuncs.dotReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "slice": return PredefFuncs.sliceReduce(self.arg_ls[0], self.arg_ls[1], self.arg_ls[2])
+            elif self.name == "pmap": return PredefFuncs.pmapReduce(self.arg_ls[0], self.arg_ls[1], environment)
+            elif self.name == "range": return PredefFuncs.rangeReduce(self.arg_ls[0], self.arg_ls[1])
+            elif self.name == "spawn": return PredefFuncs.spawnReduce(self.arg_ls[0], environment)
+            elif self.name == "chan": return PredefFuncs.chanReduce(self.arg_ls[0])
+            elif self.name == "send": return PredefFuncs.sendReduce(self.arg_ls[0], self.arg_ls[1], environment)
+            elif self.name == "recv": return PredefFuncs.recvReduce(self.arg_ls[0], environment)
             #Else, proceed as normal
             else:
-                #Functions have params, body attributes and closure, so access each
-                params = environment.get(self.name).params
-                body = environment.get(self.name).body
-                closure = environment.get(self.name).closure
-                #Make temporary scope to run function in
-                func_scope = {}
-                #Copy over environment into scope for closure
-                for name,val in closure.items(): func_scope[name] = val
-                #All functions are curried, so:
-                #Apply arg1 to func, get returned func, apply arg2 to it, get next one, etc.
-                #When all args are exhausted, return final value.
-
-                #Put params into top scope as variables with args as values
-                for i in range(len(self.arg_ls)):
-                    #Insert variables of param names with argument values for function
-                    #NB: Only one parameter exists (params[0]) because curried
-                    func_scope[params[0]] = self.arg_ls[i]
-                    #Return value stored as special var, reduce func to it
-                    func_scope["_return_"] = Null()
-                    #Push new scope to environment
-                    environment.push_scope(func_scope)
-                    temp_mach = Machine(body, environment)
-                    #Run function and get value of _return_ variable
-                    result = temp_mach.run().get("_return_")
-                    #If function returned, assume it is next curried function, evaluate its body next
-                    if type(result) is Function:
-                        body = result.body
-                        params = result.params
-                    environment.pop_scope()
-                return result
+                raise CallRequest(environment.get(self.name), self.arg_ls, self)
+    def is_lazy(self, environment):
+        """Return True if arguments should be passed unevaluated.
+        This is so if the function is lazy, or the whole program is run call-by-need.
+        Predefined functions always take evaluated arguments."""
+        if self.name in PredefFuncs.names or not environment.contains(self.name): return False
+        func = environment.get(self.name)
+        if isinstance(func, Partial): func = func.func
+        return isinstance(func, Function) and (func.lazy or environment.lazy)
+    def suspend_args(self, environment):
+        """Return arguments as values or thunks, to be evaluated when the function first uses them.
+        All thunks of one call share a copy of the current scope."""
+        scope = None
+        result = []
+        for arg in self.arg_ls:
+            if not arg.reducible():
+                result.append(arg)
+            elif isinstance(arg, Variable) and environment.contains(arg.name):
+                #Pass variable's value on, without evaluating it if it is a thunk itself
+                result.append(environment.get(arg.name))
+            else:
+                if scope is None: scope = environment.get_dict()
+                result.append(ExprThunk(arg, scope))
+        return result
+
+
+class Apply(object):
+    """Call of a function value with non reducible arguments.
+    Used by predefined functions which call functions given to them, see call_function()."""
+    __slots__ = ('func', 'arg_ls')
+    def __init__(self, func, arg_ls):
+        self.func = func
+        self.arg_ls = arg_ls
+    def to_str(self):
+        return self.func.to_str() + "(" + ",".join([x.to_str() for x in self.arg_ls]) + ")"
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        if environment.pending is not None and environment.pending[0] is self:
+            result = environment.pending[1]
+            environment.pending = None
+            return result
+        raise CallRequest(self.func, self.arg_ls, self)
+
+def call_function(func, arg_ls, environment):
+    """Call function value 'func' with list of non reducible arguments, and return its result.
+    Used by predefined functions which take functions as arguments."""
+    return evaluate(Apply(func, arg_ls), environment)
+
+def evaluate(expr, environment):
+    """Reduce expression until it is a non reducible value, and return value.
+    A new machine is used, so functions called in expression are run."""
+    if not expr.reducible(): return expr
+    mach = Machine(expr, environment, False)
+    try:
+        mach.run()
+    except Blocked:
+        #Cannot be parked, as the caller would run again from the start when woken
+        raise RuntimeError("functions called by predefined functions cannot wait on a channel")
+    return mach.result
 
 
 # Statements ##########################################
@@ -289,10 +935,17 @@ class Execute(object):
 # Reduce() method returns tuple of expression and environment; environment can be modified.
 
 
-class DoNothing(object):
-    """Empty statement. Non reducible."""
-    def __init__(self):
-        pass
+class DoNothing(Immutable):
+    """Empty statement. Non reducible.
+    Only one DoNothing object exists."""
+    __slots__ = ()
+    _instance = None
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = object.__new__(cls)
+        return cls._instance
+    def __reduce__(self):
+        return (DoNothing, ())
     def to_str(self):
         return "do_nothing;"
     def reducible(self):
@@ -303,6 +956,7 @@ class DoNothing(object):
 
 class Assign(object):
     """Assignment. Reduces to null statement."""
+    __slots__ = ('variable', 'value')
     def __init__(self, variable, value):
         self.variable = variable
         self.value = value
@@ -316,11 +970,15 @@ class Assign(object):
             return (Assign(self.variable, self.value.reduce(environment)), environment)
         else:
             environment.put(self.variable.name, self.value)
+            if environment.hooks is not None and environment.hooks.on_assign is not None:
+                environment.hooks.fire("on_assign", self.variable.name, self.value, environment)
             return (DoNothing(), environment)
 
 class Sequence(object):
     """Sequence of two statements.
-    If first reduces, reduce it; if not, reduce to second statement."""
+    If first reduces, reduce it; if not, reduce to second statement.
+    The parser makes a Block of statements instead, but sequences built by other code still run."""
+    __slots__ = ('first', 'second')
     def __init__(self, first, second):
         self.first = first
         self.second = second
@@ -332,13 +990,54 @@ class Sequence(object):
         """If first one reducible, reduce. Otherwise, become second statement."""
         if self.first.reducible():
             #Must alter environment according to statement 1
-            self.first, environment = self.first.reduce(environment)
-            return (Sequence(self.first, self.second), environment)
+            #Build a new node rather than changing this one, since bodies of functions are reused.
+            first, environment = self.first.reduce(environment)
+            return (Sequence(first, self.second), environment)
         else:
             return (self.second, environment)
 
+class Block(object):
+    """Statements run in order, eg. a function body or a whole program. Holds a tuple of statements.
+    The block itself is never changed, so it can be run again, eg. each time its function is called.
+    Its first step makes a BlockCursor, which runs it."""
+    __slots__ = ('stmts',)
+    def __init__(self, stmts):
+        self.stmts = stmts
+    def to_str(self):
+        return " ".join([x.to_str() for x in self.stmts])
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        return BlockCursor(self.stmts).reduce(environment)
+
+class BlockCursor(object):
+    """Block being run. 'current' is what the statement at 'index' has been reduced to so far.
+    Only the frame running the block refers to its cursor, so each step changes the cursor
+    in place, rather than building a new node. Finished statements are passed in the same step."""
+    __slots__ = ('stmts', 'index', 'current')
+    def __init__(self, stmts):
+        self.stmts = stmts
+        self.index = 0
+        self.current = stmts[0]
+    def to_str(self):
+        return " ".join([self.current.to_str()] + [x.to_str() for x in self.stmts[self.index+1:]])
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        """Reduce current statement, moving on to the next first if it is finished.
+        The last statement replaces the cursor, as nothing follows it, so loops
+        (which end with themselves, see While) never nest cursors."""
+        while not self.current.reducible():
+            if self.index == len(self.stmts) - 1: return (self.current, environment)
+            self.index += 1
+            self.current = self.stmts[self.index]
+        if self.index == len(self.stmts) - 1: return self.current.reduce(environment)
+        self.current, environment = self.current.reduce(environment)
+        return (self, environment)
+
 class If(object):
     """If statement (if condition then consequence else alternative)"""
+    __slots__ = ('condition', 'consequence', 'alternative')
     def __init__(self, condition, consequence, alternative):
         self.condition = condition
         self.consequence = consequence
@@ -351,6 +1050,8 @@ class If(object):
         """Reduce condition to boolean/int. Reduce to cons or alt depending on cond."""
         if self.condition.reducible():
             return (If(self.condition.reduce(environment), self.consequence, self.alternative), environment)
+        elif not isinstance(self.condition, SCALARS):
+            raise TypeError("condition " + self.condition.to_str() + " is not a boolean, number or string")
         elif self.condition.val:
             return (self.consequence, environment)
         else:
@@ -358,6 +1059,7 @@ class If(object):
 
 class While(object):
     """While loop (while condition body)"""
+    __slots__ = ('condition', 'body')
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -366,16 +1068,70 @@ class While(object):
     def reducible(self):
         return True
     def reduce(self, environment):
-        """Reduce to {if condition then sequence(body while_loop) else do_nothing}
+        """Reduce to {if condition then block(body while_loop) else do_nothing}
         Don't reduce condition or body; reduced in if statement."""
-        # copy.deepcopy(self.body) makes copy of body of while statement.
-        # This stops reduction of body outside of while loop changing next while loop.
-        return (If(self.condition, Sequence(copy.deepcopy(self.body), self), DoNothing()), environment)
+        return (If(self.condition, Block((self.body, self)), DoNothing()), environment)
+
+
+class For(object):
+    """For loop (for variable in sequence body).
+    Runs body once for each element of a list, range or array, with variable bound to it.
+    'index' is the element bound by the next step, or None until the sequence has been reduced to a value."""
+    __slots__ = ('variable', 'seq', 'body', 'index')
+    def __init__(self, variable, seq, body, index=None):
+        self.variable = variable
+        self.seq = seq
+        self.body = body
+        self.index = index
+    def to_str(self):
+        return "for " + self.variable.to_str() + " in " + self.seq.to_str() + " {" + self.body.to_str() + "}"
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        """Reduce sequence to a value, then each step binds the next element
+        and reduces to {block(body for_loop_from_next_element)}, or do_nothing after the last.
+        The sequence is only checked until it is a value, as checking a list looks at every element."""
+        index = self.index
+        if index is None:
+            if self.seq.reducible():
+                return (For(self.variable, self.seq.reduce(environment), self.body), environment)
+            index = 0
+        if isinstance(self.seq, List):
+            if index >= len(self.seq.ls): return (DoNothing(), environment)
+            value = self.seq.ls[index]
+        elif hasattr(self.seq, "length"): #Range or array
+            if index >= self.seq.length(): return (DoNothing(), environment)
+            value = self.seq.elem(index)
+        else:
+            raise TypeError("cannot loop over " + self.seq.to_str())
+        environment.put(self.variable.name, value)
+        if environment.hooks is not None and environment.hooks.on_assign is not None:
+            environment.hooks.fire("on_assign", self.variable.name, value, environment)
+        return (Block((self.body, For(self.variable, self.seq, self.body, index + 1))), environment)
+
+
+class RecordDecl(object):
+    """Record declaration (record name(fields)). Binds name to a new record type."""
+    __slots__ = ('variable', 'fields')
+    def __init__(self, variable, fields):
+        self.variable = variable
+        self.fields = fields
+    def to_str(self):
+        return "record " + self.variable.to_str() + "(" + ", ".join(self.fields) + ");"
+    def reducible(self):
+        return True
+    def reduce(self, environment):
+        value = RecordType(self.variable.name, self.fields)
+        environment.put(self.variable.name, value)
+        if environment.hooks is not None and environment.hooks.on_assign is not None:
+            environment.hooks.fire("on_assign", self.variable.name, value, environment)
+        return (DoNothing(), environment)
 
 
 class ExecStmt(object):
     """If a function is called alone, eg. 'print(5);', must be considered as a statement.
     ie. must return self and environment."""
+    __slots__ = ('expr',)
     def __init__(self, expr):
         self.expr = expr
     def to_str(self):
@@ -394,6 +1150,7 @@ class ExecStmt(object):
 
 class Return(object):
     """Return statement in a function. eg. return 5"""
+    __slots__ = ('val',)
     def __init__(self, val):
         self.val = val
     def to_str(self):
@@ -410,6 +1167,7 @@ class Return(object):
 
 class Import(object):
     """Import a file - essentially run it and copy environment."""
+    __slots__ = ('filename',)
     def __init__(self, filename):
         self.filename = filename
     def to_str(self):
@@ -421,13 +1179,18 @@ class Import(object):
         Concatenate environment created by evaluating imported file
         with own environment's top scope.
         Any conflicting names are overriden by import."""
-        from interpreter import file_interp
-        #Run imported file. Get environment created.
-        import_env = file_interp(self.filename)
+        from interpreter import interpret
+        import prefetch
+        if environment.hooks is not None and environment.hooks.on_import is not None:
+            environment.hooks.fire("on_import", self.filename, environment)
+        #File is usually read and parsed already, see prefetch.py
+        program, ast = prefetch.load(self.filename)
+        #Run imported file, sharing own input and output and hooks. Get environment created.
+        import_env = interpret(program, environment.io, environment.lazy, hooks=environment.hooks, ast=ast)
         #Get dict of environment to concatenate with own top scope.
         import_scope = import_env.get_dict()
         #Concatenate dicts together.
-        environment.get_top_scope().update(import_scope)
+        environment.update_top_scope(import_scope)
         return (DoNothing(), environment)
 
 
@@ -435,19 +1198,41 @@ class Import(object):
 #Includes return, car(), cdr, setcar(), setcdr(), etc.
 
 
+def pair_of(val, name):
+    """Return val if it is a pair, else raise TypeError for predefined function 'name'."""
+    if not isinstance(val, Pair): raise TypeError("cannot take " + name + "() of " + val.to_str())
+    return val
+
+def sequence_of(val, name):
+    """Return val if it has a method for predefined function 'name', ie. is a range or array, else raise TypeError.
+    Lists are checked by the caller first, as they are most common."""
+    if not hasattr(val, name): raise TypeError("cannot take " + name + "() of " + val.to_str())
+    return val
+
+
 class PredefFuncs(object):
     """Container for all predefined functions and their reduce() methods."""
 
+    #Names of all predefined functions, as called in programs
+    names = frozenset(["car", "cdr", "setcar", "setcdr", "print", "input", "flush", "elem", "setelem",
+                       "stream_head", "stream_tail", "take", "stream_map", "stream_filter",
+                       "fopen", "fread", "flines", "fwrite", "fclose",
+                       "get", "put", "remove", "contains", "keys",
+                       "array", "arange", "sum", "min", "max", "dot", "slice", "pmap", "range",
+                       "spawn", "chan", "send", "recv"])
+
     @staticmethod
     def elemReduce(ls, index):
         """Call elem() function on list, return element of specific index in list.
-        Equivalent to ls[i] in Python."""
+        Equivalent to ls[i] in Python. Also works on arrays."""
+        if not isinstance(ls, List): return sequence_of(ls, "elem").elem(index.val)
         return ls.ls[index.val]
 
     @staticmethod
     def setElemReduce(ls, index, new_val):
         """Call setelem() function on list, return list with modified element at index.
-        Equivalent to ls[i] = new_val in Python."""
+        Equivalent to ls[i] = new_val in Python. Also works on arrays."""
+        if not isinstance(ls, List): return sequence_of(ls, "setelem").setelem(index.val, new_val)
         ls_new = copy.deepcopy(ls.ls)
         ls_new[index.val] = new_val
         return List(ls_new)
@@ -455,108 +1240,376 @@ class PredefFuncs(object):
     @staticmethod
     def carReduce(pair):
         """Call car() function on pair, returns car value."""
-        return pair.car
+        return pair_of(pair, "car").car
 
     @staticmethod
     def cdrReduce(pair):
         """Call cdr() function on pair, returns cdr value."""
-        return pair.cdr
+        return pair_of(pair, "cdr").cdr
 
     @staticmethod
     def setCarReduce(pair, new):
         """Call setcar() function on pair, returns pair with new car."""
-        return Pair(new, pair.cdr)
+        return Pair(new, pair_of(pair, "setcar").cdr)
 
     @staticmethod
     def setCdrReduce(pair, new):
         """Call setcdr() function on pair, returns pair with new cdr."""
-        return Pair(pair.car, new)
+        return Pair(pair_of(pair, "setcdr").car, new)
 
     @staticmethod
-    def printReduce(val):
-        """Call print() function on expression, print result."""
+    def streamHeadReduce(stream):
+        """Call stream_head() function on stream, returns head value."""
+        return stream.head
+
+    @staticmethod
+    def streamTailReduce(stream, environment):
+        """Call stream_tail() function on stream, force and return the rest of the stream."""
+        return stream.rest(environment)
+
+    @staticmethod
+    def takeReduce(stream, n, environment):
+        """Call take() function, returns list of first n elements of stream.
+        List is shorter if stream ends first."""
+        result = []
+        while len(result) < n.val and isinstance(stream, Stream):
+            result.append(stream.head)
+            if len(result) < n.val: stream = stream.rest(environment)
+        return List(result)
+
+    @staticmethod
+    def streamMapReduce(func, stream, environment):
+        """Call stream_map() function, returns stream of func applied to each element.
+        Only the head is computed now, each later element is computed when first needed."""
+        if not isinstance(stream, Stream): return stream
+        return Stream(call_function(func, [stream.head], environment), MapThunk(func, stream))
+
+    @staticmethod
+    def streamFilterReduce(func, stream, environment):
+        """Call stream_filter() function, returns stream of elements for which func gives true.
+        Elements are only tested when needed."""
+        return filter_stream(func, stream, environment)
+
+    @staticmethod
+    def fopenReduce(name, mode):
+        """Call fopen() function, returns file of name opened with mode "r", "w" or "a"."""
+        import fileio
+        return fileio.File(name.val, mode.val)
+
+    @staticmethod
+    def freadReduce(f):
+        """Call fread() function on file, returns its whole contents as a string."""
+        return String(f.read_all())
+
+    @staticmethod
+    def flinesReduce(f):
+        """Call flines() function on file, returns stream of its lines.
+        Each line is only read when the stream reaches it."""
+        return f.lines()
+
+    @staticmethod
+    def fwriteReduce(f, val):
+        """Call fwrite() function, write value to file. Strings are written without quotation marks."""
+        f.write(val.val if isinstance(val, String) else val.to_str())
+        return Number(0)
+
+    @staticmethod
+    def fcloseReduce(f):
+        """Call fclose() function, close file."""
+        f.close()
+        return Number(0)
+
+    @staticmethod
+    def getReduce(m, key):
+        """Call get() function on map, returns value of key, or null if key is not in map."""
+        return m.get(key)
+
+    @staticmethod
+    def putReduce(m, key, val):
+        """Call put() function on map, returns map with key set to val.
+        Equivalent to m[key] = val in Python, but m itself is unchanged."""
+        return m.put(key, val)
+
+    @staticmethod
+    def removeReduce(m, key):
+        """Call remove() function on map, returns map without key. m itself is unchanged."""
+        return m.remove(key)
+
+    @staticmethod
+    def containsReduce(m, key):
+        """Call contains() function on map, returns true if key is in map."""
+        return Boolean(m.contains(key))
+
+    @staticmethod
+    def keysReduce(m):
+        """Call keys() function on map, returns list of its keys."""
+        return List(m.keys())
+
+    @staticmethod
+    def arrayReduce(ls):
+        """Call array() function, returns integer array of list of numbers."""
+        import numarray
+        return numarray.to_array(ls)
+
+    @staticmethod
+    def arangeReduce(start, end):
+        """Call arange() function, returns integer array of start, start+1, ... up to end, not including end."""
+        import numarray
+        return numarray.arange(start.val, end.val)
+
+    @staticmethod
+    def sumReduce(arr):
+        """Call sum() function on array or list of numbers, returns sum of elements."""
+        import numarray
+        return numarray.total(numarray.to_array(arr))
+
+    @staticmethod
+    def minReduce(arr):
+        """Call min() function on array or list of numbers, returns smallest element."""
+        import numarray
+        return numarray.minimum(numarray.to_array(arr))
+
+    @staticmethod
+    def maxReduce(arr):
+        """Call max() function on array or list of numbers, returns largest element."""
+        import numarray
+        return numarray.maximum(numarray.to_array(arr))
+
+    @staticmethod
+    def dotReduce(first, second):
+        """Call dot() function on two arrays or lists of numbers, returns sum of products of elements."""
+        import numarray
+        return numarray.dot(numarray.to_array(first), numarray.to_array(second))
+
+    @staticmethod
+    def sliceReduce(arr, start, end):
+        """Call slice() function, returns array of elements from index start up to end, not including end.
+        Lists give a list."""
+        if isinstance(arr, List): return List(arr.ls[start.val:end.val])
+        import numarray
+        return numarray.slice_array(arr, start.val, end.val)
+
+    @staticmethod
+    def pmapReduce(func, ls, environment):
+        """Call pmap() function, returns list of func applied to each element of ls.
+        If func is pure, elements are mapped in parallel by worker processes, see parallel.py."""
+        import parallel
+        return parallel.pmap(func, ls, environment)
+
+    @staticmethod
+    def rangeReduce(start, end):
+        """Call range() function, returns range of start, start+1, ... up to end, not including end."""
+        return Range(start.val, end.val)
+
+    @staticmethod
+    def spawnReduce(func, environment):
+        """Call spawn() function, starts task calling func with no arguments. Returns 0."""
+        if environment.scheduler is None: raise RuntimeError("spawn() needs a program run by tasks.run()")
+        environment.scheduler.spawn(func, environment)
+        return Number(0)
+
+    @staticmethod
+    def chanReduce(capacity):
+        """Call chan() function, returns new channel holding up to capacity values."""
+        if capacity.val < 1: raise ValueError("channel must hold at least one value")
+        return Channel(capacity.val)
+
+    @staticmethod
+    def sendReduce(channel, val, environment):
+        """Call send() function, puts val in channel, waiting while it is full. Returns 0."""
+        channel.send(val, environment.scheduler)
+        return Number(0)
+
+    @staticmethod
+    def recvReduce(channel, environment):
+        """Call recv() function, returns oldest value in channel, waiting while it is empty."""
+        return channel.recv(environment.scheduler)
+
+    @staticmethod
+    def printReduce(val, io):
+        """Call print() function on expression, write result to program's output."""
         if isinstance(val, String):
             #If a string, cut off quotation marks on sides when printing
             string = val.to_str()
-            print string[1:len(string)-1]
+            io.write(string[1:len(string)-1] + "\n")
         else:
             #Print everything else (numbers, bools) normally
-            print val.to_str()
+            io.write(val.to_str() + "\n")
         return Number(0) #Print function returns number 0 to denote success
 
     @staticmethod
-    def inputReduce(val):
-        """Call input() function, print start, take input and reduce to result."""
+    def inputReduce(val, io):
+        """Call input() function, print start, take line of program's input and reduce to result."""
         if isinstance(val, String):
             #If a string, cut off quotation marks on sides when printing
             string = val.to_str()
-            return String(raw_input(string[1:len(string)-1]))
+            return String(io.readline(string[1:len(string)-1]))
         else:
             #Print everything else (numbers, bools) normally
-            return String(raw_input(val.to_str()))
+            return String(io.readline(val.to_str()))
+
+    @staticmethod
+    def flushReduce(io):
+        """Call flush() function, write out all buffered output of program."""
+        io.flush()
+        return Number(0)
 
 
 # Define machine to run evaluator.########################
 
 
+class CallRequest(Exception):
+    """Raised by reduce() of a function call once all its arguments are reduced.
+    The machine catches it and pushes a Frame to run the function, leaving the caller unchanged.
+    When the function returns, the caller is stepped again, and reduce() of the call
+    finds the result in the environment's 'pending' slot."""
+    def __init__(self, func, arg_ls, node):
+        Exception.__init__(self)
+        self.func = func #Function value called
+        self.arg_ls = arg_ls #Reduced arguments
+        self.node = node #Call node waiting for the result
+
+class ForceRequest(Exception):
+    """Raised by reduce() of a variable holding an unforced ExprThunk.
+    The machine catches it and pushes a Frame evaluating the thunk's expression in the thunk's scope.
+    When it is finished, the value is given to the thunk, and the variable is stepped again."""
+    def __init__(self, thunk, node):
+        Exception.__init__(self)
+        self.thunk = thunk
+        self.node = node #Variable read
+
+class Frame(object):
+    """One call being run by a Machine, or the program or expression the machine was given.
+    'scope' is the function's scope in the environment, None for the machine's first frame.
+    'arg_ls' holds arguments beyond the function's parameters, to apply to the function it returns.
+    'pending' is the result of the last call this frame made, with that call's node.
+    'thunk' is the ExprThunk a frame forcing one computes, and 'saved' the scopes of the frame below,
+    from Environment.enter(), which are put back when it is finished."""
+    __slots__ = ('expression', 'scope', 'arg_ls', 'node', 'pending', 'is_statement', 'thunk', 'saved')
+    def __init__(self, expression, scope=None, arg_ls=(), node=None, is_statement=True, thunk=None, saved=None):
+        self.expression = expression #Rest of function body, or of program
+        self.scope = scope
+        self.arg_ls = arg_ls
+        self.node = node #Call in previous frame waiting for this frame's result
+        self.pending = None
+        self.is_statement = is_statement #Statements reduce to (statement, environment), expressions to values
+        self.thunk = thunk
+        self.saved = saved
+
 class Machine(object):
-    """Reduces and executes small-step semantics of AST from parser."""
-    def __init__(self, expression, environment):
-        self.expression = expression
-        #Environment is a list of two dicts, for vars and funcs.
+    """Reduces and executes small-step semantics of AST from parser.
+    Function calls push a Frame onto the machine's own stack, rather than running another machine,
+    so depth of calls is only limited by memory.
+    The machine can be stopped after any step, at any depth of calls, and continued with run()."""
+    def __init__(self, expression, environment, is_statement=True):
+        #Environment is a stack of dicts, one for each scope.
         self.environment = environment
+        self.frames = [Frame(expression, is_statement=is_statement)]
         self.i = 0 #Current step
+        self.result = None #Environment for a program, value for an expression, when finished
+    @property
+    def expression(self):
+        """Expression currently being reduced, ie. of the topmost frame."""
+        return self.frames[-1].expression
+    def finished(self):
+        return not self.frames
     def step(self):
-        #Decide indentation for printing to depict current scope.
-        indent = "  "*self.environment.get_scope_size()
-        #Create string to print environment
-        env_str = "[" + ", ".join([x[0] + ":" + x[1].to_str() for x in self.environment.get_dict().items()]) + "]"
-        state_str = self.expression.to_str() + "\n" + indent + "  | vars: " + env_str
-        #Print current state, comment out to turn off printing state
-        print indent + str(self.i+1) + " | " + state_str + "\n"
+        frame = self.frames[-1]
+        #State is printed by the hooks.trace hook, if given
+        if self.environment.hooks is not None and self.environment.hooks.on_step is not None:
+            self.environment.hooks.fire("on_step", self, frame)
         #Increment i to signify step has been taken.
         self.i += 1
+        if self.frame_done(frame):
+            self.return_from(frame)
+            return
+        #Give caller the result of the function it called, if it has just returned
+        if frame.pending is not None:
+            self.environment.pending = frame.pending
+            frame.pending = None
         #Reduce expression and update environment.
-        self.expression, self.environment = self.expression.reduce(self.environment)
-    def run(self):
-        while self.expression.reducible():
-            #If _return_ is defined, stop evaluatingi because function has returned
-            if self.environment.contains("_return_"):
-                if not isinstance(self.environment.get("_return_"), Null): break
+        try:
+            if frame.is_statement:
+                frame.expression, self.environment = frame.expression.reduce(self.environment)
+            else:
+                frame.expression = frame.expression.reduce(self.environment)
+        except CallRequest as call:
+            self.push_call(call)
+        except ForceRequest as force:
+            self.push_force(force)
+    def run(self, max_steps=None):
+        """Run until finished, or until 'max_steps' more steps have been taken.
+        Return environment."""
+        steps = 0
+        while self.frames and (max_steps is None or steps < max_steps):
             self.step()
-        self.step() #Display last, non-reducible statement (should be DoNothing)
+            steps += 1
         return self.environment
-
-
-#class MachStack(object):
-#    """Interpreted program functions as stack of machines.
-#    When a function is called, new machine pushed onto stack.
-#    Uppermost machine is run.
-#    When uppermost machine is nonreducible, pop and run next one."""
-#    def __init__(self):
-#        self.stack = []
-#        self.top = None
-#    def step_top(self):
-#        """Step topmost machine."""
-#        self.top.step()
-#    def pop(self):
-#        self.stack = self.stack[0: len(self.stack)-2]
-#        self.top = self.stack[len(self.stack)-1]
-#    def push(self, mach):
-#        self.stack.append(mach)
-#        self.top = mach
-#    def run(self):
-#        while len(self.stack) > 0:
-#            self.step_top()
-#    def get_flat_env(self):
-#        """Get all environments as a flat dict."""
-#        result = {}
-#        #Order of environments evaluated is important.
-#        #Val of var w/ highest scope overrides others.
-#        for x in self.stack:
-#            for name,val in x.environment.val.items():
-#                result[name] = val
-#        return Environment(result)
+    def frame_done(self, frame):
+        """Frame is done if its expression is nonreducible, or its function has returned."""
+        if not frame.expression.reducible(): return True
+        if not frame.is_statement: return False
+        if frame.scope is not None:
+            return not isinstance(frame.scope["_return_"], Null)
+        #If _return_ is defined at top level, stop evaluating because program has returned
+        return self.environment.contains("_return_") and not isinstance(self.environment.get("_return_"), Null)
+    def push_call(self, call):
+        """Push frame to run function called, with all its parameters in new scope.
+        If too few arguments are given, the call gives a Partial instead, and no frame is pushed."""
+        func = call.func
+        arg_ls = call.arg_ls
+        if isinstance(func, Partial):
+            arg_ls = func.args + list(arg_ls)
+            func = func.func
+        if isinstance(func, RecordType):
+            #Making a record runs no body, so gives its result at once
+            if len(arg_ls) < len(func.fields): result = Partial(func, list(arg_ls)) if arg_ls else func
+            else: result = func.make(arg_ls)
+            self.frames[-1].pending = (call.node, result)
+            return
+        n_params = len(func.params)
+        if len(arg_ls) < n_params:
+            result = Partial(func, list(arg_ls)) if arg_ls else func
+            self.frames[-1].pending = (call.node, result)
+            return
+        #Make temporary scope to run function in, copying over closure
+        func_scope = dict(func.closure)
+        for i in range(n_params):
+            func_scope[func.params[i]] = arg_ls[i]
+        #Return value stored as special var, reduce call to it
+        func_scope["_return_"] = Null()
+        if self.environment.hooks is not None and self.environment.hooks.on_call is not None:
+            self.environment.hooks.fire("on_call", self, func, arg_ls)
+        self.environment.push_scope(func_scope)
+        self.frames.append(Frame(func.body, func_scope, arg_ls[n_params:], call.node, True))
+    def push_force(self, force):
+        """Push frame evaluating thunk, with the scope it was created in as the only scope."""
+        thunk = force.thunk
+        saved = self.environment.enter(dict(thunk.scope))
+        self.frames.append(Frame(thunk.expr, None, (), force.node, False, thunk, saved))
+    def return_from(self, frame):
+        """Finish frame, giving its result to the frame below it.
+        If arguments are left over, the function returned is called with them instead."""
+        if frame.thunk is not None:
+            #Variable which forced the thunk finds its value when stepped again
+            self.environment.leave(frame.saved)
+            self.frames.pop()
+            frame.thunk.give(frame.expression)
+            return
+        if frame.scope is None:
+            #Machine's first frame, so machine is finished
+            self.frames.pop()
+            self.result = frame.expression if not frame.is_statement else self.environment
+            return
+        result = frame.scope["_return_"]
+        if self.environment.hooks is not None and self.environment.hooks.on_return is not None:
+            self.environment.hooks.fire("on_return", self, frame, result)
+        self.environment.pop_scope()
+        self.frames.pop()
+        if frame.arg_ls:
+            self.push_call(CallRequest(result, frame.arg_ls, frame.node))
+            return
+        self.frames[-1].pending = (frame.node, result)
 
 
 # Define environment for program to run within. ############
@@ -566,10 +1619,21 @@ class Environment(object):
     """Environment for code to run within.
     Is a stack of dictionaries, each representing a scope.
     Dictionaries are of names and values. Values can be functions, numbers, etc.
-    Scope can contain a _return_ value, holds val of return in function."""
-    def __init__(self, val={}):
+    Scope can contain a _return_ value, holds val of return in function.
+    Also holds the program's input and output streams, used by print() and input(),
+    and if lazy, all functions are called by need.
+    'hooks' is a hooks.Hooks of functions called on events as the program runs, or None.
+    Names held by no scope above the first, eg. a recursive function's own name, are found in the first scope
+    at once, rather than by looking through every scope, so reading them costs the same at any depth of calls."""
+    def __init__(self, val=None, io=None, lazy=False, hooks=None):
         self.stack = []
-        self.stack.append(val)
+        self.stack.append(val if val is not None else {})
+        self.local_counts = {} #Name: number of scopes above the first holding it, for names held by any
+        self.io = io if io is not None else progio.ProgramIO()
+        self.lazy = lazy
+        self.hooks = hooks
+        self.pending = None #(call node, result) of function that has just returned
+        self.scheduler = None #tasks.Scheduler running the program's tasks, if any
     def get_dict(self):
         """Return flat dictionary of all names and vals.
         Higher scopes override lower ones."""
@@ -580,20 +1644,55 @@ class Environment(object):
                 result[name] = val
         return result
     def get(self, name):
-        """Get value by name in dictonary."""
-        return self.get_dict()[name]
+        """Get value by name, from the highest scope holding it."""
+        stack = self.stack
+        scope = stack[-1]
+        if name in scope: return scope[name]
+        if name in self.local_counts:
+            for scope in reversed(stack):
+                if name in scope: return scope[name]
+        elif name in stack[0]:
+            return stack[0][name]
+        raise KeyError(name)
     def put(self, name, value):
         """Put value with name and value into highest scope, ie. last in stack list."""
-        self.stack[len(self.stack)-1][name] = value
+        scope = self.stack[-1]
+        if name not in scope and len(self.stack) > 1: self.local_counts[name] = self.local_counts.get(name, 0) + 1
+        scope[name] = value
     def contains(self, name):
         """Return True if environment contains name, False if not."""
-        return self.get_dict().has_key(name)
+        stack = self.stack
+        if name in stack[-1] or name in self.local_counts: return True
+        return name in stack[0]
     def push_scope(self, scope={}):
         """Create new scope level."""
+        counts = self.local_counts
+        for name in scope:
+            counts[name] = counts.get(name, 0) + 1
         self.stack.append(scope)
     def pop_scope(self):
         """Go down one scope level, remove old highest one."""
-        self.stack = self.stack[:len(self.stack)-1]
+        counts = self.local_counts
+        for name in self.stack.pop():
+            if counts[name] == 1: del counts[name]
+            else: counts[name] -= 1
+    def update_top_scope(self, values):
+        """Put every name and value of dict 'values' into top scope."""
+        scope = self.get_top_scope()
+        if len(self.stack) > 1:
+            for name in values:
+                if name not in scope: self.local_counts[name] = self.local_counts.get(name, 0) + 1
+        scope.update(values)
+    def enter(self, scope):
+        """Replace stack of scopes with one holding only 'scope', eg. to evaluate a thunk in the scope it was made in.
+        Return the old stack, to be put back by leave()."""
+        saved = (self.stack, self.local_counts)
+        self.stack = [scope]
+        self.local_counts = {}
+        return saved
+    def leave(self, saved):
+        """Put back stack of scopes replaced by enter()."""
+        self.stack, self.local_counts = saved
     def get_top_scope(self):
         """Return dictionary of top scope."""
         return self.stack[len(self.stack)-1]
@@ -0,0 +1,101 @@
+import os
+import mmap
+from evaluator import Immutable, Thunk, Stream, String, Boolean
+
+# Files, for the fopen(), fread(), flines(), fwrite() and fclose() predefined functions.
+# Large files opened for reading are memory-mapped, so reading them copies nothing
+# until a line or the whole contents is asked for. Others use large buffered reads and writes.
+# flines() gives a stream of lines, so a file is read one line at a time as the stream is used,
+# and lines already used can be freed.
+
+
+BUFFER_SIZE = 1 << 20 #Bytes buffered by files which are not memory-mapped
+MMAP_THRESHOLD = 1 << 20 #Files of at least this many bytes are memory-mapped for reading
+
+
+class File(Immutable):
+    """Open file value. Non reducible.
+    Copies share the same open file."""
+    __slots__ = ('name', 'mode', 'handle', 'mmap')
+    def __init__(self, name, mode):
+        self.name = name
+        self.mode = mode
+        self.handle = open(name, mode + "b", BUFFER_SIZE)
+        self.mmap = None #Memory map of file, if read only and large enough
+        if mode == "r" and os.fstat(self.handle.fileno()).st_size >= MMAP_THRESHOLD:
+            self.mmap = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+    def __reduce__(self):
+        """Pickle as name, mode and position, so a checkpoint (see checkpoint.py) reopens the file where it was.
+        Python would otherwise pickle the open file as an empty one."""
+        if self.handle.closed: return (reopen, (self.name, self.mode, None))
+        self.handle.flush()
+        return (reopen, (self.name, self.mode, self.handle.tell()))
+    def to_str(self):
+        return "file(\"" + self.name + "\", \"" + self.mode + "\")"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def read_all(self):
+        """Return whole contents of file as a python string."""
+        if self.mmap is not None:
+            return self.mmap[:]
+        self.handle.seek(0)
+        return self.handle.read()
+    def line_at(self, offset):
+        """Return line starting at byte 'offset' without its newline, and offset of next line.
+        Return (None, offset) if offset is at end of file."""
+        if self.mmap is not None:
+            if offset >= len(self.mmap): return (None, offset)
+            end = self.mmap.find("\n", offset)
+            if end == -1: return (self.mmap[offset:], len(self.mmap))
+            return (self.mmap[offset:end], end + 1)
+        self.handle.seek(offset)
+        line = self.handle.readline()
+        if not line: return (None, offset)
+        next_offset = offset + len(line)
+        if line.endswith("\n"): line = line[:-1]
+        return (line, next_offset)
+    def lines(self, offset=0):
+        """Return stream of lines from byte 'offset' on, or false if there are none."""
+        line, next_offset = self.line_at(offset)
+        if line is None: return Boolean(False)
+        return Stream(String(line), LineThunk(self, next_offset))
+    def write(self, string):
+        self.handle.write(string)
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.handle.close()
+
+def reopen(name, mode, position):
+    """Return file of name opened in mode, at byte 'position', or closed if position is None.
+    Files being written are cut off at position, so anything written after it is written again the same way."""
+    if position is None:
+        file = File.__new__(File)
+        file.name, file.mode, file.mmap = name, mode, None
+        file.handle = open(os.devnull)
+        file.handle.close()
+        return file
+    if mode == "r":
+        file = File(name, mode)
+    else:
+        file = File.__new__(File)
+        file.name, file.mode, file.mmap = name, mode, None
+        file.handle = open(name, "r+b", BUFFER_SIZE)
+        file.handle.truncate(position)
+    file.handle.seek(position)
+    return file
+
+class LineThunk(Thunk):
+    """Tail of a stream of lines from flines(): the lines from a byte offset in a file on."""
+    __slots__ = ('file', 'offset')
+    def __init__(self, file, offset):
+        Thunk.__init__(self)
+        self.file = file
+        self.offset = offset
+    def compute(self, environment):
+        return self.file.lines(self.offset)
+    def release(self):
+        self.file = None
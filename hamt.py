@@ -0,0 +1,162 @@
+# Persistent hash array mapped trie (HAMT), used by the map value type.
+# A trie is never changed once made. Adding or removing a key gives a new trie,
+# which shares every node not on the path to that key with the old one,
+# so an update copies at most one small node per level: O(log n) time and space.
+#
+# Each node has a 32 bit bitmap of which of its 32 slots are used, and a tuple holding only the used slots.
+# The slot of a key in a node at depth d is given by bits 5d to 5d+4 of its hash.
+# A used slot holds either an entry (hash, key, value) or a node one level deeper.
+# Keys whose 32 bit hashes are equal share a Collision node, searched linearly.
+
+
+BITS = 5 #Bits of hash used per level
+WIDTH = 1 << BITS #Slots per node
+MASK = WIDTH - 1
+HASH_BITS = 32 #Bits of hash used in total, keys with equal hashes end in a Collision
+
+
+def key_hash(key):
+    return hash(key) & 0xFFFFFFFF
+
+def bit_count(n):
+    return bin(n).count("1")
+
+
+class Node(object):
+    """Node of trie. 'entries' has one item per set bit of 'bitmap', in order of the bits."""
+    __slots__ = ('bitmap', 'entries')
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+    def find(self, h, shift, key):
+        """Return entry (hash, key, value) of key, or None."""
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit: return None
+        entry = self.entries[bit_count(self.bitmap & (bit - 1))]
+        if type(entry) is tuple:
+            return entry if entry[0] == h and entry[1] == key else None
+        return entry.find(h, shift + BITS, key)
+    def assoc(self, h, shift, key, value):
+        """Return (node with key set to value, True if key was not in node before)."""
+        bit = 1 << ((h >> shift) & MASK)
+        i = bit_count(self.bitmap & (bit - 1))
+        if not self.bitmap & bit:
+            entries = self.entries[:i] + ((h, key, value),) + self.entries[i:]
+            return (Node(self.bitmap | bit, entries), True)
+        entry = self.entries[i]
+        if type(entry) is tuple:
+            if entry[0] == h and entry[1] == key:
+                if entry[2] is value: return (self, False)
+                new = (h, key, value)
+                added = False
+            else:
+                #Two keys in one slot, so push both down into a new node
+                new = make_node(entry, (h, key, value), shift + BITS)
+                added = True
+        else:
+            new, added = entry.assoc(h, shift + BITS, key, value)
+            if new is entry: return (self, False)
+        return (Node(self.bitmap, self.entries[:i] + (new,) + self.entries[i+1:]), added)
+    def dissoc(self, h, shift, key):
+        """Return node without key, None if that leaves it empty. Return self if key is not in node."""
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit: return self
+        i = bit_count(self.bitmap & (bit - 1))
+        entry = self.entries[i]
+        if type(entry) is tuple:
+            if entry[0] != h or entry[1] != key: return self
+            new = None
+        else:
+            new = entry.dissoc(h, shift + BITS, key)
+            if new is entry: return self
+            #A node left holding one entry is replaced by the entry, so the trie stays shallow
+            if new is not None and new.single() is not None: new = new.single()
+        if new is None:
+            if self.bitmap == bit: return None
+            return Node(self.bitmap & ~bit, self.entries[:i] + self.entries[i+1:])
+        return Node(self.bitmap, self.entries[:i] + (new,) + self.entries[i+1:])
+    def single(self):
+        """Return the only entry of node, if it holds one entry and no nodes, else None."""
+        if len(self.entries) == 1 and type(self.entries[0]) is tuple: return self.entries[0]
+        return None
+    def items(self):
+        for entry in self.entries:
+            if type(entry) is tuple:
+                yield (entry[1], entry[2])
+            else:
+                for item in entry.items(): yield item
+
+class Collision(object):
+    """Node of keys with equal hashes, below the last level of the trie."""
+    __slots__ = ('hash', 'entries')
+    def __init__(self, h, entries):
+        self.hash = h
+        self.entries = entries #Tuple of entries (hash, key, value)
+    def find(self, h, shift, key):
+        for entry in self.entries:
+            if entry[1] == key: return entry
+        return None
+    def assoc(self, h, shift, key, value):
+        for i in range(len(self.entries)):
+            if self.entries[i][1] == key:
+                if self.entries[i][2] is value: return (self, False)
+                return (Collision(h, self.entries[:i] + ((h, key, value),) + self.entries[i+1:]), False)
+        return (Collision(h, self.entries + ((h, key, value),)), True)
+    def dissoc(self, h, shift, key):
+        for i in range(len(self.entries)):
+            if self.entries[i][1] == key:
+                entries = self.entries[:i] + self.entries[i+1:]
+                return Collision(h, entries) if entries else None
+        return self
+    def single(self):
+        return self.entries[0] if len(self.entries) == 1 else None
+    def items(self):
+        for entry in self.entries:
+            yield (entry[1], entry[2])
+
+def make_node(first, second, shift):
+    """Return node holding two entries with different keys, at depth given by 'shift'."""
+    if shift >= HASH_BITS:
+        return Collision(first[0], (first, second))
+    first_slot = (first[0] >> shift) & MASK
+    second_slot = (second[0] >> shift) & MASK
+    if first_slot == second_slot:
+        return Node(1 << first_slot, (make_node(first, second, shift + BITS),))
+    if first_slot > second_slot: first, second = second, first
+    return Node((1 << first_slot) | (1 << second_slot), (first, second))
+
+EMPTY_NODE = Node(0, ())
+
+
+class Hamt(object):
+    """Persistent map of hashable keys to values.
+    assoc() and dissoc() return a new Hamt, leaving this one unchanged."""
+    __slots__ = ('root', 'size')
+    def __init__(self, root=EMPTY_NODE, size=0):
+        self.root = root
+        self.size = size
+    def __len__(self):
+        return self.size
+    def __contains__(self, key):
+        return self.root.find(key_hash(key), 0, key) is not None
+    def __iter__(self):
+        return self.keys()
+    def get(self, key, default=None):
+        entry = self.root.find(key_hash(key), 0, key)
+        return default if entry is None else entry[2]
+    def assoc(self, key, value):
+        """Return map with key set to value."""
+        root, added = self.root.assoc(key_hash(key), 0, key, value)
+        if root is self.root: return self
+        return Hamt(root, self.size + 1 if added else self.size)
+    def dissoc(self, key):
+        """Return map without key. Return self if key is not in map."""
+        root = self.root.dissoc(key_hash(key), 0, key)
+        if root is self.root: return self
+        return Hamt(root if root is not None else EMPTY_NODE, self.size - 1)
+    def items(self):
+        return self.root.items()
+    def keys(self):
+        for key, value in self.root.items(): yield key
+    def values(self):
+        for key, value in self.root.items(): yield value
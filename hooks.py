@@ -0,0 +1,46 @@
+# Hooks, for watching a program as it runs, eg. for debuggers, coverage or metrics.
+# Functions subscribed to an event are called each time it happens, in order of subscription:
+#   on_step(machine, frame)               before each step of a machine, frame is the one about to be stepped
+#   on_call(machine, func, arg_ls)        when a function is called, before its body is run
+#   on_return(machine, frame, result)     when a function returns, before the caller gets the result
+#   on_assign(name, value, environment)   when a variable is assigned
+#   on_import(filename, environment)      before a file is imported
+#   on_builtin(name, arg_ls, environment) before a predefined function is run, with its arguments
+# Hooks are given to a program with its Environment. If it has none, 'environment.hooks' is None,
+# and the evaluator only ever tests that, so a program without hooks runs as if they did not exist.
+# An event nobody has subscribed to is None, and the evaluator tests that before firing it,
+# so events which are not watched cost one more test each.
+
+
+EVENTS = ("on_step", "on_call", "on_return", "on_assign", "on_import", "on_builtin")
+
+
+class Hooks(object):
+    """Functions subscribed to each event. Each event is an attribute holding a list of functions,
+    or None if it has none."""
+    __slots__ = EVENTS
+    def __init__(self):
+        for event in EVENTS:
+            setattr(self, event, None)
+    def subscribe(self, event, func):
+        """Call func on each event of name 'event', eg. "on_step"."""
+        setattr(self, event, (getattr(self, event) or []) + [func])
+    def unsubscribe(self, event, func):
+        funcs = list(getattr(self, event))
+        funcs.remove(func)
+        setattr(self, event, funcs or None)
+    def fire(self, event, *args):
+        for func in getattr(self, event):
+            func(*args)
+
+
+def trace(machine, frame):
+    """on_step hook printing each step of a machine to the program's output:
+    the step number, the expression being reduced, and all variables, indented by depth of scope."""
+    environment = machine.environment
+    #Decide indentation for printing to depict current scope.
+    indent = "  "*environment.get_scope_size()
+    #Create string to print environment
+    env_str = "[" + ", ".join([x[0] + ":" + x[1].to_str() for x in environment.get_dict().items()]) + "]"
+    state_str = frame.expression.to_str() + "\n" + indent + "  | vars: " + env_str
+    environment.io.write(indent + str(machine.i+1) + " | " + state_str + "\n\n")
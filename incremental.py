@@ -0,0 +1,257 @@
+import os
+import sys
+import array
+import hashlib
+import cPickle
+import evaluator
+import tasks
+import hooks as hooks_module
+import fileio
+import checkpoint
+import parallel
+
+# Incremental runs, so a program run again after an edit skips the statements it ran before.
+# Each top-level statement is run on its own, and its result is saved in a cache:
+# the variables it assigned, and the output it printed.
+# The entry is kept with fingerprints of the statement, of every top-level variable it read
+# (or all of them, if it made a closure of the whole top scope), and of every file it imported.
+# When the program is run again, a statement whose entry matches the variables as they are now
+# is not run: its variables are assigned and its output printed again instead. Anything after
+# an edited statement still skips, unless it reads something the edit changed.
+#
+# A statement calling input(), or a file or channel function, is always run, as its result depends on
+# more than its variables. So are statements reading values which cannot be fingerprinted, eg. open files,
+# or assigning values which cannot be saved. Tasks may change variables at any time, so a program
+# which spawns them is run as a whole, as normal. (Tasks spawned by an imported file finish in the import.)
+#
+# The cache is saved to a file beside the program, like a checkpoint (see checkpoint.py).
+
+
+ENTRIES = 4 #Entries kept for each statement, for different values of the variables it reads
+IMPURE = frozenset(["input", "fopen", "fread", "flines", "fwrite", "fclose", "chan", "send", "recv"])
+
+
+class Unfingerprintable(Exception):
+    """Value whose fingerprint does not show all it depends on, eg. an open file."""
+    pass
+
+def digest_file(filename):
+    """Return digest of file's contents, or None if it cannot be read."""
+    try:
+        with open(filename, "rb") as f:
+            return checkpoint.digest(f.read())
+    except IOError:
+        return None
+
+class Fingerprints(object):
+    """Fingerprints of values and syntax nodes, equal only if they are the same in every part.
+    Each object's fingerprint is remembered, so values shared by many variables are only walked once."""
+    def __init__(self):
+        self.memo = {} #id of object: (fingerprint, object), holding the object so its id is not reused
+    def of(self, value):
+        """Return fingerprint of value. Raise Unfingerprintable if it has none."""
+        key = id(value)
+        if key in self.memo:
+            fingerprint = self.memo[key][0]
+            if fingerprint is None: raise Unfingerprintable("value contains itself")
+            return fingerprint
+        self.memo[key] = (None, value)
+        try:
+            fingerprint = hashlib.sha1(self.parts(value)).digest()
+        except RuntimeError:
+            #Nested too deeply
+            del self.memo[key]
+            raise Unfingerprintable("value nested too deeply")
+        except Unfingerprintable:
+            del self.memo[key]
+            raise
+        self.memo[key] = (fingerprint, value)
+        return fingerprint
+    def parts(self, value):
+        """Return string of value's type and parts, with fingerprints of the values it holds."""
+        kind = type(value)
+        if value is None or kind in (bool, int, long, float, str, unicode):
+            return kind.__name__ + ":" + repr(value)
+        if kind in (tuple, list):
+            return kind.__name__ + ":" + "".join([self.of(x) for x in value])
+        if kind is dict:
+            return "dict:" + "".join([repr(k) + self.of(value[k]) for k in sorted(value)])
+        if kind is array.array:
+            return "array:" + value.typecode + value.tostring()
+        if kind.__module__ == "numpy":
+            return "numpy:" + str(value.dtype) + value.tostring()
+        if isinstance(value, (fileio.File, evaluator.Channel)):
+            raise Unfingerprintable(kind.__name__ + " value")
+        names = [name for cls in kind.__mro__ for name in getattr(cls, "__slots__", ()) if name != "__weakref__"]
+        if hasattr(value, "__dict__"): names.extend(sorted(value.__dict__))
+        elif not names: raise Unfingerprintable(kind.__name__ + " value")
+        #Class and each attribute set, unset ones marked so they differ from None
+        return kind.__module__ + "." + kind.__name__ + ":" + "".join(
+            [self.of(getattr(value, name)) if hasattr(value, name) else "-" for name in names])
+
+
+def spawns(node):
+    """Return True if node calls spawn()."""
+    if isinstance(node, evaluator.Execute) and node.name == "spawn": return True
+    return any([spawns(child) for child in parallel.children(node)])
+
+
+class TrackingEnvironment(evaluator.Environment):
+    """Environment noting the top-level variables read by the statement being run, in 'reads'.
+    A variable assigned by the statement before it is read is not noted."""
+    def __init__(self, val=None, io=None, lazy=False, hooks=None):
+        evaluator.Environment.__init__(self, val, io, lazy, hooks)
+        self.reads = None #Names read, or None if not tracking
+        self.written = None #Names assigned at top level
+        self.reads_all = False #True if the whole top scope was read, eg. for a closure
+    def track(self):
+        self.reads = set()
+        self.written = set()
+        self.reads_all = False
+    def read(self, name):
+        if self.reads is None or name in self.written: return
+        #Read from the top-level scope if no function's scope holds it,
+        #or if it is not assigned yet, as it would be read if an edit assigns it
+        if name not in self.local_counts: self.reads.add(name)
+    def get(self, name):
+        self.read(name)
+        return evaluator.Environment.get(self, name)
+    def contains(self, name):
+        self.read(name)
+        return evaluator.Environment.contains(self, name)
+    def put(self, name, value):
+        if self.written is not None and len(self.stack) == 1: self.written.add(name)
+        evaluator.Environment.put(self, name, value)
+    def get_top_scope(self):
+        if len(self.stack) == 1: self.reads_all = True
+        return evaluator.Environment.get_top_scope(self)
+
+class RecordingIO(object):
+    """Program's input and output, recording the output written, so it can be printed again."""
+    def __init__(self, io):
+        self.io = io
+        self.recorded = []
+    def write(self, string):
+        self.recorded.append(string)
+        self.io.write(string)
+    def flush(self):
+        self.io.flush()
+    def readline(self, prompt=""):
+        return self.io.readline(prompt)
+    def take(self):
+        """Return output recorded since last taken."""
+        output = "".join(self.recorded)
+        self.recorded = []
+        return output
+
+
+class Entry(object):
+    """Result of running a statement: the variables it assigned and the output it printed,
+    with fingerprints of the variables and files it read."""
+    __slots__ = ('reads', 'exact', 'imports', 'writes', 'output')
+    def __init__(self, reads, exact, imports, writes, output):
+        self.reads = reads #Name: fingerprint of value read, or None if not assigned
+        self.exact = exact #True if the top scope must hold exactly the names in reads
+        self.imports = imports #Filename: digest of each file imported
+        self.writes = writes #Pickle of dict of names and values assigned
+        self.output = output
+    def matches(self, scope, fingerprints):
+        """Return True if running the statement with top scope 'scope' would give this result."""
+        if self.exact and set(scope) != set(self.reads): return False
+        for name, fingerprint in self.reads.iteritems():
+            try:
+                if (fingerprints.of(scope[name]) if name in scope else None) != fingerprint: return False
+            except Unfingerprintable:
+                return False
+        for filename, file_digest in self.imports.iteritems():
+            if digest_file(filename) != file_digest: return False
+        return True
+
+
+class Cache(object):
+    """Results of a program's top-level statements, saved in file 'path' between runs."""
+    def __init__(self, path):
+        self.path = path
+        self.entries = {} #Fingerprint of statement: list of Entry, most recent first
+        self.skipped = 0 #Statements skipped in the last run
+    def load(self, lazy):
+        """Read entries saved by an earlier run, if any were saved with the same 'lazy'."""
+        try:
+            with open(self.path, "rb") as f:
+                saved_lazy, entries = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError, ValueError, AttributeError, ImportError):
+            return
+        if saved_lazy == lazy: self.entries = entries
+    def save(self, lazy):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                cPickle.dump((lazy, self.entries), f, checkpoint.PROTOCOL)
+            os.rename(temp_path, self.path)
+        except (IOError, OSError) as e:
+            sys.stderr.write("cache not saved: " + str(e) + "\n")
+    def run(self, ast, env):
+        """Run program 'ast' in environment 'env', skipping statements whose result is cached.
+        Return environment the program ran in."""
+        if spawns(ast):
+            #Tasks take turns with the program, and may change its variables at any time,
+            #so its statements cannot be run one at a time
+            return tasks.run(evaluator.Machine(ast, env))
+        self.load(env.lazy)
+        stmts = ast.stmts if isinstance(ast, evaluator.Block) else (ast,)
+        io = RecordingIO(env.io)
+        calls = set() #Names of predefined functions called by the statement being run
+        imports = {}
+        hooks = env.hooks if env.hooks is not None else hooks_module.Hooks()
+        on_builtin = lambda name, arg_ls, environment: calls.add(name)
+        on_import = lambda filename, environment: imports.setdefault(filename, digest_file(filename))
+        hooks.subscribe("on_builtin", on_builtin)
+        hooks.subscribe("on_import", on_import)
+        env = TrackingEnvironment(env.stack[0], io, env.lazy, hooks)
+        scope = env.stack[0]
+        fingerprints = Fingerprints()
+        keys = [fingerprints.of(stmt) for stmt in stmts]
+        #Entries of this program's statements, saved for the next run, so those of removed statements are dropped
+        entries = dict([(key, self.entries.get(key, [])) for key in keys])
+        self.skipped = 0
+        try:
+            for stmt, key in zip(stmts, keys):
+                cached = entries[key]
+                entry = next((x for x in cached if x.matches(scope, fingerprints)), None)
+                if entry is not None:
+                    #Same result as before, so give it without running
+                    scope.update(cPickle.loads(entry.writes))
+                    io.io.write(entry.output)
+                    self.skipped += 1
+                else:
+                    before = dict(scope)
+                    calls.clear()
+                    imports.clear()
+                    env.track()
+                    tasks.run(evaluator.Machine(stmt, env)) #For channels, though no task is spawned
+                    output = io.take()
+                    if not calls & IMPURE:
+                        entry = self.entry(env, before, dict(imports), output, fingerprints)
+                        if entry is not None: cached[:] = ([entry] + cached)[:ENTRIES]
+                    fingerprints = Fingerprints() #Running may have forced thunks read earlier
+                    env.reads = None
+                if env.contains("_return_") and not isinstance(env.get("_return_"), evaluator.Null):
+                    break #Program has returned
+        finally:
+            hooks.unsubscribe("on_builtin", on_builtin)
+            hooks.unsubscribe("on_import", on_import)
+            #Saved even if a statement failed, so those before it are still skipped next time
+            self.entries = entries
+            self.save(env.lazy)
+        return env
+    def entry(self, env, before, imports, output, fingerprints):
+        """Return Entry of statement just run, or None if its result cannot be cached."""
+        writes = dict([(name, value) for name, value in env.stack[0].iteritems()
+                       if name not in before or before[name] is not value])
+        names = before.keys() if env.reads_all else env.reads
+        try:
+            reads = dict([(name, fingerprints.of(before[name]) if name in before else None) for name in names])
+            writes = cPickle.dumps(writes, checkpoint.PROTOCOL)
+        except (Unfingerprintable, cPickle.PicklingError, TypeError, RuntimeError):
+            return None
+        return Entry(reads, env.reads_all, imports, writes, output)
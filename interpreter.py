@@ -1,37 +1,216 @@
+import time
+START = time.time() #When the interpreter started importing its modules, for --startup-report
+import sys
 import lexer
 import parser
 import evaluator
-import sys
+import tasks
+
+# Modules only needed by some options (the translator, checkpoints, hooks, profiling...)
+# and some predefined functions (maps, arrays, files, pmap()) are imported when first used,
+# so a short program starts as quickly as it can.
 
 
 # Functions for interpreting program string and file.
 
 
-def interpret(program):
+def interpret(program, io=None, lazy=False, compiled=False, hooks=None, checkpoints=None, resume=False, cache=None,
+              report=None, ast=None):
     """Interpreter function.
-    Lexer feeds tokens to parser, which feeds object to machine."""
-    lxr = lexer.Lexer(program)
-    prsr = parser.Parser(lxr.lex())
-    env = evaluator.Environment()
-    #Machine is passed an environment, which is a list of two dicts. One holds vars, the other funcs.
-    mach = evaluator.Machine(prsr.run(), env)
-    mach.run()
+    Lexer feeds tokens to parser, which feeds object to machine.
+    'io' is a progio.ProgramIO giving the program's output and input streams;
+    by default these are stdout and stdin.
+    If 'lazy', every function is called by need, ie. arguments are only evaluated when used.
+    If 'compiled', program is translated to python and run by python where possible.
+    'hooks' is a hooks.Hooks of functions to call as the program runs.
+    Hooks need every step, so programs with hooks are never translated.
+    'checkpoints' is a checkpoint.Checkpoints saving the program's state as it runs, and if 'resume',
+    the program continues from its last checkpoint, if there is one. Such programs are never translated.
+    'cache' is an incremental.Cache of results of the program's top-level statements from earlier runs,
+    so statements which would give the same result are not run again. Such programs are never translated
+    or checkpointed.
+    'report' is a StartupReport, marked when the program has been lexed and parsed.
+    'ast' is the program already parsed, if it has been, eg. by prefetch.py.
+    Files the program imports are read and parsed while it runs, see prefetch.py."""
+    env = evaluator.Environment(io=io, lazy=lazy, hooks=hooks)
+    if ast is None:
+        lxr = lexer.Lexer(program)
+        tokens = lxr.lex()
+        if report is not None: report.mark("lex")
+        prsr = parser.Parser(tokens)
+        ast = prsr.run()
+        if report is not None: report.mark("parse")
+        if "import" in program:
+            import prefetch
+            prefetch.start(ast)
+    try:
+        if cache is not None:
+            return cache.run(ast, env)
+        if compiled and not lazy and hooks is None and checkpoints is None:
+            import transpiler
+            try:
+                prog = transpiler.compile_program(ast, program)
+            except transpiler.TranspileError:
+                prog = None #Cannot be translated exactly, so run on machine
+            if prog is not None:
+                try:
+                    return prog.run(env)
+                except transpiler.TranspileError:
+                    pass #Calls nested too deeply for python, before any input or output, so run on machine
+        if checkpoints is not None:
+            import checkpoint
+            checkpoints.digest = checkpoint.digest(program)
+        if resume and checkpoints.exists():
+            scheduler = checkpoints.load(env.io, hooks)
+            env = scheduler.main.environment
+        else:
+            #Machine is passed an environment, which is a list of two dicts. One holds vars, the other funcs.
+            scheduler = tasks.Scheduler(evaluator.Machine(ast, env), checkpoints)
+        scheduler.run() #Runs any tasks the program spawns too
+        if checkpoints is not None: checkpoints.finish()
+    finally:
+        #Write out anything the program printed but which is still buffered
+        env.io.flush()
     return env
 
-def file_interp(file_inp):
+def file_interp(file_inp, io=None, lazy=False, compiled=False, hooks=None, checkpoints=None, resume=False,
+                cache=None, report=None):
     """Interpret a file of name 'file_inp'."""
     with open(file_inp, 'r') as f:
-        return interpret(f.read())
+        program = f.read()
+    if report is not None: report.mark("read file")
+    return interpret(program, io, lazy, compiled, hooks, checkpoints, resume, cache, report)
+
+
+class StartupReport(object):
+    """Time taken by each phase of starting and running a program, printed by --startup-report.
+    Each phase marked takes the time since the one before, starting from 'start'.
+    Python's own start, before the interpreter's modules are imported, is not included."""
+    def __init__(self, start):
+        self.start = start
+        self.last = start
+        self.phases = [] #(name, seconds) of each phase, in order
+        self.stepped = False
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+    def on_step(self, machine, frame):
+        """on_step hook marking the end of the program's first step, when its second begins."""
+        if not self.stepped and machine.i == 1:
+            self.stepped = True
+            self.mark("first step")
+    def summary(self):
+        lines = ["startup report (ms):"]
+        for phase, seconds in self.phases + [("total", self.last - self.start)]:
+            lines.append("  %-12s %8.2f" % (phase, seconds * 1000))
+        return "\n".join(lines) + "\n"
 
 
 # Driver code for entire interpreter.
 # Uses lexer, parser and evaluator to interpret input code.
 
 
-if(len(sys.argv) > 1):
-    file_inp = sys.argv[1]
-else:
-    file_inp = "./test"
+def option_value(options, name):
+    """Return int value of option given as --name=value, or None if not given."""
+    for x in options:
+        if x.startswith("--" + name + "="): return int(x[len(name)+3:])
+    return None
+
+#Options start with "--":
+#  --lazy       call every function by need
+#  --trace      print every step of the machine, with all variables
+#  --compile    translate program to python where possible
+#  --workers=N  number of processes used by pmap(), one per CPU by default
+#  --chunk=N    number of elements pmap() sends to a process at once
+#  --memory     count values and nodes made, and report memory they use at exit,
+#               or when sent SIGUSR2
+#  --profile    sample call stacks while running, write them to <file>.folded for flamegraph tools,
+#               and print the hottest functions. --profile=<path> writes them to path instead.
+#  --checkpoint=N  save the program's state to <file>.checkpoint every N steps, and when sent SIGUSR1.
+#               --checkpoint alone only saves it when sent SIGUSR1.
+#  --resume     continue the program from <file>.checkpoint, if there is one
+#  --incremental  skip top-level statements giving the same result as when last run, cached in <file>.cache
+#  --hashcons   make each number, string, pair and list value only once, so equal ones share memory
+#               and == of pairs and lists is a pointer check
+#  --startup-report  print time taken importing, reading, lexing, parsing, and running the first step
+#               and the rest of the program. The program is run on the machine, to time its first step.
+def main(argv):
+    """Run the interpreter with command line arguments 'argv', ie. file name and options."""
+    report = None
+    if "--startup-report" in argv:
+        report = StartupReport(START)
+        report.mark("imports")
+
+    args = [x for x in argv if not x.startswith("--")]
+    options = [x for x in argv if x.startswith("--")]
+
+    if option_value(options, "workers") is not None or option_value(options, "chunk") is not None:
+        import parallel
+        parallel.configure(option_value(options, "workers"), option_value(options, "chunk"))
+
+    if(len(args) > 0):
+        file_inp = args[0]
+    else:
+        file_inp = "./test"
+
+    if "--hashcons" in options:
+        evaluator.hash_consing()
+
+    hooks = None
+    if "--trace" in options:
+        import hooks as hooks_module
+        hooks = hooks_module.Hooks()
+        hooks.subscribe("on_step", hooks_module.trace)
+
+    if "--memory" in options:
+        import hooks as hooks_module
+        import memstats
+        if hooks is None: hooks = hooks_module.Hooks()
+        memstats.MemoryAccounting().enable(hooks)
+
+    if report is not None:
+        import hooks as hooks_module
+        if hooks is None: hooks = hooks_module.Hooks()
+        hooks.subscribe("on_step", report.on_step)
+
+    checkpoints = None
+    if "--checkpoint" in options or option_value(options, "checkpoint") is not None or "--resume" in options:
+        import checkpoint
+        checkpoints = checkpoint.Checkpoints(file_inp + ".checkpoint", option_value(options, "checkpoint"))
+    resume = "--resume" in options
+
+    cache = None
+    if "--incremental" in options:
+        import incremental
+        cache = incremental.Cache(file_inp + ".cache")
+
+    profile_paths = [x[len("--profile="):] for x in options if x.startswith("--profile=")]
+    try:
+        if "--profile" in options or profile_paths:
+            import profiler
+            prof = profiler.Profiler()
+            prof.start()
+            try:
+                #Profile the machine, so never translate
+                file_interp(file_inp, lazy="--lazy" in options, hooks=hooks, checkpoints=checkpoints, resume=resume,
+                            cache=cache, report=report)
+            finally:
+                prof.stop()
+                with open(profile_paths[0] if profile_paths else file_inp + ".folded", "w") as f:
+                    f.write(prof.folded())
+                sys.stderr.write(prof.summary())
+        else:
+            #Interpret a file as a program
+            file_interp(file_inp, lazy="--lazy" in options, compiled="--compile" in options, hooks=hooks,
+                        checkpoints=checkpoints, resume=resume, cache=cache, report=report)
+    except parser.ParseError as e:
+        #Program, or a file it imports, is not valid
+        print e
+    finally:
+        if report is not None:
+            report.mark("run" if report.stepped else "first step")
+            sys.stderr.write(report.summary())
 
-#Interpret a file as a program
-file_interp(file_inp)
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,5 @@
 import re
-from parser import Token, TokenList, Parser
-from evaluator import Machine
+from parser import Token, TokenList
 from tokens import *
 
 
@@ -9,6 +8,16 @@ from tokens import *
 #-----------------------------------------#
 
 
+#These regexes are compiled once, when the lexer is imported.
+#Comments are anything from // to the end of the line, including nothing (hence * instead of +).
+COMMENT = re.compile('//.*\n')
+#Strings which may become tokens. Strings stop at the first closing quote, so several can be on one line.
+ITEM = re.compile('\w+|[,.:+*/%(){}\[\];-]|[<=>]+|"[^"\r\n]*"')
+DIGIT = re.compile('[0-9]')
+LOWER = re.compile('[a-z]')
+OPERATORS = frozenset("+-*/%") #Items holding these are always one character, see ITEM
+
+
 class Lexer(object):
     """Converts characters into tokens.
     Produces token list for parser."""
@@ -21,44 +30,59 @@ class Lexer(object):
         3. Convert into list of actual tokens, or TokenList().
         4. Append EOF and return.
         """
-        #These regexes defines all comments: (//comment\n).
-        #Anything (.*) can go in comment, including nothing (hence * instead of +).
-        comment_reg = '//.*\n'
         #Split prog around non-comment sections, then join to remove comments.
-        new_inp = "".join(re.split(comment_reg, self.inp))
+        new_inp = "".join(COMMENT.split(self.inp))
         #Separate into list called 'items' of strings which will become tokens
-        items = re.findall('\w+|[,+*/(){}\[\];-]|[<=>]+|"[^\'\r\n]*"', new_inp)
-        tokens = TokenList([self.choose_tok(x) for x in items])
+        items = ITEM.findall(new_inp)
+        #Tokens are never changed, so each distinct item is only converted once
+        known = {}
+        ls = []
+        for x in items:
+            tok = known.get(x)
+            if tok is None:
+                tok = known[x] = self.choose_tok(x)
+            ls.append(tok)
+        tokens = TokenList(ls)
         tokens.ls.append(Token(EOF, "eof")) #no end-of-file in string input
         return tokens
     def choose_tok(self, item):
-        """re.findall() call above separates program into sections.
-        Each section is a possible token. This finds which one it is."""
-        if re.search('"[^\r\n\']*"', item): return Token(STR, item[1: len(item)-1]) #Cut off quot marks
-        elif re.search('if', item): return Token(IF, item)
-        elif re.search('then', item): return Token(THEN, item)
-        elif re.search('else', item): return Token(ELSE, item)
-        elif re.search('while', item): return Token(WHILE, item)
-        elif re.search('return', item): return Token(RETURN, item)
-        elif re.search('function', item): return Token(FUNCTION, item)
-        elif re.search('import', item): return Token(IMPORT, item)
-        elif re.search('pair', item): return Token(PAIR, item)
-        elif re.search('true', item): return Token(BOOL, True)
-        elif re.search('false', item): return Token(BOOL, False)
-        elif re.search('(==|<|>|!=)', item): return Token(COMP, item)
-        elif re.search('\=', item): return Token(ASGN, item)
-        elif re.search('(\+|\-|\*|\/|%)', item): return Token(OP, item)
-        elif re.search('\[', item): return Token(SLPAREN, item)
-        elif re.search('\]', item): return Token(SRPAREN, item)
-        elif re.search('\(', item): return Token(LPAREN, item)
-        elif re.search('\)', item): return Token(RPAREN, item)
-        elif re.search('\{', item): return Token(CLPAREN, item)
-        elif re.search('\}', item): return Token(CRPAREN, item)
-        elif re.search('\;', item): return Token(EOL, item)
-        elif re.search('\,', item): return Token(COMMA, item)
+        """ITEM.findall() call above separates program into sections.
+        Each section is a possible token. This finds which one it is.
+        Keywords are found anywhere in an item, except those which must be the whole item."""
         #Strings are defined as: quote (anything not a quote or newline)* quote
-        elif re.search('[0-9]+', item): return Token(NUM, int(item))
-        elif re.search('[a-z]+', item): return Token(VAR, item)
+        if item[0] == '"': return Token(STR, item[1: len(item)-1]) #Cut off quot marks
+        elif 'if' in item: return Token(IF, item)
+        elif 'then' in item: return Token(THEN, item)
+        elif 'else' in item: return Token(ELSE, item)
+        elif 'while' in item: return Token(WHILE, item)
+        elif 'return' in item: return Token(RETURN, item)
+        elif 'function' in item: return Token(FUNCTION, item)
+        elif 'import' in item: return Token(IMPORT, item)
+        elif 'pair' in item: return Token(PAIR, item)
+        #Must match whole item, so names like stream_head are still variables
+        elif item == 'stream': return Token(STREAM, item)
+        elif item == 'lazy': return Token(LAZY, item)
+        elif item == 'for': return Token(FOR, item)
+        elif item == 'in': return Token(IN, item)
+        elif item == 'record': return Token(RECORD, item)
+        elif item == 'with': return Token(WITH, item)
+        elif 'true' in item: return Token(BOOL, True)
+        elif 'false' in item: return Token(BOOL, False)
+        elif '==' in item or '<' in item or '>' in item or '!=' in item: return Token(COMP, item)
+        elif '=' in item: return Token(ASGN, item)
+        elif item in OPERATORS: return Token(OP, item)
+        elif '[' in item: return Token(SLPAREN, item)
+        elif ']' in item: return Token(SRPAREN, item)
+        elif '(' in item: return Token(LPAREN, item)
+        elif ')' in item: return Token(RPAREN, item)
+        elif '{' in item: return Token(CLPAREN, item)
+        elif '}' in item: return Token(CRPAREN, item)
+        elif ';' in item: return Token(EOL, item)
+        elif ',' in item: return Token(COMMA, item)
+        elif ':' in item: return Token(COLON, item)
+        elif '.' in item: return Token(DOT, item)
+        elif DIGIT.search(item): return Token(NUM, int(item))
+        elif LOWER.search(item): return Token(VAR, item)
         else: raise NameError(item + " is not known")
 
 
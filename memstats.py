@@ -0,0 +1,160 @@
+import gc
+import sys
+import atexit
+import signal
+import resource
+import collections
+
+# Memory accounting.
+# While enabled, every value and node made is counted by class, by wrapping the __new__
+# of each class of the modules in MODULES, imported when it is enabled if not already.
+# This counts objects made by copying too, eg. the deep copies of scopes made for closures.
+# Nothing is wrapped while disabled, so it then costs nothing.
+# A report gives, for each class:
+#   -live objects and their approximate bytes, found by scanning the garbage collector's objects.
+#    Bytes are those of the object and of the python lists, dicts and strings it holds itself.
+#   -objects made since enabled, and per step of the machine.
+# and also the largest bindings in each scope of the environment, counting all they refer to,
+# and the peak of live bytes seen (sampled every SAMPLE_STEPS steps and at each report) and of the process.
+# Interned values (small numbers, booleans, null) count as made each time they are asked for.
+
+
+MODULES = ("evaluator", "hamt", "numarray", "fileio") #Modules whose classes are counted
+SAMPLE_STEPS = 10000 #Steps between samples of live bytes for the peak
+TOP_BINDINGS = 5 #Largest bindings shown per scope
+DUMP_SIGNAL = getattr(signal, "SIGUSR2", None) #Signal to print a report while running
+
+
+def counted_classes():
+    """Return classes with __slots__ of MODULES, other than exceptions.
+    Modules the evaluator only imports when first used are imported now, so their classes are counted."""
+    result = []
+    for name in MODULES:
+        module = __import__(name)
+        for val in vars(module).values():
+            if (isinstance(val, type) and val.__module__ == name and "__slots__" in val.__dict__
+                    and not issubclass(val, BaseException)):
+                result.append(val)
+    return result
+
+def own_size(obj):
+    """Return approximate bytes of object, with python containers and strings in its slots."""
+    size = sys.getsizeof(obj)
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            val = getattr(obj, name, None)
+            if type(val) in (list, dict, tuple, str):
+                size += sys.getsizeof(val)
+    return size
+
+def deep_size(obj, seen):
+    """Return approximate bytes of object and everything it refers to not in 'seen', adding them to seen."""
+    size = 0
+    todo = [obj] #Objects still to count, rather than recursing, as pairs can be nested deeply
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen or isinstance(obj, (type, type(sys))): continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            todo.extend(obj.keys())
+            todo.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            todo.extend(obj)
+        else:
+            for cls in type(obj).__mro__:
+                for name in cls.__dict__.get("__slots__", ()):
+                    if name != "__weakref__": todo.append(getattr(obj, name, None))
+    return size
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024: return "%.1f %s" % (n, unit) if unit != "B" else "%d B" % n
+        n /= 1024.0
+    return "%.1f GiB" % n
+
+
+class MemoryAccounting(object):
+    """Counts values and nodes made, and reports memory used by them.
+    Reports are written to 'out', by dump(), on DUMP_SIGNAL, and at exit."""
+    def __init__(self, out=None):
+        self.out = out if out is not None else sys.stderr
+        self.made = collections.Counter() #Objects made of each class, by name
+        self.steps = 0
+        self.peak = 0 #Most live bytes seen
+        self.environment = None #Environment of latest step
+        self.wrapped = [] #(class, own __new__ or None) of each wrapped class
+        self.enabled = False
+    def enable(self, hooks):
+        """Start counting, and subscribe to steps of the machines given 'hooks'."""
+        for cls in counted_classes():
+            original = cls.__dict__.get("__new__")
+            self.wrapped.append((cls, original))
+            cls.__new__ = self.wrap(cls, original)
+        hooks.subscribe("on_step", self.on_step)
+        self.enabled = True
+        atexit.register(self.at_exit)
+        if DUMP_SIGNAL is not None: signal.signal(DUMP_SIGNAL, lambda signum, frame: self.dump())
+    def wrap(self, cls, original):
+        """Return __new__ for class counting objects made of it, calling its own __new__ if it has one.
+        Copies and unpickled objects are made by __new__ too, so are counted."""
+        made = self.made
+        func = original.__func__ if isinstance(original, staticmethod) else original
+        def __new__(new_cls, *args, **kwargs):
+            if new_cls is cls: made[cls.__name__] += 1
+            if func is not None: return func(new_cls, *args, **kwargs)
+            return object.__new__(new_cls)
+        return staticmethod(__new__)
+    def disable(self):
+        """Stop counting, putting back original methods."""
+        for cls, original in self.wrapped:
+            if original is not None: cls.__new__ = original
+            else: del cls.__new__
+        self.wrapped = []
+        self.enabled = False
+    def on_step(self, machine, frame):
+        self.steps += 1
+        self.environment = machine.environment
+        if self.steps % SAMPLE_STEPS == 0: self.live()
+    def live(self):
+        """Return dict of class name to (live objects, approximate bytes), and update peak."""
+        classes = tuple(counted_classes())
+        result = {}
+        total = 0
+        for obj in gc.get_objects():
+            if isinstance(obj, classes):
+                size = own_size(obj)
+                count, nbytes = result.get(type(obj).__name__, (0, 0))
+                result[type(obj).__name__] = (count + 1, nbytes + size)
+                total += size
+        self.peak = max(self.peak, total)
+        return result
+    def largest_bindings(self):
+        """Return list of lists of (name, bytes) of largest bindings of each scope, from the bottom scope up."""
+        if self.environment is None: return []
+        result = []
+        for scope in self.environment.stack:
+            sizes = [(name, deep_size(val, set())) for name, val in scope.items()]
+            sizes.sort(key=lambda x: -x[1])
+            result.append(sizes[:TOP_BINDINGS])
+        return result
+    def report(self):
+        live = self.live()
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 #KiB on linux
+        lines = ["memory: %d steps, peak live %s, peak process %s" %
+                 (self.steps, format_bytes(self.peak), format_bytes(peak_rss)),
+                 "%-14s %10s %12s %10s %11s" % ("class", "live", "bytes", "made", "made/step")]
+        names = sorted(set(live) | set(self.made), key=lambda x: -live.get(x, (0, 0))[1])
+        for name in names:
+            count, nbytes = live.get(name, (0, 0))
+            made = self.made.get(name, 0)
+            lines.append("%-14s %10d %12s %10d %11.2f" %
+                         (name, count, format_bytes(nbytes), made, float(made) / max(self.steps, 1)))
+        for depth, bindings in enumerate(self.largest_bindings()):
+            lines.append("scope %d: " % depth + ", ".join([name + " " + format_bytes(size) for name, size in bindings]))
+        return "\n".join(lines) + "\n"
+    def dump(self):
+        self.out.write(self.report())
+        self.out.flush()
+    def at_exit(self):
+        if self.enabled: self.dump()
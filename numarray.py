@@ -0,0 +1,111 @@
+import array
+import operator
+import itertools
+from evaluator import Immutable, Number, Boolean, List
+
+# Integer arrays, for the array(), arange(), sum(), min(), max(), dot() and slice() predefined functions.
+# An array holds its elements unboxed in one contiguous buffer, rather than as a List of Number objects,
+# and +, -, *, /, % and comparisons apply to every element at once, in C rather than one step per element.
+# The buffer is a numpy array if numpy is installed, else a python array.array.
+# Elements are signed 64 bit integers. On overflow numpy wraps around, array.array raises OverflowError.
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+TYPECODE = 'l' #Type of array.array elements, C long
+
+
+def make_buffer(values):
+    """Return buffer of ints from iterable."""
+    if numpy is not None:
+        return numpy.fromiter(values, numpy.int64)
+    return array.array(TYPECODE, values)
+
+#Python functions for each operation, as Op and Comp do them on two numbers
+OPS = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.floordiv, "%": operator.mod,
+       "<": operator.lt, ">": operator.gt, "==": operator.eq, "!=": operator.ne}
+
+class Array(Immutable):
+    """Integer array value. Non reducible.
+    Operations give a new array, the buffer is never changed once made."""
+    __slots__ = ('buf',)
+    def __init__(self, buf):
+        self.buf = buf
+    def to_str(self):
+        return "array[" + ",".join([str(x) for x in self.buf]) + "]"
+    def reducible(self):
+        return False
+    def reduce(self, environment):
+        return self
+    def elem(self, index):
+        return Number(int(self.buf[index]))
+    def length(self):
+        return len(self.buf)
+    def setelem(self, index, val):
+        """Return copy of array with element at index changed to val."""
+        buf = self.buf.copy() if numpy is not None else array.array(TYPECODE, self.buf)
+        buf[index] = val.val
+        return Array(buf)
+    def elementwise(self, op, other, reverse=False):
+        """Return array of op applied to each element and the same element of array 'other',
+        or to each element and 'other' if it is a number.
+        If reverse, this array is the second operand. Comparisons give 1 for true and 0 for false."""
+        if isinstance(other, Array):
+            if len(other.buf) != len(self.buf):
+                raise ValueError("arrays of different lengths " + str(len(self.buf)) + " and " + str(len(other.buf)))
+            other = other.buf
+        elif isinstance(other, (Number, Boolean)):
+            other = int(other.val)
+        else:
+            raise TypeError("cannot do " + op + " on array and " + other.to_str())
+        first, second = (other, self.buf) if reverse else (self.buf, other)
+        if op in ("/", "%") and not all_nonzero(second):
+            raise ZeroDivisionError("integer division or modulo by zero")
+        func = OPS[op]
+        if numpy is not None:
+            return Array(numpy.asarray(func(first, second), numpy.int64))
+        if isinstance(first, (int, long)): first = itertools.repeat(first)
+        if isinstance(second, (int, long)): second = itertools.repeat(second)
+        return Array(array.array(TYPECODE, itertools.imap(func, first, second)))
+
+def all_nonzero(divisor):
+    """Return True if divisor, an int or buffer, has no zero."""
+    if isinstance(divisor, (int, long)): return divisor != 0
+    if numpy is not None: return bool(numpy.all(divisor))
+    return 0 not in divisor
+
+def to_array(val):
+    """Return array of list of numbers, or val if already an array."""
+    if isinstance(val, Array): return val
+    return Array(make_buffer([x.val for x in val.ls]))
+
+def arange(start, end):
+    """Return array of ints from start up to but not including end."""
+    if numpy is not None: return Array(numpy.arange(start, end, dtype=numpy.int64))
+    return Array(array.array(TYPECODE, xrange(start, end)))
+
+def total(arr):
+    if numpy is not None: return Number(int(arr.buf.sum()))
+    return Number(sum(arr.buf))
+
+def minimum(arr):
+    if numpy is not None: return Number(int(arr.buf.min()))
+    return Number(min(arr.buf))
+
+def maximum(arr):
+    if numpy is not None: return Number(int(arr.buf.max()))
+    return Number(max(arr.buf))
+
+def dot(first, second):
+    """Return sum of products of elements of two arrays of the same length."""
+    if len(first.buf) != len(second.buf):
+        raise ValueError("arrays of different lengths " + str(len(first.buf)) + " and " + str(len(second.buf)))
+    if numpy is not None: return Number(int(numpy.dot(first.buf, second.buf)))
+    return Number(sum(itertools.imap(operator.mul, first.buf, second.buf)))
+
+def slice_array(arr, start, end):
+    """Return array of elements from index start up to but not including end."""
+    return Array(arr.buf[start:end])
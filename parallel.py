@@ -0,0 +1,178 @@
+import os
+import pickle
+import multiprocessing
+from evaluator import *
+import progio
+
+# Parallel map, for the pmap(f, list) predefined function.
+# If f is pure and everything it uses can be sent to another process,
+# the list is split into chunks, and each chunk is mapped by a worker process of a pool.
+# Results come back in order. Otherwise, or if anything goes wrong in the pool, the list is mapped here.
+# Pure functions give the same results however often they are run, so mapping again here is always safe.
+#
+# A function is pure if it and every function it can call never use print(), input(), flush(),
+# the file functions or import. Names it reads from outside itself are looked up now,
+# as they would be when it is called, and sent to the workers along with it.
+
+
+WORKERS = None #Number of worker processes, None for one per CPU
+CHUNK_SIZE = None #Elements sent to a worker at once, None to give each worker about four chunks
+MIN_ITEMS = 8 #Shorter lists are mapped here, as starting the work costs more than it saves
+PROTOCOL = 2 #Pickle protocol, the first to handle classes with __slots__
+
+#Predefined functions with side effects
+IMPURE = frozenset(["print", "input", "flush", "fopen", "fread", "flines", "fwrite", "fclose",
+                    "spawn", "chan", "send", "recv"])
+
+pool = None #Pool of worker processes, started by the first parallel pmap()
+in_worker = False #True in worker processes, so pmap() in a worker is not run in parallel again
+
+
+def configure(workers=None, chunk_size=None):
+    """Set number of worker processes and chunk size. None leaves a setting unchanged."""
+    global WORKERS, CHUNK_SIZE, pool
+    if workers is not None and workers != WORKERS:
+        WORKERS = workers
+        if pool is not None:
+            pool.terminate()
+            pool = None
+    if chunk_size is not None:
+        CHUNK_SIZE = chunk_size
+
+
+# Purity check ########################################
+
+
+class Impure(Exception):
+    """Value cannot be mapped in another process."""
+    pass
+
+def children(node):
+    """Return all terms directly inside a node, read from its slots."""
+    result = []
+    for cls in type(node).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            val = getattr(node, name, None)
+            if isinstance(val, (list, tuple)):
+                for x in val:
+                    if isinstance(x, tuple): result.extend(x) #Items of MapExpr
+                    else: result.append(x)
+            elif hasattr(val, "reducible"):
+                result.append(val)
+    return result
+
+def assigned(node, result):
+    """Add names assigned in node to result, not counting nested functions."""
+    if isinstance(node, (Assign, For, RecordDecl)): result.add(node.variable.name)
+    if isinstance(node, Function): return result
+    for child in children(node):
+        assigned(child, result)
+    return result
+
+class Shipment(object):
+    """Everything a function needs in a worker.
+    'scope' holds values of names read by the function which are not in its closure,
+    taken from the environment as the function would see them when called here."""
+    def __init__(self, environment):
+        self.environment = environment
+        self.scope = {}
+        self.checked = set() #ids of functions already checked
+    def value(self, val):
+        """Check value can be used in a worker, raise Impure if not."""
+        if isinstance(val, (Number, String, Boolean, Null)): return
+        elif isinstance(val, Pair):
+            self.value(val.car)
+            self.value(val.cdr)
+        elif isinstance(val, List):
+            for x in val.ls: self.value(x)
+        elif isinstance(val, Map):
+            for k, v in val.trie.values(): self.value(v)
+        elif isinstance(val, Record):
+            for x in val.vals: self.value(x)
+        elif isinstance(val, RecordType):
+            return
+        elif isinstance(val, Partial):
+            self.value(val.func)
+            for x in val.args: self.value(x)
+        elif isinstance(val, Function):
+            if id(val) in self.checked: return
+            self.checked.add(id(val))
+            self.body(val.body, set(val.params) | assigned(val.body, set()), val.closure)
+        elif hasattr(val, "elementwise"): #Array of ints
+            return
+        else:
+            raise Impure(val.to_str())
+    def body(self, node, local, closure):
+        """Check terms of function body. 'local' holds names of parameters and variables of function."""
+        if isinstance(node, Import): raise Impure("import")
+        elif isinstance(node, Function):
+            #Closure of inner function is the scope of the function it is in
+            inner = local | set(node.params) | assigned(node.body, set())
+            self.body(node.body, inner, closure)
+            return
+        elif isinstance(node, Execute):
+            if node.name in IMPURE: raise Impure(node.name + "()")
+            if node.name not in PredefFuncs.names: self.name(node.name, local, closure)
+        elif isinstance(node, Variable):
+            self.name(node.name, local, closure)
+        for child in children(node):
+            self.body(child, local, closure)
+    def name(self, name, local, closure):
+        """Check value of name read by function."""
+        if name in local: return
+        elif name in closure:
+            self.value(closure[name])
+        elif name in self.scope:
+            return
+        elif self.environment.contains(name):
+            val = self.environment.get(name)
+            self.scope[name] = val
+            self.value(val)
+        else:
+            raise Impure(name + " is not defined")
+
+
+# Mapping #############################################
+
+
+def run_chunk(payload):
+    """Map function over chunk in a worker process. Payload and result are pickled."""
+    func, scope, chunk, lazy = pickle.loads(payload)
+    with open(os.devnull, "w") as out:
+        env = Environment(scope, progio.ProgramIO(out=out), lazy)
+        return pickle.dumps([call_function(func, [x], env) for x in chunk], PROTOCOL)
+
+def start_worker():
+    global in_worker
+    in_worker = True
+
+def map_serial(func, ls, environment):
+    return List([call_function(func, [x], environment) for x in ls.ls])
+
+def pmap(func, ls, environment):
+    """Return list of func applied to each element of ls, in order.
+    Uses the worker pool if func is pure and the list is long enough."""
+    global pool
+    items = ls.ls
+    if in_worker or len(items) < MIN_ITEMS: return map_serial(func, ls, environment)
+    shipment = Shipment(environment)
+    try:
+        shipment.value(func)
+        for x in items: shipment.value(x)
+        workers = WORKERS or multiprocessing.cpu_count()
+        size = CHUNK_SIZE or max(1, -(-len(items) // (workers * 4)))
+        payloads = [pickle.dumps((func, shipment.scope, items[i:i+size], environment.lazy), PROTOCOL)
+                    for i in range(0, len(items), size)]
+    except (Impure, pickle.PicklingError, TypeError, RuntimeError):
+        #Not pure, or cannot be pickled, eg. nested too deeply
+        return map_serial(func, ls, environment)
+    try:
+        if pool is None: pool = multiprocessing.Pool(workers, start_worker)
+        chunks = pool.map(run_chunk, payloads)
+    except Exception:
+        #Something went wrong in a worker, so map here, which raises the error again if it is the function's
+        return map_serial(func, ls, environment)
+    result = []
+    for chunk in chunks:
+        result.extend(pickle.loads(chunk))
+    return List(result)
@@ -1,6 +1,6 @@
 from evaluator import *
 from tokens import *
-import sys
+import thread
 
 #Parser for program.
 #Generates AST based on semantics, then converts to program for test_interp.
@@ -10,17 +10,19 @@ import sys
 # program = statement EOF
 # ;
 #
-# statement = sequence  //Sequence of two statements.
+# statement = sequence  //Sequence of statements, made into one Block.
 #     | assign          //Assign variable a value.
 #     | donothing       //Null statement - all others reduce to this.
 #     | ifstmt          //If-then-else.
 #     | whilestmt       //While loop.
+#     | forstmt         //For loop over a list, range or array.
 #     | returnstmt      //Return a value in function body.
 #     | execstmt        //Execute a function on its own line.
 #     | importstmt      //Import a file.
+#     | recorddecl      //Declare a record type.
 # ;
 #
-# sequence = [assign|donothing|ifstmt|whilestmt|returnstmt|execstmt] statement
+# sequence = [assign|donothing|ifstmt|whilestmt|forstmt|returnstmt|execstmt] statement
 # ;
 #
 # ifstmt = IF expression THEN CLPAREN statement CRPAREN ELSE CLPAREN statement CRPAREN
@@ -29,6 +31,9 @@ import sys
 # whilestmt = WHILE expression CLPAREN statement CRPAREN
 # ;
 #
+# forstmt = FOR variable IN expression CLPAREN statement CRPAREN
+# ;
+#
 # assign = variable ASGN expression EOL
 # ;
 #
@@ -47,23 +52,31 @@ import sys
 # importstmt = IMPORT STR EOL
 # ;
 #
+# //eg. record Point(x, y);
+# recorddecl = RECORD variable LPAREN VAR {COMMA VAR}* RPAREN EOL
+# ;
+#
 # variable = VAR
 # ;
 #
-# expression = [atom|execute] OP expression
-#     | [atom|execute] COMP expression
+# expression = [atom|execute] {selector}* OP expression
+#     | [atom|execute] {selector}* COMP expression
 #     | LPAREN expression RPAREN
-#     | atom
+#     | [atom|execute] {selector}*
 #     | function
-#     | execute
+# ;
+#
+# //Field of a record (eg. p.x), or copy of a record with fields changed (eg. p with {x: 5})
+# selector = DOT VAR
+#     | WITH CLPAREN VAR COLON expression {COMMA VAR COLON expression}* CRPAREN
 # ;
 #
 # //Execute a function
 # execute = VAR LPAREN {expression {COMMA expression}*}? RPAREN
 # ;
 #
-# //Function definition
-# function = FUNCTION LPAREN {VAR {COMMA VAR}*}? RPAREN CLPAREN statement CRPAREN
+# //Function definition, arguments of a lazy function are only evaluated when used
+# function = {LAZY}? FUNCTION LPAREN {VAR {COMMA VAR}*}? RPAREN CLPAREN statement CRPAREN
 # ;
 #
 # atom = variable
@@ -71,7 +84,9 @@ import sys
 #     | BOOL
 #     | STR
 #     | pair
+#     | stream
 #     | list
+#     | map
 # ;
 #
 # //Define a list
@@ -82,6 +97,14 @@ import sys
 # pair = PAIR SLPAREN expression COMMA expression SRPAREN
 # ;
 #
+# //Define a stream, tail expression is not evaluated until needed
+# stream = STREAM SLPAREN expression COMMA expression SRPAREN
+# ;
+#
+# //Define a map of keys to values
+# map = CLPAREN {expression COLON expression {COMMA expression COLON expression}*}? CRPAREN
+# ;
+#
 
 
 #------------------------------------------#
@@ -89,9 +112,12 @@ import sys
 #------------------------------------------#
 
 
+class ParseError(SyntaxError):
+    """Program is not valid. Message says where."""
+    pass
+
 def error(msg):
-    print "Error at token " + str(token.val) + " : " + msg
-    sys.exit(0)
+    raise ParseError("Error at token " + str(token.val) + " : " + msg)
 
 
 #------------------------------------------#
@@ -105,16 +131,18 @@ class Token(object):
         self.typ = typ
         self.val = val
 
+#State of the program being parsed, held while parsing by 'lock', so programs can be parsed
+#in several threads, eg. imported files read in advance by prefetch.py
 tok_ls = None #List of tokens.
 token = None #Current token checked.
+field_slots = {} #Slot of each field name in the record types declared, None if it differs between them.
+lock = thread.allocate_lock()
 
 class TokenList(object):
     """List of all tokens being parsed, in order."""
     def __init__(self, ls):
-        global token
         self.ls = ls #List of all tokens in program
         self.i = 0 #Index of current token
-        token = self.ls[self.i]
     def getToken(self):
         """Set global 'token' var to next token in ls."""
         global token
@@ -165,34 +193,41 @@ def statement():
         | donothing
         | ifstmt
         | whilestmt
+        | forstmt
         | returnstmt
         | execstmt
         | importstmt
+        | recorddecl
     ;
 
-    sequence = [assign|donothing|ifstmt|whilestmt|returnstmt|execstmt] statement
+    sequence = [assign|donothing|ifstmt|whilestmt|forstmt|returnstmt|execstmt] statement
     ;
 
     execstmt = execute EOL
     ;
     """
-    if tok_ls.found(VAR):
-        if(tok_ls.ls[tok_ls.i+1].typ == LPAREN): #must be execute
-            temp = ExecStmt(execute())
-            tok_ls.consume(EOL)
+    stmts = []
+    while True:
+        if tok_ls.found(VAR):
+            if(tok_ls.ls[tok_ls.i+1].typ == LPAREN): #must be execute
+                temp = ExecStmt(execute())
+                tok_ls.consume(EOL)
+            else:
+                temp = assign()
+        elif tok_ls.found(NULL):  temp = donothing()
+        elif tok_ls.found(IF):    temp = ifstmt()
+        elif tok_ls.found(WHILE): temp = whilestmt()
+        elif tok_ls.found(FOR):   temp = forstmt()
+        elif tok_ls.found(RETURN): temp = returnstmt()
+        elif tok_ls.found(IMPORT): temp = importstmt()
+        elif tok_ls.found(RECORD): temp = recorddecl()
         else:
-            temp = assign()
-    elif tok_ls.found(NULL):  temp = donothing()
-    elif tok_ls.found(IF):    temp = ifstmt()
-    elif tok_ls.found(WHILE): temp = whilestmt()
-    elif tok_ls.found(RETURN): temp = returnstmt()
-    elif tok_ls.found(IMPORT): temp = importstmt()
-    else:
-        error("Expected VAR, NULL or IF but found " + str(token.val))
-
-    if not (tok_ls.found(EOF) or tok_ls.found(CRPAREN)): #Sequence, add next statement as child
-        return Sequence(temp, statement())
-    return temp
+            error("Expected VAR, NULL or IF but found " + str(token.val))
+        stmts.append(temp)
+        if tok_ls.found(EOF) or tok_ls.found(CRPAREN): break
+
+    if len(stmts) > 1: return Block(tuple(stmts)) #Sequence, held in one block
+    return stmts[0]
 
 def ifstmt():
     """
@@ -225,6 +260,44 @@ def whilestmt():
 
     return While(cond, body)
 
+def forstmt():
+    """
+    forstmt = FOR variable IN expression CLPAREN statement CRPAREN
+    ;
+    """
+    tok_ls.consume(FOR)
+    var = variable()
+    tok_ls.consume(IN)
+    seq = expression()
+    tok_ls.consume(CLPAREN)
+    body = statement()
+    tok_ls.consume(CRPAREN)
+
+    return For(var, seq, body)
+
+def recorddecl():
+    """
+    recorddecl = RECORD variable LPAREN VAR {COMMA VAR}* RPAREN EOL
+    ;
+    """
+    global token
+
+    tok_ls.consume(RECORD)
+    var = variable()
+    tok_ls.consume(LPAREN)
+    fields = []
+    while not tok_ls.found(RPAREN):
+        fields.append(token.val)
+        tok_ls.consume(VAR)
+        if tok_ls.found(COMMA): tok_ls.consume(COMMA)
+        else: break
+    tok_ls.consume(RPAREN)
+    tok_ls.consume(EOL)
+    #Resolve slots of fields for field reads and updates after this
+    for i in range(len(fields)):
+        field_slots[fields[i]] = i if field_slots.get(fields[i], i) == i else None
+    return RecordDecl(var, fields)
+
 def assign():
     """
     assign = variable ASGN expression EOL
@@ -300,11 +373,12 @@ def expression():
         result = expression()
         tok_ls.consume(RPAREN)
         return result
-    elif tok_ls.foundOneOf([NUM, BOOL, VAR, PAIR, STR, SLPAREN]):
+    elif tok_ls.foundOneOf([NUM, BOOL, VAR, PAIR, STREAM, STR, SLPAREN, CLPAREN]):
         if tok_ls.found(VAR) and tok_ls.ls[tok_ls.i+1].typ == LPAREN:
             start = execute()
         else:
             start = atom()
+        start = selectors(start)
         if tok_ls.found(OP): #[atom|execute] OP expression
             oper = token.val
             tok_ls.consume(OP)
@@ -315,10 +389,41 @@ def expression():
             return Comp(start, oper, expression())
         else: #atom|execute
             return start
-    elif tok_ls.found(FUNCTION):
+    elif tok_ls.foundOneOf([FUNCTION, LAZY]):
         return function()
     else: error("Expected NUM, BOOL, VAR or LPAREN but found " + token.val)
 
+def selectors(start):
+    """
+    {selector}*
+    selector = DOT VAR
+        | WITH CLPAREN VAR COLON expression {COMMA VAR COLON expression}* CRPAREN
+    ;
+    """
+    global token
+
+    while tok_ls.foundOneOf([DOT, WITH]):
+        if tok_ls.found(DOT):
+            tok_ls.consume(DOT)
+            field = token.val
+            tok_ls.consume(VAR)
+            start = Field(start, field, field_slots.get(field))
+        else:
+            tok_ls.consume(WITH)
+            tok_ls.consume(CLPAREN)
+            fields = []
+            values = []
+            while True:
+                fields.append(token.val)
+                tok_ls.consume(VAR)
+                tok_ls.consume(COLON)
+                values.append(expression())
+                if tok_ls.found(COMMA): tok_ls.consume(COMMA)
+                else: break
+            tok_ls.consume(CRPAREN)
+            start = Update(start, fields, [field_slots.get(x) for x in fields], values)
+    return start
+
 def atom():
     """
     atom = variable
@@ -326,7 +431,9 @@ def atom():
         | NUM
         | STR
         | pair
+        | stream
         | list
+        | map
     ;
     """
     global token
@@ -344,8 +451,12 @@ def atom():
         tok_ls.consume(STR)
     elif tok_ls.found(PAIR):
         atom = pair()
+    elif tok_ls.found(STREAM):
+        atom = stream()
     elif tok_ls.found(SLPAREN):
         atom = listexpr()
+    elif tok_ls.found(CLPAREN):
+        atom = mapexpr()
     return atom
 
 def pair():
@@ -363,6 +474,21 @@ def pair():
     tok_ls.consume(SRPAREN)
     return Pair(car, cdr)
 
+def stream():
+    """
+    stream = STREAM SLPAREN expression COMMA expression SRPAREN
+    ;
+    """
+    global token
+
+    tok_ls.consume(STREAM)
+    tok_ls.consume(SLPAREN)
+    head = expression()
+    tok_ls.consume(COMMA)
+    tail = expression()
+    tok_ls.consume(SRPAREN)
+    return StreamExpr(head, tail)
+
 def listexpr():
     """
     list = SLPAREN {expression {COMMA expression}*}? SRPAREN
@@ -379,6 +505,24 @@ def listexpr():
     tok_ls.consume(SRPAREN)
     return List(args)
 
+def mapexpr():
+    """
+    map = CLPAREN {expression COLON expression {COMMA expression COLON expression}*}? CRPAREN
+    ;
+    """
+    global token
+
+    tok_ls.consume(CLPAREN)
+    items = []
+    while not tok_ls.found(CRPAREN):
+        key = expression()
+        tok_ls.consume(COLON)
+        items.append((key, expression()))
+        if tok_ls.found(COMMA): tok_ls.consume(COMMA)
+        else: break
+    tok_ls.consume(CRPAREN)
+    return MapExpr(items)
+
 def execute():
     """
     execute = variable LPAREN {expression {COMMA expression}*}? RPAREN
@@ -399,11 +543,13 @@ def execute():
 
 def function():
     """
-    function = FUNCTION LPAREN {VAR {COMMA VAR}*}? RPAREN CLPAREN statement CRPAREN
+    function = {LAZY}? FUNCTION LPAREN {VAR {COMMA VAR}*}? RPAREN CLPAREN statement CRPAREN
     ;
     """
     global token
 
+    lazy = tok_ls.found(LAZY)
+    if lazy: tok_ls.consume(LAZY)
     tok_ls.consume(FUNCTION)
     tok_ls.consume(LPAREN)
     args = []
@@ -417,7 +563,7 @@ def function():
     body = statement()
     tok_ls.consume(CRPAREN)
 
-    return Function(args, body)
+    return Function(args, body, lazy)
 
 #------------------------------------------#
 # Parser class definition.##################
@@ -425,13 +571,17 @@ def function():
 
 
 class Parser(object):
-    """Actual parser. Takes list of tokens and creates AST."""
+    """Actual parser. Takes list of tokens and creates AST.
+    Raises ParseError if the program is not valid."""
     def __init__(self, tls):
-        global tok_ls
-        tok_ls = tls
+        self.tls = tls
     def run(self):
-        global tok_ls
-        prog_ast = program() #Abstract Syntax Tree (AST) of program.
+        global tok_ls, token, field_slots
+        with lock:
+            tok_ls = self.tls
+            token = tok_ls.ls[tok_ls.i]
+            field_slots = {}
+            prog_ast = program() #Abstract Syntax Tree (AST) of program.
         return prog_ast
 
 
@@ -0,0 +1,99 @@
+import os
+import threading
+import lexer
+import parser
+import evaluator
+
+# Prefetching of imported files.
+# When a program which imports files is parsed, every file it imports (and every file those import,
+# and so on) is read, lexed and parsed by a pool of threads while the program runs,
+# so the files are read at once rather than one after another as each import is reached,
+# and are usually ready when it is. An import of a file still being read waits for it.
+#
+# A file is read again when imported if it has changed since it was read in advance,
+# or could not be read or parsed then, so errors are given when and as they would be without prefetching.
+# Imports which are never run cost only the reading.
+
+
+THREADS = 8 #Files read at once
+
+files = {} #Filename: Load of file, for every file read in advance
+lock = threading.Lock() #Held while changing files or starting pool
+pool = None #multiprocessing.pool.ThreadPool reading files, started by the first prefetch
+
+
+def signature(filename):
+    """Return (modification time, size, inode) of file, which change if it is written."""
+    stat = os.stat(filename)
+    return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+def parse(program):
+    """Return AST of program."""
+    return parser.Parser(lexer.Lexer(program).lex()).run()
+
+def imported(ast):
+    """Return names of files imported anywhere in ast, in order."""
+    import parallel
+    result = []
+    nodes = [ast]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, evaluator.Import):
+            if node.filename not in result: result.append(node.filename)
+        else:
+            nodes.extend(reversed(parallel.children(node)))
+    return result
+
+
+class Load(object):
+    """Reading and parsing of one file, in a thread of the pool.
+    'ast' is None if it could not be read or parsed."""
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = threading.Event()
+        self.signature = None
+        self.program = None
+        self.ast = None
+    def run(self):
+        try:
+            self.signature = signature(self.filename)
+            with open(self.filename, 'r') as f:
+                self.program = f.read()
+            self.ast = parse(self.program)
+        except Exception:
+            #Read again when imported, giving the error then
+            self.ast = None
+        finally:
+            self.done.set()
+        if self.ast is not None: start(self.ast)
+
+
+def start(ast):
+    """Start reading and parsing the files imported by ast, and by those files in turn, if not started yet."""
+    global pool
+    for filename in imported(ast):
+        with lock:
+            if filename in files: continue
+            load = files[filename] = Load(filename)
+            if pool is None:
+                from multiprocessing.pool import ThreadPool
+                pool = ThreadPool(THREADS)
+        pool.apply_async(load.run)
+
+def load(filename):
+    """Return (text, AST) of file 'filename', to import it.
+    They are those read in advance, waiting for them if need be, unless the file has changed since."""
+    with lock:
+        prefetched = files.get(filename)
+    if prefetched is not None:
+        prefetched.done.wait()
+        try:
+            if prefetched.ast is not None and prefetched.signature == signature(filename):
+                return prefetched.program, prefetched.ast
+        except OSError:
+            pass #Removed since read, so fail reading it below
+    with open(filename, 'r') as f:
+        program = f.read()
+    ast = parse(program)
+    if "import" in program: start(ast)
+    return program, ast
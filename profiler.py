@@ -0,0 +1,134 @@
+import sys
+import time
+import thread
+import threading
+import collections
+import evaluator
+
+# Sampling profiler.
+# A background thread wakes every 'interval' seconds and records the call stack of the running program:
+# the name each function was called by, from the outermost call in. The program itself is not slowed,
+# except by the thread taking its turn, so short functions are not made to look longer than they are.
+# Stacks are read from the Frames of every Machine running in the profiled thread,
+# found through python's own stack, so calls made by predefined functions, eg. stream_map(), are seen too.
+#
+# Each sample also records the call site of every call on the stack: the function it was called from,
+# and the call as written there, eg. fib: fib(n-1), so time spent in a function can be split by where it is called.
+#
+# Output is in the folded stack format read by flamegraph tools (eg. flamegraph.pl):
+# one line per distinct stack, of names separated by ";", then the number of samples of it.
+
+
+INTERVAL = 0.001 #Seconds between samples
+SITE_WIDTH = 60 #Characters of a call shown in the summary
+
+RUN_CODE = evaluator.Machine.run.__func__.__code__ #Code of Machine.run(), on python's stack for every running machine
+
+
+def label(frame):
+    """Return name of function run by frame, as called."""
+    node = frame.node
+    if isinstance(node, evaluator.Execute): return node.name
+    if frame.thunk is not None: return "<argument " + node.name + ">" #Call-by-need argument being evaluated
+    return "<function>" #Function value called by a predefined function
+
+def site(frame, caller):
+    """Return call site of frame: the name of the function it was called from, and the call as parsed."""
+    node = frame.node
+    if isinstance(node, evaluator.Execute) and node.site is not None: node = node.site
+    return (caller, node)
+
+def site_text(site):
+    """Return call site as a string, eg. "fib: fib(n-1)".
+    Copies of a function, eg. in closures, hold copies of its calls, which give the same string."""
+    call = site[1].to_str()
+    if len(call) > SITE_WIDTH: call = call[:SITE_WIDTH - 3] + "..."
+    return site[0] + ": " + call
+
+class Profiler(object):
+    """Samples call stacks of a program running in the thread that calls start()."""
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.samples = collections.Counter() #Number of samples of each stack, a tuple of names
+        self.site_samples = collections.Counter() #Number of samples of each stack of call sites, see site()
+        self.thread_id = None
+        self.running = False
+        self.sampler = None
+    def start(self):
+        self.thread_id = thread.get_ident()
+        self.running = True
+        self.sampler = threading.Thread(target=self.sample_loop, name="profiler")
+        self.sampler.daemon = True
+        self.sampler.start()
+    def stop(self):
+        self.running = False
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+    def sample_loop(self):
+        while self.running:
+            time.sleep(self.interval)
+            self.sample()
+    def sample(self):
+        """Record current call stack of profiled thread, if it is running a machine."""
+        pyframe = sys._current_frames().get(self.thread_id)
+        machines = []
+        while pyframe is not None:
+            if pyframe.f_code is RUN_CODE: machines.append(pyframe.f_locals["self"])
+            pyframe = pyframe.f_back
+        if not machines: return
+        machines.reverse() #Outermost first
+        stack = ["<program>"]
+        sites = []
+        for mach in machines:
+            #First frame of each machine is the program or expression it was given, not a call
+            for frame in list(mach.frames)[1:]:
+                sites.append(site(frame, stack[-1]))
+                stack.append(label(frame))
+        self.samples[tuple(stack)] += 1
+        if sites: self.site_samples[tuple(sites)] += 1
+    def folded(self):
+        """Return samples in folded stack format."""
+        lines = [";".join(stack) + " " + str(count) for stack, count in self.samples.items()]
+        lines.sort()
+        return "".join([line + "\n" for line in lines])
+    def hottest(self, n=10):
+        """Return list of (name, self samples, total samples) of the n functions with most self samples.
+        Self samples are those in which the function was running, total those in which it was on the stack."""
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                total[name] += count
+        return [(name, count, total[name]) for name, count in own.most_common(n)]
+    def hottest_sites(self, n=10):
+        """Return list of (call site, self samples, total samples) of the n call sites with most self samples,
+        each call site as a string, see site_text().
+        Self samples are those in which the call was running, total those in which it was on the stack."""
+        texts = {} #Site: its string, found once for each site
+        own = collections.Counter()
+        total = collections.Counter()
+        for sites, count in self.site_samples.items():
+            for x in sites:
+                if x not in texts: texts[x] = site_text(x)
+            own[texts[sites[-1]]] += count
+            for x in set([texts[x] for x in sites]):
+                total[x] += count
+        #Calls which only called others have no self samples, but are still shown
+        ranked = sorted(total, key=lambda x: (own[x], total[x]), reverse=True)
+        return [(x, own[x], total[x]) for x in ranked[:n]]
+    def summary(self, n=10):
+        """Return table of hottest functions, as a string."""
+        n_samples = sum(self.samples.values())
+        lines = ["%d samples, every %gms" % (n_samples, self.interval * 1000),
+                 "%8s %8s  %s" % ("self%", "total%", "function")]
+        if n_samples == 0: return lines[0] + "\n"
+        for name, own, total in self.hottest(n):
+            lines.append("%7.1f%% %7.1f%%  %s" % (100.0 * own / n_samples, 100.0 * total / n_samples, name))
+        sites = self.hottest_sites(n)
+        if sites:
+            lines.append("%8s %8s  %s" % ("self%", "total%", "call site"))
+            for x, own, total in sites:
+                lines.append("%7.1f%% %7.1f%%  %s" % (100.0 * own / n_samples, 100.0 * total / n_samples, x))
+        return "\n".join(lines) + "\n"
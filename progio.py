@@ -0,0 +1,85 @@
+import os
+import sys
+import collections
+
+# Input and output streams of an interpreted program.
+# Output from print() is gathered in a buffer and written out in large blocks,
+# rather than making a separate write for every call.
+# Input for input() is read in large blocks and split into lines here,
+# rather than blocking on the stream once per line.
+
+
+BUFFER_SIZE = 65536 #Bytes buffered before output is written, and read at once from input
+
+
+def is_tty(stream):
+    """Return True if stream is connected to a terminal."""
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class ProgramIO(object):
+    """Output and input streams of one program, used by print(), input() and flush().
+    Output is block buffered when 'buffered' is True, and written on every call if False.
+    If 'buffered' is not given, output is block buffered unless 'out' is a terminal."""
+    def __init__(self, out=None, inp=None, buffered=None, buffer_size=BUFFER_SIZE):
+        self.out = out if out is not None else sys.stdout
+        self.inp = inp if inp is not None else sys.stdin
+        self.inp_tty = is_tty(self.inp) #Found once, as it cannot change while the program runs
+        if buffered is None:
+            buffered = not is_tty(self.out)
+        self.buffered = buffered
+        self.buffer_size = buffer_size
+        self.pending = [] #Strings written but not yet flushed
+        self.pending_size = 0
+        self.lines = collections.deque() #Lines read but not yet returned by readline()
+        self.partial = "" #Unfinished last line of the most recent block read
+        self.eof = False
+    def write(self, string):
+        """Write string to output, flushing if buffer is full or output is unbuffered."""
+        self.pending.append(string)
+        self.pending_size += len(string)
+        if not self.buffered or self.pending_size >= self.buffer_size:
+            self.flush()
+    def flush(self):
+        """Write all buffered output to the output stream."""
+        if self.pending:
+            self.out.write("".join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+        self.out.flush()
+    def readline(self, prompt=""):
+        """Write prompt, then return next line of input without its newline.
+        Raise EOFError if input is exhausted, like raw_input()."""
+        if prompt: self.write(prompt)
+        while not self.lines:
+            if self.eof:
+                if self.partial:
+                    line, self.partial = self.partial, ""
+                    return line
+                raise EOFError("input() reached end of input")
+            #Whoever writes the input, at a terminal or through a pipe, may wait to see the prompt first,
+            #so show all output before blocking on a read
+            self.flush()
+            self.read_block()
+        return self.lines.popleft()
+    def read_block(self):
+        """Read up to buffer_size bytes of input, and split them into lines."""
+        if self.inp_tty:
+            #Terminal input arrives a line at a time anyway
+            block = self.inp.readline()
+        else:
+            try:
+                #Return whatever is available, rather than waiting to fill a whole block
+                block = os.read(self.inp.fileno(), self.buffer_size)
+            except (AttributeError, ValueError, IOError, OSError):
+                #Not a real file, eg. StringIO
+                block = self.inp.read(self.buffer_size)
+        if not block:
+            self.eof = True
+            return
+        lines = (self.partial + block).split("\n")
+        self.partial = lines.pop()
+        self.lines.extend(lines)
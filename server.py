@@ -0,0 +1,269 @@
+import sys
+import time
+import json
+import socket
+import asyncore
+import asynchat
+import collections
+import lexer
+import parser
+import evaluator
+import tasks
+import prefetch
+
+# Evaluation server: runs programs sent by clients, many at once, in one process and thread.
+# Clients connect over TCP or a unix socket, and send and receive JSON objects, one per line.
+#
+# Requests, each naming a run of the connection by "id":
+#   {"id": 1, "op": "run", "program": "...", "max_steps": N, "max_seconds": S, "lazy": false}
+#   {"id": 1, "op": "input", "line": "..."}    line of input for the run's input() calls
+#   {"id": 1, "op": "cancel"}
+# Events sent back:
+#   {"id": 1, "event": "output", "text": "..."}    output printed by the run, as it is printed
+#   {"id": 1, "event": "input", "prompt": "..."}   run is waiting for a line of input
+#   {"id": 1, "event": "done", "steps": N}
+#   {"id": 1, "event": "error", "message": "..."}  run failed, exceeded a limit, or was cancelled
+#
+# Each run is a tasks.Scheduler, so runs can spawn tasks of their own. Runs ready to go on
+# take turns of SLICE_STEPS steps, and sockets are polled between every turn, so a long run
+# never holds up others. A run waiting for input is parked, like a task waiting on a channel,
+# and costs nothing until its input arrives. Runs stop with an error after 'max_steps' steps,
+# or 'max_seconds' seconds spent running them (not counting time waiting for input).
+#
+# Programs run with the server's own permissions, eg. they can open files,
+# so it listens only on the local machine by default. Programs which import files are refused,
+# as an import runs the whole file at once, holding up every other run, and outside the run's limits.
+#
+# Output which is not UTF-8, eg. from a file read by the program, is sent with such bytes replaced.
+# An error of the server's own while a run takes its turn, eg. failing to send to its client, ends only that run.
+#
+# Usage: python server.py [--port=N] [--host=name] [--unix=path]
+
+
+PORT = 8642 #Default TCP port
+SLICE_STEPS = 1000 #Steps a run takes in one turn
+MAX_STEPS = 10 ** 8 #Default limits of a run
+MAX_SECONDS = 60.0
+POLL_SECONDS = 0.05 #Longest wait for sockets when no run is ready
+
+
+class RunIO(object):
+    """Output and input of a run, used as its progio.ProgramIO.
+    Output is sent to the client when flushed, ie. after every turn of the run.
+    input() with no line received parks the task calling it, until the client sends one."""
+    def __init__(self, run):
+        self.run = run
+        self.pending = [] #Strings written but not yet sent
+        self.lines = collections.deque() #Lines received but not yet read
+        self.waiting = collections.deque() #Machine of task waiting for input
+        self.asked = False #Client has been asked for the line being waited for
+    def write(self, string):
+        self.pending.append(string)
+    def flush(self):
+        if self.pending:
+            self.run.send("output", text="".join(self.pending))
+            self.pending = []
+    def readline(self, prompt=""):
+        if not self.lines:
+            if not self.asked:
+                #Asked only once, as the task's input() call is stepped again when woken
+                self.flush()
+                self.run.send("input", prompt=prompt)
+                self.asked = True
+            raise evaluator.Blocked(self.waiting)
+        self.asked = False
+        return self.lines.popleft()
+    def receive(self, line):
+        self.lines.append(line)
+        if self.waiting: self.run.scheduler.wake(self.waiting.popleft())
+
+
+class Run(object):
+    """One program run for a client."""
+    def __init__(self, connection, run_id, program, max_steps, max_seconds, lazy):
+        self.connection = connection
+        self.id = run_id
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.seconds = 0.0 #Time spent running
+        self.io = RunIO(self)
+        env = evaluator.Environment(io=self.io, lazy=lazy)
+        ast = parser.Parser(lexer.Lexer(program).lex()).run() #Raises parser.ParseError if not valid
+        if prefetch.imported(ast): raise ValueError("programs run by the server cannot import files")
+        self.scheduler = tasks.Scheduler(evaluator.Machine(ast, env))
+    def send(self, event, **fields):
+        fields["id"] = self.id
+        fields["event"] = event
+        self.connection.send_message(fields)
+    def ready(self):
+        return bool(self.scheduler.ready)
+    def step(self):
+        """Take one turn of up to SLICE_STEPS steps. Return True if the run has ended."""
+        scheduler = self.scheduler
+        start_time = time.time()
+        start_steps = scheduler.steps
+        try:
+            while scheduler.ready and scheduler.steps - start_steps < SLICE_STEPS:
+                scheduler.turn()
+        except Exception as e:
+            self.io.flush()
+            self.send("error", message=type(e).__name__ + ": " + str(e))
+            return True
+        finally:
+            self.seconds += time.time() - start_time
+        self.io.flush()
+        if not scheduler.ready:
+            if scheduler.main.finished():
+                self.send("done", steps=scheduler.steps)
+                return True
+            if not self.io.waiting:
+                self.send("error", message="program is waiting on a channel, but no task can use it")
+                return True
+        elif scheduler.steps >= self.max_steps:
+            self.send("error", message="step limit of %d reached" % self.max_steps)
+            return True
+        elif self.seconds >= self.max_seconds:
+            self.send("error", message="time limit of %g seconds reached" % self.max_seconds)
+            return True
+        return False
+
+
+def text(value):
+    """Return value, or unicode of it if it is a string, with any bytes which are not UTF-8 replaced,
+    so it can always be sent as JSON."""
+    return value.decode("utf-8", "replace") if isinstance(value, str) else value
+
+def string(request, name):
+    """Return string field 'name' of request, raising ValueError if it is missing or not a string."""
+    value = request[name]
+    if not isinstance(value, basestring): raise ValueError(name + " must be a string")
+    return value
+
+def number(request, name, default):
+    """Return number field 'name' of request, or default if not given. Raise ValueError if it is not a number,
+    eg. a string, which python would compare as greater than any number, so it would never be reached."""
+    value = request.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, long, float)):
+        raise ValueError(name + " must be a number")
+    return value
+
+
+class Connection(asynchat.async_chat):
+    """Connection to one client, which may have several runs at once."""
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock, map=server.socket_map)
+        self.server = server
+        self.incoming = []
+        self.runs = {} #Runs of this connection, by id
+        self.set_terminator("\n")
+    def collect_incoming_data(self, data):
+        self.incoming.append(data)
+    def found_terminator(self):
+        line = "".join(self.incoming)
+        self.incoming = []
+        if not line.strip(): return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict): raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            self.send_message({"id": None, "event": "error", "message": "bad request: " + str(e)})
+            return
+        try:
+            self.handle_request(request)
+        except Exception as e:
+            #Reported to the client, rather than closing the connection and ending its other runs
+            self.send_message({"id": request.get("id"), "event": "error", "message": "bad request: " + str(e)})
+    def handle_request(self, request):
+        run_id = request.get("id")
+        op = request["op"]
+        if op == "run":
+            if run_id in self.runs: raise ValueError("run %r is already running" % (run_id,))
+            try:
+                run = Run(self, run_id, string(request, "program").encode("utf-8"),
+                          number(request, "max_steps", MAX_STEPS), number(request, "max_seconds", MAX_SECONDS),
+                          request.get("lazy", False))
+            except (SyntaxError, NameError) as e:
+                self.send_message({"id": run_id, "event": "error", "message": str(e)})
+                return
+            self.runs[run_id] = run
+            self.server.start(run)
+        elif op == "input":
+            self.running(run_id).io.receive(string(request, "line").encode("utf-8"))
+        elif op == "cancel":
+            run = self.running(run_id)
+            self.server.end(run)
+            run.send("error", message="cancelled")
+        else:
+            raise ValueError("unknown op " + op)
+    def running(self, run_id):
+        if run_id not in self.runs: raise ValueError("no run %r is running" % (run_id,))
+        return self.runs[run_id]
+    def send_message(self, message):
+        self.push(json.dumps(dict([(name, text(value)) for name, value in message.items()])) + "\n")
+    def handle_close(self):
+        for run in self.runs.values():
+            self.server.end(run)
+        self.close()
+
+
+class Server(asyncore.dispatcher):
+    """Listens for clients, and runs their programs in turn.
+    Listens on TCP 'host' and 'port', or on unix socket 'unix_path' if given."""
+    def __init__(self, host="localhost", port=PORT, unix_path=None):
+        self.socket_map = {}
+        asyncore.dispatcher.__init__(self, map=self.socket_map)
+        if unix_path is not None:
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.bind(unix_path)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+            self.bind((host, port))
+        self.listen(64)
+        self.runs = collections.deque() #Runs not yet ended, in turn order
+        self.serving = False
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None: Connection(pair[0], self)
+    def start(self, run):
+        self.runs.append(run)
+    def end(self, run):
+        if run in self.runs: self.runs.remove(run)
+        run.connection.runs.pop(run.id, None)
+    def serve_once(self):
+        """Poll sockets, then give each ready run one turn."""
+        busy = any([run.ready() for run in self.runs])
+        asyncore.loop(timeout=0 if busy else POLL_SECONDS, map=self.socket_map, count=1)
+        for run in list(self.runs):
+            try:
+                if run.ready() and run.step(): self.end(run)
+            except Exception as e:
+                self.end(run)
+                try:
+                    run.send("error", message="server error: " + type(e).__name__ + ": " + str(e))
+                except Exception:
+                    pass #Sending may be what failed
+    def serve_forever(self):
+        """Serve until stop() is called, then close the listening socket and every connection."""
+        self.serving = True
+        try:
+            while self.serving:
+                self.serve_once()
+        finally:
+            asyncore.close_all(self.socket_map)
+    def stop(self):
+        """Make serve_forever() return, after the turn it is taking. Can be called from another thread."""
+        self.serving = False
+
+
+def option(options, name, default):
+    """Return value of option given as --name=value, or default."""
+    for x in options:
+        if x.startswith("--" + name + "="): return x[len(name)+3:]
+    return default
+
+if __name__ == "__main__":
+    options = [x for x in sys.argv[1:] if x.startswith("--")]
+    server = Server(option(options, "host", "localhost"), int(option(options, "port", PORT)),
+                    option(options, "unix", None))
+    server.serve_forever()
@@ -0,0 +1,57 @@
+import collections
+from evaluator import *
+
+# Scheduler of tasks, for spawn(), send() and recv(). See "Tasks and channels" in evaluator.py.
+# Every task is a Machine. Ready tasks take turns of QUANTUM steps, in order, starting with the program.
+# A task waiting on a channel is parked there and not run again until another task wakes it,
+# so waiting costs nothing, however long it takes.
+# The program ends when it has finished and no task is ready. Tasks still waiting then are dropped,
+# so a stage of a pipeline can loop forever receiving values.
+# If the program is waiting and no task is ready, none ever will be, so RuntimeError is raised.
+
+
+QUANTUM = 100 #Steps a task runs before the next ready task takes its turn
+
+
+class Scheduler(object):
+    """Runs a program's machine, 'main', and the tasks it spawns, in one thread.
+    If 'checkpoints' is a checkpoint.Checkpoints, the state of every machine is saved between turns
+    when it is due, as no machine is then part way through a step."""
+    def __init__(self, main, checkpoints=None):
+        self.main = main
+        self.ready = collections.deque([main]) #Machines of tasks waiting for their turn
+        self.steps = 0 #Steps taken by all machines
+        self.checkpoints = checkpoints
+        main.environment.scheduler = self
+    def spawn(self, func, environment):
+        """Start task calling func with no arguments. It shares the top level variables of environment."""
+        env = Environment(environment.stack[0], environment.io, environment.lazy, environment.hooks)
+        env.scheduler = self
+        self.ready.append(Machine(Apply(func, []), env, False))
+    def wake(self, machine):
+        """Make task parked on a channel ready."""
+        self.ready.append(machine)
+    def turn(self):
+        """Give next ready task its turn, saving a checkpoint first if one is due."""
+        if self.checkpoints is not None and self.checkpoints.due(self.steps): self.checkpoints.save(self)
+        machine = self.ready.popleft()
+        start = machine.i
+        try:
+            machine.run(QUANTUM)
+            if not machine.finished(): self.ready.append(machine)
+        except Blocked as blocked:
+            blocked.waiting.append(machine)
+        self.steps += machine.i - start
+    def run(self):
+        """Run program and tasks until program is finished and no task is ready.
+        Return program's environment."""
+        while self.ready:
+            self.turn()
+        if not self.main.finished():
+            raise RuntimeError("program is waiting on a channel, but no task can use it")
+        return self.main.environment
+
+
+def run(machine, checkpoints=None):
+    """Run machine of a program, with a scheduler for any tasks it spawns. Return environment."""
+    return Scheduler(machine, checkpoints).run()
@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import progio
+import checkpoint
+
+
+RECURSION = """
+f = function(n){ if n == 0 then { return 0; } else { print(n); return n + f(n - 1); } };
+print(f(60));
+m = {"a": 1};
+for i in range(0, 40) { m = put(m, i, pair[i * i, [i]]); print(get(m, i)); }
+print(contains(m, 39));
+"""
+
+TASKS = """
+c = chan(2);
+d = chan(2);
+double = function() {
+  while true { x = recv(c); send(d, x * 2); }
+};
+show = function() {
+  while true { print(recv(d)); }
+};
+spawn(double);
+spawn(show);
+for i in range(0, 60) {
+  send(c, i);
+}
+print("sent");
+"""
+
+class Stop(Exception):
+    """Stops a program just after a checkpoint is saved, as if its process was killed."""
+    pass
+
+class StoppingCheckpoints(checkpoint.Checkpoints):
+    """Checkpoints stopping the program after 'saves' of them are saved."""
+    def __init__(self, path, interval, saves):
+        checkpoint.Checkpoints.__init__(self, path, interval)
+        self.saves = saves
+    def save(self, scheduler):
+        checkpoint.Checkpoints.save(self, scheduler)
+        self.saves -= 1
+        if self.saves == 0: raise Stop()
+
+
+class CheckpointTest(unittest.TestCase):
+    """A program stopped after a checkpoint and resumed prints what it would have printed running once."""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "program.checkpoint")
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    def run_program(self, program, checkpoints=None, resume=False):
+        out = StringIO.StringIO()
+        try:
+            interpreter.interpret(program, progio.ProgramIO(out=out), checkpoints=checkpoints, resume=resume)
+        except Stop:
+            pass
+        return out.getvalue()
+    def check(self, program, interval):
+        whole = self.run_program(program)
+        for saves in (1, 2, 5):
+            before = self.run_program(program, StoppingCheckpoints(self.path, interval, saves))
+            self.assertTrue(os.path.exists(self.path))
+            after = self.run_program(program, checkpoint.Checkpoints(self.path, interval), True)
+            #Output up to the checkpoint is written when it is saved, so none is lost or printed twice
+            self.assertEqual(before + after, whole)
+            self.assertFalse(os.path.exists(self.path)) #Removed when the program finishes
+    def test_recursion(self):
+        self.check(RECURSION, 100)
+    def test_tasks(self):
+        self.check(TASKS, 100)
+    def test_other_program(self):
+        self.run_program(RECURSION, StoppingCheckpoints(self.path, 100, 1))
+        self.assertRaises(ValueError, self.run_program, TASKS, checkpoint.Checkpoints(self.path), True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import hamt
+
+
+class Key(object):
+    """Key with a chosen hash, so keys can share a hash or a slot at any level."""
+    def __init__(self, name, h):
+        self.name = name
+        self.h = h
+    def __hash__(self):
+        return self.h
+    def __eq__(self, other):
+        return isinstance(other, Key) and self.name == other.name
+    def __ne__(self, other):
+        return not self == other
+    def __repr__(self):
+        return "Key(%r, %d)" % (self.name, self.h)
+
+
+class HamtTest(unittest.TestCase):
+    """Random inserts, deletes and lookups give the same results on a Hamt as on a dict."""
+    def check(self, trie, expected):
+        self.assertEqual(len(trie), len(expected))
+        self.assertEqual(sorted(trie.items()), sorted(expected.items()))
+        for key, value in expected.items():
+            self.assertIn(key, trie)
+            self.assertIs(trie.get(key), value)
+    def random_ops(self, keys, ops, seed):
+        rand = random.Random(seed)
+        trie, expected = hamt.Hamt(), {}
+        versions = []
+        for i in range(ops):
+            key = rand.choice(keys)
+            if rand.random() < 0.6:
+                trie, expected[key] = trie.assoc(key, i), i
+            else:
+                old = trie
+                trie = trie.dissoc(key)
+                if key not in expected: self.assertIs(trie, old)
+                expected.pop(key, None)
+            self.assertEqual(trie.get(key, "missing"), expected.get(key, "missing"))
+            if i % 50 == 0: versions.append((trie, dict(expected)))
+        self.check(trie, expected)
+        #Earlier versions are unchanged by later updates
+        for old, old_expected in versions:
+            self.check(old, old_expected)
+        #Removing every key leaves an empty trie
+        for key in list(expected):
+            trie = trie.dissoc(key)
+        self.assertEqual((len(trie), list(trie.items())), (0, []))
+    def test_ints_and_strings(self):
+        keys = range(-300, 300) + ["k" + str(i) for i in range(300)] + [True, False, None, 10 ** 20]
+        self.random_ops(keys, 5000, 1)
+    def test_collisions(self):
+        #Few distinct hashes, differing only in high bits, so keys collide and share deep slots
+        keys = [Key(i, (i % 7) << 27 | 5) for i in range(60)]
+        self.random_ops(keys, 3000, 2)
+    def test_same_value(self):
+        trie = hamt.Hamt().assoc("a", 1)
+        self.assertIs(trie.assoc("a", trie.get("a")), trie)
+        self.assertEqual(trie.get("b"), None)
+
+
+if __name__ == "__main__":
+    unittest.main()
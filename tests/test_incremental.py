@@ -0,0 +1,62 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import progio
+import incremental
+
+
+PROGRAM = """import "%s";
+y = x + 1;
+print(y);
+z = 10;
+print(z * 2);
+"""
+
+class IncrementalTest(unittest.TestCase):
+    """Statements are skipped on a run after an unchanged one, and run again when what they read changes."""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.lib = os.path.join(self.dir, "lib.txt")
+        self.program = PROGRAM % self.lib
+        self.cache = incremental.Cache(os.path.join(self.dir, "main.txt.cache"))
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    def write_lib(self, text):
+        with open(self.lib, "w") as f: f.write(text)
+    def run_program(self, program=None):
+        """Return output of program, and the number of its statements skipped."""
+        out = StringIO.StringIO()
+        interpreter.interpret(program or self.program, progio.ProgramIO(out=out), cache=self.cache)
+        return out.getvalue(), self.cache.skipped
+    def test_unchanged(self):
+        self.write_lib('x = 5; print("lib");')
+        self.assertEqual(self.run_program(), ("lib\n6\n20\n", 0))
+        self.assertEqual(self.run_program(), ("lib\n6\n20\n", 5))
+    def test_imported_file_changed(self):
+        self.write_lib('x = 5; print("lib");')
+        self.run_program()
+        #Different length, so the change is seen even if the modification time is not
+        self.write_lib('x = 41; print("lib, changed");')
+        #Import and the statements reading what it assigned run again, the rest are skipped
+        self.assertEqual(self.run_program(), ("lib, changed\n42\n20\n", 2))
+        self.assertEqual(self.run_program(), ("lib, changed\n42\n20\n", 5))
+    def test_imported_file_removed(self):
+        self.write_lib('x = 5;')
+        self.run_program()
+        os.remove(self.lib)
+        self.assertRaises(IOError, self.run_program)
+    def test_statement_edited(self):
+        self.write_lib('x = 5;')
+        self.run_program()
+        edited = self.program.replace("z = 10;", "z = 11;")
+        self.assertEqual(self.run_program(edited), ("6\n22\n", 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
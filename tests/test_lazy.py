@@ -0,0 +1,40 @@
+import os
+import sys
+import unittest
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import progio
+
+
+ACCUMULATE = """
+f = lazy function(n, acc){ if n == 0 then { return acc; } else { return f(n - 1, acc + 1); } };
+print(f(%d, 0));
+"""
+
+def run(program, lazy=False):
+    """Return output of program."""
+    out = StringIO.StringIO()
+    interpreter.interpret(program, progio.ProgramIO(out=out), lazy=lazy)
+    return out.getvalue()
+
+
+class ThunkChainTest(unittest.TestCase):
+    """Forcing a thunk whose value needs thousands of others, each forced on the machine's own stack."""
+    def test_lazy_function(self):
+        self.assertEqual(run(ACCUMULATE % 3000), "3000\n")
+    def test_lazy_program(self):
+        program = ACCUMULATE.replace("lazy function", "function") % 3000
+        self.assertEqual(run(program, lazy=True), "3000\n")
+    def test_forced_once(self):
+        program = """
+        g = function(x){ print("forced"); return x; };
+        k = lazy function(x){ return x + x; };
+        print(k(g(4)));
+        """
+        self.assertEqual(run(program), "forced\n8\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
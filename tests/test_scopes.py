@@ -0,0 +1,66 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import progio
+
+
+def run(program):
+    """Return output of program."""
+    out = StringIO.StringIO()
+    interpreter.interpret(program, progio.ProgramIO(out=out))
+    return out.getvalue()
+
+
+class ScopeTest(unittest.TestCase):
+    """Names are read from the highest scope holding them, whether or not it is the top-level one."""
+    def test_deep_recursion(self):
+        #Reading the function's own name from every depth must not look through every scope
+        program = "f = function(n){ if n == 0 then { return 0; } else { return 1 + f(n - 1); } }; print(f(20000));"
+        self.assertEqual(run(program), "20000\n")
+    def test_caller_scope(self):
+        program = """
+        g = function(){ return y; };
+        f = function(y){ return g(); };
+        print(f(5));
+        m = function(z){ y = z * 2; return g(); };
+        print(m(4));
+        h = function(n){ if n == 0 then { return y; } else { return h(n - 1); } };
+        k = function(y){ return h(30); };
+        print(k(3));
+        y = 1;
+        print(f(6));
+        print(h(2));
+        """
+        self.assertEqual(run(program), "5\n8\n3\n6\n1\n")
+    def test_lazy_argument_scope(self):
+        program = """
+        g = function(){ return y; };
+        lz = lazy function(a, b){ return a + g(); };
+        w = function(y){ return lz(y * 10, 1); };
+        print(w(6));
+        """
+        self.assertEqual(run(program), "66\n")
+    def test_import_in_function(self):
+        directory = tempfile.mkdtemp()
+        try:
+            lib = os.path.join(directory, "lib.txt")
+            with open(lib, "w") as f: f.write("q = 7;")
+            program = """
+            h = function(n){ if n == 0 then { return q; } else { return h(n - 1); } };
+            k = function(){ import "%s"; return h(20); };
+            print(k());
+            print(contains({}, 1));
+            """ % lib
+            self.assertEqual(run(program), "7\nFalse\n")
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import server
+
+
+class ServerTest(unittest.TestCase):
+    """Runs sent to a server over a socket, and the events they are answered with."""
+    def setUp(self):
+        self.server = server.Server(port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.socket = socket.create_connection(("localhost", self.server.socket.getsockname()[1]), 10)
+        self.lines = self.socket.makefile("r")
+        self.others = [] #Events of other runs, read while waiting for one run's
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        self.lines.close()
+        self.socket.close()
+    def request(self, **fields):
+        self.socket.sendall(json.dumps(fields) + "\n")
+    def events(self, run_id):
+        """Return events of run until it ends, leaving other runs' events in self.others."""
+        result = []
+        while not result or result[-1]["event"] not in ("done", "error"):
+            event = json.loads(self.lines.readline())
+            if event["id"] == run_id: result.append(event)
+            else: self.others.append(event)
+        return result
+
+    def test_run(self):
+        self.request(id=1, op="run", program='print(6 * 7); print("a" + 1);')
+        events = self.events(1)
+        self.assertEqual("".join([x["text"] for x in events if x["event"] == "output"]), "42\na1\n")
+        self.assertEqual(events[-1]["event"], "done")
+    def test_input(self):
+        self.request(id="a", op="run", program='print("hi"); x = input("name? "); print(x + "!");')
+        event = json.loads(self.lines.readline())
+        while event["event"] == "output": event = json.loads(self.lines.readline())
+        self.assertEqual((event["event"], event["prompt"]), ("input", "name? "))
+        self.request(id="a", op="input", line="bob")
+        events = self.events("a")
+        self.assertEqual([x["text"] for x in events if x["event"] == "output"], ["bob!\n"])
+        self.assertEqual(events[-1]["event"], "done")
+    def test_errors(self):
+        self.request(id=1, op="run", program='print(1); x = car(3);')
+        events = self.events(1)
+        self.assertEqual(events[-1]["event"], "error")
+        self.assertIn("car()", events[-1]["message"])
+        self.request(id=2, op="run", program="x = ;")
+        self.assertEqual(self.events(2)[-1]["event"], "error")
+        self.request(id=3, op="run", program=5)
+        self.assertEqual(self.events(3)[-1]["event"], "error")
+        self.request(id=4, op="run", program='import "other.txt";')
+        self.assertIn("import", self.events(4)[-1]["message"])
+        self.request(id=5, op="input", line="x")
+        self.assertEqual(self.events(5)[-1]["event"], "error")
+    def test_failing_run_alone(self):
+        """A run failing while another goes on does not end the other, or the server."""
+        self.request(id="long", op="run", program="s = 0; for i in range(0, 3000) { s = s + i; } print(s);")
+        self.request(id="bad", op="run", program="x = [1] < [2];")
+        self.assertEqual(self.events("bad")[-1]["event"], "error")
+        events = self.others + self.events("long")
+        self.assertEqual([x["text"] for x in events if x["event"] == "output"], ["4498500\n"])
+        self.assertEqual(events[-1]["event"], "done")
+    def test_output_not_utf8(self):
+        handle, path = tempfile.mkstemp()
+        try:
+            os.write(handle, "a\xffb")
+            os.close(handle)
+            self.request(id=1, op="run", program='print(fread(fopen("%s", "r")));' % path)
+            events = self.events(1)
+            self.assertEqual([x["text"] for x in events if x["event"] == "output"], [u"a\ufffdb\n"])
+            self.assertEqual(events[-1]["event"], "done")
+            #Server still answers
+            self.request(id=2, op="run", program="print(1);")
+            self.assertEqual(self.events(2)[-1]["event"], "done")
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
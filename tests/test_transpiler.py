@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import interpreter
+import progio
+import lexer
+import parser
+import transpiler
+
+
+VALID = [
+    """fib = function(n){ if n < 2 then { return n; } else { return fib(n - 1) + fib(n - 2); } };
+    print(fib(15));""",
+    """add = function(a, b){ return a + b; };
+    inc = add(1);
+    print(inc(41)); print(add(1, 2)); print(inc);""",
+    """total = 0;
+    for x in [1, 2, 3, 4] { total = total + x * x; }
+    i = 0;
+    while i < 3 { i = i + 1; print(i); }
+    print(total);""",
+    """p = pair[1, [2, "a"]];
+    print(car(p)); print(cdr(p)); print(setcar(p, 5)); print(setcdr(p, true));
+    print(elem(cdr(p), 1)); print(setelem(cdr(p), 0, 7));""",
+    """print(1 + "a"); print("a" + true); print(7 / 2); print(7 % 3); print(true + 1);
+    print(1 == "1"); print(true == 1); print("b" > "a"); print(5 < "a");""",
+    """print(pair[1, [2]] == pair[1, [2]]); print([true] == [1]); print([1, 2] == [1]);
+    f = function(x){ return x; }; print([f] == [f]);""",
+    """g = function(){ print("side effect"); };
+    print(g() == g());""",
+    """if "" then { print(1); } else { print(2); }
+    x = 2;
+    while x { x = x - 1; print(x); }""",
+]
+
+REJECTED = [
+    'for c in "abc" { print(c); }',
+    'for c in pair[1, 2] { print(c); }',
+    'f = function(x){ return x; }; print(f == f);',
+    'print([3, 1] < [4]);',
+    'print([1] > [1]);',
+    'print(pair[1, 2] < pair[1, 3]);',
+    'if [1, 2] then { print(1); } else { print(2); }',
+    'print("before"); while [1] { print(1); }',
+    'f = function(){ print(1); }; if f() then { print(1); } else { print(2); }',
+    'print(elem("abc", 1));',
+    'print(setelem("abc", 1, 2));',
+    'print(car("ab"));',
+    'print(cdr([1]));',
+    'print(setcar(3, 1));',
+    'print([1] + [2]);',
+    'print(1 / 0);',
+    'print(elem([1, 2], 5));',
+]
+
+def run(program, compiled):
+    """Return output of program, ending with the type and message of any error it raised."""
+    out = StringIO.StringIO()
+    try:
+        interpreter.interpret(program, progio.ProgramIO(out=out), compiled=compiled)
+    except Exception as e:
+        out.write(type(e).__name__ + ": " + str(e))
+    return out.getvalue()
+
+
+class BackendTest(unittest.TestCase):
+    """Programs give the same output, and raise the same errors, compiled as on a Machine."""
+    def check(self, program):
+        #Translated, so the compiled run is not just a Machine again
+        transpiler.compile_program(parser.Parser(lexer.Lexer(program).lex()).run())
+        self.assertEqual(run(program, True), run(program, False), program)
+    def test_valid(self):
+        for program in VALID:
+            self.check(program)
+    def test_rejected(self):
+        for program in REJECTED:
+            self.check(program)
+            self.assertIn("Error: ", run(program, False), program)
+
+
+if __name__ == "__main__":
+    unittest.main()
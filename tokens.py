@@ -29,3 +29,11 @@ STR = 21 #string (difference from var identified by lexer)
 FUNCTION = 22 #used for lambda functions (eg. function(x){return x+1;})
 IMPORT = 23 #import <something>
 PAIR = 24 #used to make pairs (eg. pair[1,2])
+STREAM = 25 #used to make lazy streams (eg. stream[1, f(2)])
+LAZY = 26 #marks a function as call-by-need (eg. lazy function(x){return x;})
+COLON = 27 #separates key and value in map definitions (eg. {"a": 1})
+FOR = 28 #for loop over elements of a sequence (eg. for x in l {...})
+IN = 29 #separates variable and sequence of a for loop
+RECORD = 30 #declares a record type (eg. record Point(x, y);)
+DOT = 31 #field of a record (eg. p.x)
+WITH = 32 #copy of a record with fields changed (eg. p with {x: 5})
@@ -0,0 +1,528 @@
+import sys
+import copy
+import hashlib
+import threading
+from evaluator import *
+
+# Transpiler from the AST made by parser.Parser.run() to python code.
+# Instead of reducing the program step by step, it is translated to python source,
+# compiled once with compile(), and run directly by python.
+#
+# Translation:
+#   -Numbers, booleans, strings and null become python ints, bools, strs and None.
+#   -Pairs become tuples, lists become python lists.
+#   -Top level variables become globals, variables in functions become python locals.
+#   -while, for and if become python while, for and if.
+#   -Functions become nested python functions, wrapped in CompiledFunction for partial application.
+#    Functions which only return functions are flattened into one,
+#    so a call with all arguments is a single python call.
+#   -Predefined functions become python expressions or direct calls.
+#
+# Only programs which give exactly the same results as on a Machine are translated.
+# Functions on a Machine see their closure as it was when defined, and the scopes of their callers.
+# Python functions see enclosing variables as they are now, and never see their callers' variables.
+# So the transpiler checks that every variable a function reads from outside itself
+# is assigned only once, and cannot be hidden by a caller's variable of the same name.
+# Programs failing these checks, or using streams, maps, arrays, records, files, imports or lazy functions,
+# raise TranspileError, and should be run on a Machine instead.
+# Output of the compiled program is the same as on a Machine, except no state is printed for each step.
+# Operations, comparisons, conditions, loops and predefined functions check the types of their values
+# as they run, so values a Machine rejects raise the same TypeError, rather than doing what python would.
+#
+# Each call in a compiled program is a python call, so it is run in a thread with a large stack,
+# and python's recursion limit is raised while it runs. Calls nested more deeply still,
+# before the program has read or written anything, raise TranspileError, so it is run on a Machine,
+# whose depth of calls is only limited by memory.
+
+
+STACK_BYTES = 512 * 1024 * 1024 #Stack of thread running a compiled program, only used as needed
+FRAME_BYTES = 1024 #Stack allowed for each level of python recursion, above the 700 or so one takes
+
+
+class TranspileError(Exception):
+    """Program cannot be translated to python with the same results as on a Machine."""
+    pass
+
+
+# Runtime support for compiled programs. ############
+
+
+class CompiledFunction(object):
+    """Function value of a compiled program.
+    Wraps a python function of 'arity' parameters, with arguments given so far in 'args'.
+    Calls with too few arguments give a partially applied CompiledFunction,
+    calls with too many call the result with the rest, as on a Machine."""
+    __slots__ = ('fn', 'arity', 'nodes', 'args')
+    def __init__(self, fn, arity, nodes, args=()):
+        self.fn = fn
+        self.arity = arity
+        self.nodes = nodes #Function nodes flattened into this one, used for printing
+        self.args = args
+    def __call__(self, *args):
+        if self.args: args = self.args + args
+        if len(args) == self.arity:
+            return self.fn(*args)
+        elif len(args) < self.arity:
+            return CompiledFunction(self.fn, self.arity, self.nodes, args)
+        else:
+            return self.fn(*args[:self.arity])(*args[self.arity:])
+    def value(self):
+        """Return evaluator value of this function, a Function or a Partial of one, with empty closure."""
+        args = self.args
+        for node in self.nodes:
+            if len(args) < len(node.params): break
+            args = args[len(node.params):]
+        func = copy.copy(node)
+        func.closure = {}
+        func.closure_defined = True
+        if args: return Partial(func, [to_value(x) for x in args])
+        return func
+
+class WatchedIO(object):
+    """Program's input and output, noting whether it has been used yet."""
+    def __init__(self, io):
+        self.io = io
+        self.used = False
+    def write(self, string):
+        self.used = True
+        self.io.write(string)
+    def flush(self):
+        self.io.flush()
+    def readline(self, prompt=""):
+        self.used = True
+        return self.io.readline(prompt)
+
+def to_str(val):
+    """Return string of python value, as to_str() of the matching evaluator value."""
+    if val is None: return "Null"
+    elif isinstance(val, bool): return str(val)
+    elif isinstance(val, (int, long)): return str(val)
+    elif isinstance(val, str): return "\"" + val + "\""
+    elif isinstance(val, tuple): return "(" + to_str(val[0]) + ", " + to_str(val[1]) + ")"
+    elif isinstance(val, list): return "[" + ",".join([to_str(x) for x in val]) + "]"
+    else: return val.value().to_str()
+
+def to_value(val):
+    """Return evaluator value of python value."""
+    if val is None: return Null()
+    elif isinstance(val, bool): return Boolean(val)
+    elif isinstance(val, (int, long)): return Number(val)
+    elif isinstance(val, str): return String(val)
+    elif isinstance(val, tuple): return Pair(to_value(val[0]), to_value(val[1]))
+    elif isinstance(val, list): return List([to_value(x) for x in val])
+    else: return val.value()
+
+SCALAR_TYPES = frozenset([int, long, bool, str]) #Python types of evaluator.SCALARS
+COMPARED_TYPES = SCALAR_TYPES | frozenset([type(None), tuple, list]) #Python types of evaluator.COMPARED
+
+def kind(val):
+    """Return python type of value, with ints and longs the same type, as both are Numbers."""
+    return int if type(val) is long else type(val)
+
+def equal_val(first, second):
+    """Return True if python values are equal, as evaluator.equal() is for the matching evaluator values."""
+    todo = [(first, second)]
+    while todo:
+        a, b = todo.pop()
+        if a is b: continue
+        if kind(a) is not kind(b): return False
+        if type(a) is tuple or type(a) is list:
+            if len(a) != len(b): return False
+            todo.extend(zip(a, b))
+        elif type(a) not in SCALAR_TYPES or a != b:
+            return False
+    return True
+
+def operation(op):
+    """Return python function doing operation of string 'op' on two values, as Op.reduce() does.
+    If either value is a string, the other is converted to a string first."""
+    func = get_op(op)
+    def apply_op(a, b):
+        if type(a) is int and type(b) is int: #Most common case first
+            return func(a, b)
+        if type(a) not in SCALAR_TYPES or type(b) not in SCALAR_TYPES:
+            raise TypeError("cannot calculate " + to_str(a) + op + to_str(b))
+        if type(a) is not type(b):
+            if type(a) is str: b = str(b)
+            elif type(b) is str: a = str(a)
+        if type(a) is str: return func(a, b)
+        return int(func(a, b))
+    return apply_op
+
+def comparison(op):
+    """Return python function doing comparison of string 'op' on two values, as Comp.reduce() does.
+    Pairs, lists and null can only be compared with ==."""
+    func = get_op(op)
+    def compare(a, b):
+        if type(a) is int and type(b) is int: #Most common case first
+            return func(a, b)
+        if type(a) in SCALAR_TYPES and type(b) in SCALAR_TYPES:
+            return func(a, b)
+        if op != "==" or type(a) not in COMPARED_TYPES or type(b) not in COMPARED_TYPES:
+            raise TypeError("cannot compare " + to_str(a) + op + to_str(b))
+        return equal_val(a, b)
+    return compare
+
+def condition(val):
+    """Return value of an if or while condition, raising TypeError as If.reduce() does if it is not
+    a number, boolean or string."""
+    if type(val) not in SCALAR_TYPES:
+        raise TypeError("condition " + to_str(val) + " is not a boolean, number or string")
+    return val
+
+def loop_over(val):
+    """Return list a for loop runs over, raising TypeError as For.reduce() does if it is not a list."""
+    if type(val) is not list: raise TypeError("cannot loop over " + to_str(val))
+    return val
+
+def list_of_val(val, name):
+    """Return val if it is a python list, else raise TypeError as sequence_of() does."""
+    if type(val) is not list: raise TypeError("cannot take " + name + "() of " + to_str(val))
+    return val
+
+def pair_of_val(val, name):
+    """Return val if it is a python tuple, ie. a pair, else raise TypeError as pair_of() does."""
+    if type(val) is not tuple: raise TypeError("cannot take " + name + "() of " + to_str(val))
+    return val
+
+def set_elem(ls, index, new_val):
+    """setelem() of python list, returns changed copy."""
+    ls = list(list_of_val(ls, "setelem"))
+    ls[index] = new_val
+    return ls
+
+def print_val(io, val):
+    """print() of python value to program's output."""
+    io.write((val if isinstance(val, str) else to_str(val)) + "\n")
+    return 0
+
+def input_val(io, val):
+    """input() with python value as prompt."""
+    return io.readline(val if isinstance(val, str) else to_str(val))
+
+
+# Analysis of scopes. #############################
+
+
+def statements(stmt):
+    """Return list of statements in a block or sequence, in order."""
+    result = []
+    while isinstance(stmt, Sequence):
+        result.extend(statements(stmt.first))
+        stmt = stmt.second
+    if isinstance(stmt, Block):
+        for x in stmt.stmts: result.extend(statements(x))
+    else:
+        result.append(stmt)
+    return result
+
+def assignments(stmt, counts, in_loop=False):
+    """Count assignments to each name in statement, not counting nested functions.
+    Assignments in loops count twice, since they may run many times."""
+    for s in statements(stmt):
+        if isinstance(s, Assign):
+            counts[s.variable.name] = counts.get(s.variable.name, 0) + (2 if in_loop else 1)
+        elif isinstance(s, If):
+            assignments(s.consequence, counts, in_loop)
+            assignments(s.alternative, counts, in_loop)
+        elif isinstance(s, While):
+            assignments(s.body, counts, True)
+        elif isinstance(s, For):
+            counts[s.variable.name] = counts.get(s.variable.name, 0) + 2
+            assignments(s.body, counts, True)
+    return counts
+
+def children(node):
+    """Return all terms directly inside a node."""
+    if isinstance(node, Sequence): return [node.first, node.second]
+    elif isinstance(node, Block): return list(node.stmts)
+    elif isinstance(node, (Op, Comp)): return [node.first, node.second]
+    elif isinstance(node, Pair): return [node.car, node.cdr]
+    elif isinstance(node, List): return list(node.ls)
+    elif isinstance(node, Execute): return list(node.arg_ls)
+    elif isinstance(node, Assign): return [node.value]
+    elif isinstance(node, If): return [node.condition, node.consequence, node.alternative]
+    elif isinstance(node, While): return [node.condition, node.body]
+    elif isinstance(node, For): return [node.seq, node.body]
+    elif isinstance(node, ExecStmt): return [node.expr]
+    elif isinstance(node, Return): return [node.val]
+    elif isinstance(node, Function): return [node.body]
+    else: return []
+
+def function_locals(node, result):
+    """Add names of all parameters and variables assigned in every function in node to result."""
+    if isinstance(node, Function):
+        result.update(node.params)
+        result.update(assignments(node.body, {}).keys())
+    for child in children(node):
+        function_locals(child, result)
+    return result
+
+class Scope(object):
+    """Names of the top level program, or of one function.
+    'outer_defined' is the set of names surely assigned in the outer scope when the function was defined."""
+    def __init__(self, parent, params, body, outer_defined):
+        self.parent = parent
+        self.params = set(params)
+        self.counts = assignments(body, {})
+        self.outer_defined = outer_defined
+    def has(self, name):
+        return name in self.params or name in self.counts
+    def single(self, name):
+        """Return True if name is given a value only once in this scope."""
+        if name in self.params: return name not in self.counts
+        return self.counts.get(name, 0) == 1
+
+
+# Translation to python source. ###################
+
+
+SUPPORTED_PREDEFS = frozenset(["car", "cdr", "setcar", "setcdr", "print", "input", "flush", "elem", "setelem"])
+
+OPS = {"+": "_add", "-": "_sub", "*": "_mul", "/": "_div", "%": "_mod"}
+COMPS = {"<": "_lt", ">": "_gt", "==": "_eq", "!=": "_ne"}
+CHECKED_CONDITIONS = (Comp, Boolean, Number, String) #Conditions always giving a boolean, number or string
+
+def pyname(name):
+    """Name of python variable for a program variable."""
+    return "v_" + name
+
+class Transpiler(object):
+    """Translates an AST into the source of a python function '_main'.
+    Function nodes used for printing are collected in 'nodes'."""
+    def __init__(self, ast):
+        self.ast = ast
+        self.nodes = []
+        self.lines = []
+        self.n_funcs = 0
+        self.all_function_locals = function_locals(ast, set())
+    def run(self):
+        self.global_scope = Scope(None, [], self.ast, set())
+        self.lines.append("def _main():")
+        if self.global_scope.counts:
+            self.lines.append("    global " + ", ".join([pyname(x) for x in sorted(self.global_scope.counts)] + [pyname("_return_")]))
+        self.block(self.ast, 1, self.global_scope, set())
+        self.lines.append("    return")
+        return "\n".join(self.lines) + "\n"
+
+    # Statements. Each takes set of names surely assigned before it, returns set surely assigned after.
+
+    def block(self, stmt, indent, scope, defined):
+        start = len(self.lines)
+        for s in statements(stmt):
+            defined = self.statement(s, indent, scope, defined)
+        if len(self.lines) == start:
+            self.lines.append("    " * indent + "pass")
+        return defined
+    def statement(self, stmt, indent, scope, defined):
+        pad = "    " * indent
+        if isinstance(stmt, DoNothing):
+            return defined
+        elif isinstance(stmt, Assign):
+            value = self.expr(stmt.value, indent, scope, defined)
+            self.lines.append(pad + pyname(stmt.variable.name) + " = " + value)
+            return defined | set([stmt.variable.name])
+        elif isinstance(stmt, ExecStmt):
+            self.lines.append(pad + self.expr(stmt.expr, indent, scope, defined))
+            return defined
+        elif isinstance(stmt, If):
+            cond = self.condition(stmt.condition, indent, scope, defined)
+            self.lines.append(pad + "if " + cond + ":")
+            then = self.block(stmt.consequence, indent + 1, scope, defined)
+            self.lines.append(pad + "else:")
+            alt = self.block(stmt.alternative, indent + 1, scope, defined)
+            return then & alt
+        elif isinstance(stmt, While):
+            #Body may not run at all, so it assigns nothing surely
+            cond = self.condition(stmt.condition, indent, scope, defined)
+            self.lines.append(pad + "while " + cond + ":")
+            self.block(stmt.body, indent + 1, scope, defined)
+            return defined
+        elif isinstance(stmt, For):
+            #Only lists are translated, as python lists, since range() and arrays are not
+            seq = self.expr(stmt.seq, indent, scope, defined)
+            self.lines.append(pad + "for " + pyname(stmt.variable.name) + " in _loop_over(" + seq + "):")
+            self.block(stmt.body, indent + 1, scope, defined | set([stmt.variable.name]))
+            return defined
+        elif isinstance(stmt, Return):
+            value = self.expr(stmt.val, indent, scope, defined)
+            if scope.parent is None:
+                #Return at top level stops the program, leaving value as _return_
+                self.lines.append(pad + pyname("_return_") + " = " + value)
+                self.lines.append(pad + "return")
+            else:
+                self.lines.append(pad + "return " + value)
+            return defined
+        else:
+            raise TranspileError("cannot translate statement " + stmt.to_str())
+
+    # Expressions. Each returns a python expression, adding any function definitions it needs before it.
+
+    def expr(self, node, indent, scope, defined):
+        if isinstance(node, Boolean): return repr(node.val)
+        elif isinstance(node, Number): return repr(node.val)
+        elif isinstance(node, String): return repr(node.val)
+        elif isinstance(node, Null): return "None"
+        elif isinstance(node, Variable):
+            self.check_read(node.name, scope, defined)
+            return pyname(node.name)
+        elif isinstance(node, Pair):
+            return "(" + self.expr(node.car, indent, scope, defined) + ", " + self.expr(node.cdr, indent, scope, defined) + ")"
+        elif isinstance(node, List):
+            return "[" + ", ".join([self.expr(x, indent, scope, defined) for x in node.ls]) + "]"
+        elif isinstance(node, Op):
+            first = self.expr(node.first, indent, scope, defined)
+            second = self.expr(node.second, indent, scope, defined)
+            return OPS[node.op] + "(" + first + ", " + second + ")"
+        elif isinstance(node, Comp):
+            first = self.expr(node.first, indent, scope, defined)
+            second = self.expr(node.second, indent, scope, defined)
+            checked = COMPS[node.op] + "(" + first + ", " + second + ")"
+            #Variables and literals can be read twice, so comparing ints, the most common case, is done inline
+            operands = (node.first, node.second)
+            if not all([isinstance(x, (Variable,) + SCALARS) for x in operands]): return checked
+            ints = ["type(" + pyname(x.name) + ") is int" for x in operands if isinstance(x, Variable)]
+            if not ints: return checked
+            return "(" + first + " " + node.op + " " + second + " if " + " and ".join(ints) + " else " + checked + ")"
+        elif isinstance(node, Execute):
+            args = [self.expr(x, indent, scope, defined) for x in node.arg_ls]
+            return self.call(node.name, args, scope, defined)
+        elif isinstance(node, Function):
+            return self.function(node, indent, scope, defined)
+        else:
+            raise TranspileError("cannot translate expression " + node.to_str())
+    def condition(self, node, indent, scope, defined):
+        """Return python expression of an if or while condition, checked unless it surely gives a usable value."""
+        cond = self.expr(node, indent, scope, defined)
+        if isinstance(node, CHECKED_CONDITIONS): return cond
+        return "_condition(" + cond + ")"
+    def call(self, name, args, scope, defined):
+        if name in PredefFuncs.names:
+            if name not in SUPPORTED_PREDEFS: raise TranspileError("cannot translate " + name + "()")
+            if name == "car": return "_pair_of(" + args[0] + ", 'car')[0]"
+            elif name == "cdr": return "_pair_of(" + args[0] + ", 'cdr')[1]"
+            elif name == "setcar": return "(" + args[1] + ", _pair_of(" + args[0] + ", 'setcar')[1])"
+            elif name == "setcdr": return "(_pair_of(" + args[0] + ", 'setcdr')[0], " + args[1] + ")"
+            elif name == "elem": return "_list_of(" + args[0] + ", 'elem')[" + args[1] + "]"
+            elif name == "setelem": return "_setelem(" + ", ".join(args) + ")"
+            elif name == "print": return "_print(_io, " + args[0] + ")"
+            elif name == "input": return "_input(_io, " + args[0] + ")"
+            elif name == "flush": return "(_io.flush(), 0)[1]"
+        self.check_read(name, scope, defined)
+        return pyname(name) + "(" + ", ".join(args) + ")"
+    def function(self, node, indent, scope, defined):
+        """Add definition of python function before current statement, return value wrapping it."""
+        if node.lazy: raise TranspileError("cannot translate lazy function")
+        #Flatten functions only returning functions into one function
+        #Functions without parameters run when called with no arguments, so are not flattened
+        params = list(node.params)
+        nodes = [node]
+        body = node.body
+        while (isinstance(body, Return) and isinstance(body.val, Function) and not body.val.lazy
+               and nodes[-1].params and body.val.params):
+            params.extend(body.val.params)
+            nodes.append(body.val)
+            body = body.val.body
+        if len(set(params)) != len(params): raise TranspileError("repeated parameter name")
+        self.n_funcs += 1
+        fname = "_f" + str(self.n_funcs)
+        pad = "    " * indent
+        self.lines.append(pad + "def " + fname + "(" + ", ".join([pyname(x) for x in params]) + "):")
+        func_scope = Scope(scope, params, body, defined)
+        self.block(body, indent + 1, func_scope, set(params))
+        self.lines.append(pad + "    return None") #Functions without return give null
+        self.nodes.append(nodes)
+        return "_Function(" + fname + ", " + str(len(params)) + ", _nodes[" + str(len(self.nodes) - 1) + "])"
+
+    def check_read(self, name, scope, defined):
+        """Check that reading name in scope gives the same value as on a Machine."""
+        if scope.has(name):
+            #Own variable, but before it is assigned a Machine would read a caller's or outer one
+            if scope.parent is not None and name not in defined:
+                raise TranspileError(name + " may be read before it is assigned")
+            return
+        #Variable from outside function. It must be assigned once, so its value is the same
+        #whether read when the function was defined or when it is called.
+        outer_defined = scope.outer_defined
+        outer = scope.parent
+        while outer is not None:
+            if outer.has(name):
+                if not outer.single(name):
+                    raise TranspileError(name + " is assigned more than once and read by a function")
+                if outer.parent is not None and name not in outer_defined:
+                    raise TranspileError(name + " may be assigned after a function reading it is defined")
+                if outer.parent is None and name not in outer_defined and name in self.all_function_locals:
+                    #Not in the function's closure, so a caller's variable could hide it
+                    raise TranspileError(name + " may be hidden by a variable of a calling function")
+                return
+            outer_defined = outer.outer_defined
+            outer = outer.parent
+        raise TranspileError(name + " is not defined in any enclosing scope")
+
+
+# Compiling and running programs. ##################
+
+
+RUNTIME = {"_Function": CompiledFunction, "_setelem": set_elem, "_print": print_val, "_input": input_val,
+           "_condition": condition, "_loop_over": loop_over, "_list_of": list_of_val, "_pair_of": pair_of_val}
+for op, name in OPS.items(): RUNTIME[name] = operation(op)
+for op, name in COMPS.items(): RUNTIME[name] = comparison(op)
+
+_cache = {} #Compiled programs by hash of their source, so each program is only compiled once
+
+class CompiledProgram(object):
+    """Program translated to python and compiled to a code object."""
+    def __init__(self, source, nodes):
+        self.source = source #Python source of program
+        self.code = compile(source, "<transpiled>", "exec")
+        self.nodes = nodes
+    def run(self, environment):
+        """Run program, writing output to environment's io and its variables to the top scope.
+        Raise TranspileError if calls nest too deeply for python before it reads or writes anything."""
+        namespace = dict(RUNTIME)
+        namespace["_nodes"] = self.nodes
+        io = namespace["_io"] = WatchedIO(environment.io)
+        exec self.code in namespace
+        try:
+            run_deep(namespace["_main"])
+        except RuntimeError as e:
+            if io.used or "recursion" not in str(e): raise
+            raise TranspileError("calls nested too deeply to run in python")
+        for name, val in namespace.items():
+            if name.startswith("v_"):
+                environment.put(name[2:], to_value(val))
+        return environment
+
+def run_deep(func):
+    """Call func in a thread with a stack of STACK_BYTES, so it can nest calls deeply.
+    Exceptions it raises are raised again here."""
+    result = []
+    def target():
+        try:
+            func()
+        except BaseException:
+            result.append(sys.exc_info())
+    thread = threading.Thread(target=target)
+    thread.daemon = True #So the process can still exit, eg. when interrupted
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(old_limit, STACK_BYTES // FRAME_BYTES))
+    try:
+        old_size = threading.stack_size(STACK_BYTES) #Stack size is taken when the thread starts
+        try:
+            thread.start()
+        finally:
+            threading.stack_size(old_size)
+        while thread.is_alive(): thread.join(0.1) #Waiting with a timeout, so the main thread can be interrupted
+    finally:
+        sys.setrecursionlimit(old_limit)
+    if result: raise result[0][0], result[0][1], result[0][2]
+
+def compile_program(ast, program=None):
+    """Return CompiledProgram of AST, raising TranspileError if it cannot be translated.
+    If 'program' source string is given, it is used to reuse an earlier compile of the same program."""
+    key = hashlib.sha1(program).hexdigest() if program is not None else None
+    if key is not None and key in _cache: return _cache[key]
+    transpiler = Transpiler(ast)
+    compiled = CompiledProgram(transpiler.run(), transpiler.nodes)
+    if key is not None: _cache[key] = compiled
+    return compiled